@@ -10,3 +10,6 @@ python manage.py collectstatic --noinput
  
 # Apply database migrations 
 python manage.py migrate 
+ 
+# Create the shared cache table (no-op if it exists) 
+python manage.py createcachetable 
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import CreditScore, LoanOffer
+from .models import CreditScore, LoanOffer, TrainingJob
 
 @admin.register(CreditScore)
 class CreditScoreAdmin(admin.ModelAdmin):
@@ -13,4 +13,10 @@ class LoanOfferAdmin(admin.ModelAdmin):
     list_display = ['user', 'amount_offered', 'interest_rate', 'status', 'created_at', 'expires_at']
     list_filter = ['status', 'created_at']
     search_fields = ['user__phone_number']
-    readonly_fields = ['created_at']
\ No newline at end of file
+    readonly_fields = ['created_at']
+
+@admin.register(TrainingJob)
+class TrainingJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'status', 'estimator', 'n_samples', 'progress', 'test_accuracy', 'duration_ms', 'created_at']
+    list_filter = ['status', 'estimator', 'created_at']
+    readonly_fields = ['created_at', 'updated_at', 'finished_at']
\ No newline at end of file
@@ -3,4 +3,8 @@ from django.apps import AppConfig
 class CreditScoringConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'credit_scoring'
-    verbose_name = 'Credit Scoring'
\ No newline at end of file
+    verbose_name = 'Credit Scoring'
+    
+    def ready(self):
+        from .signals import connect_signals
+        connect_signals()
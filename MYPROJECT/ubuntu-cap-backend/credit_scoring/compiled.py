@@ -0,0 +1,274 @@
+"""
+Array-backed form of a trained credit model, evaluated without scikit-learn
+
+compile_model() flattens a fitted boosted tree ensemble and its
+StandardScaler into a handful of node arrays. Scoring one applicant with
+it is a few vectorised array lookups per tree level instead of a
+scikit-learn predict_proba call, most of whose time on a single row goes
+to input validation. On large batches scikit-learn's compiled tree walk
+is faster again, so the evaluator is meant for scoring a few rows.
+
+The scaler is folded into the split thresholds: for every split the
+compiler finds the largest raw feature value that the original
+(scaled, and for GradientBoostingClassifier float32-cast) comparison
+still sends left. Splits therefore go the same way for every finite
+input, and leaf values are added up in the library's order, so the
+probabilities are identical to predict_proba's.
+
+Each node also records the tree's expected output below it, which gives
+per-prediction feature contributions from the same walk.
+"""
+import numpy as np
+from scipy.special import expit
+
+SIGN_BIT = np.uint64(1 << 63)
+
+# Bumped when CompiledModel's arrays change; stored models of another format are recompiled on load
+COMPILED_FORMAT = 2
+
+
+class CompiledModel:
+    """
+    A binary boosted tree ensemble and its scaler flattened into node arrays
+
+    All trees share one set of arrays and roots[t] is the first node of
+    tree t. A split sends a row to left[node] when
+    x[feature[node]] <= threshold[node] and to right[node] otherwise.
+    Leaves point back to themselves, so walking depth levels from every
+    root ends each row on a leaf. Thresholds are in raw feature units and
+    leaf values already include the learning rate. expected[node] is the
+    training-sample weighted mean of the leaf values below node.
+    """
+
+    def __init__(self, feature, threshold, left, right, value, expected, roots, depth, base_score, n_features, source):
+        self.format = COMPILED_FORMAT
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.expected = expected
+        self.roots = roots
+        self.depth = depth
+        self.base_score = base_score
+        self.n_features = n_features
+        self.source = source
+
+    @property
+    def nbytes(self):
+        arrays = (self.feature, self.threshold, self.left, self.right, self.value, self.expected, self.roots)
+        return sum(a.nbytes for a in arrays)
+
+    def decision_function(self, X):
+        """Log-odds of good credit for rows of raw (unscaled, finite) features"""
+        X = self._check(X)
+        # Flat index of row i's first feature, so x[i, f] is X.flat[offset[i] + f]
+        flat = X.ravel()
+        offset = (np.arange(X.shape[0]) * self.n_features)[:, None]
+        nodes = np.broadcast_to(self.roots, (X.shape[0], len(self.roots)))
+        for _ in range(self.depth):
+            go_left = flat[offset + self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+
+        # Add the trees up one after another, in boosting order, as the libraries do
+        outputs = np.empty((X.shape[0], len(self.roots) + 1))
+        outputs[:, 0] = self.base_score
+        outputs[:, 1:] = self.value[nodes]
+        return np.cumsum(outputs, axis=1)[:, -1]
+
+    def predict_proba(self, X):
+        """Probabilities of [poor, good] credit, shaped like predict_proba's"""
+        # The same logistic function as the libraries, so probabilities match to the last bit
+        proba_good = expit(self.decision_function(X))
+        return np.column_stack([1 - proba_good, proba_good])
+
+    def predict_contributions(self, X):
+        """
+        Per-feature log-odds contributions for rows of raw features
+
+        Every split a row passes credits its feature with the change in
+        the tree's expected output from the node to the chosen child
+        (Saabas path attribution). Columns are the features and then the
+        bias, the output expected before any split, so each row sums to
+        decision_function(X), like XGBoost's pred_contribs.
+        """
+        X = self._check(X)
+        n_rows = X.shape[0]
+        flat = X.ravel()
+        offset = (np.arange(n_rows) * self.n_features)[:, None]
+        totals = np.zeros(n_rows * self.n_features)
+        nodes = np.broadcast_to(self.roots, (n_rows, len(self.roots)))
+        for _ in range(self.depth):
+            slots = offset + self.feature[nodes]
+            go_left = flat[slots] <= self.threshold[nodes]
+            children = np.where(go_left, self.left[nodes], self.right[nodes])
+            # Rows already on a leaf stay there and add nothing
+            totals += np.bincount(
+                slots.ravel(), weights=(self.expected[children] - self.expected[nodes]).ravel(),
+                minlength=len(totals)
+            )
+            nodes = children
+
+        contributions = np.empty((n_rows, self.n_features + 1))
+        contributions[:, :-1] = totals.reshape(n_rows, self.n_features)
+        contributions[:, -1] = self.base_score + self.expected[self.roots].sum()
+        return contributions
+
+    def _check(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features:
+            raise ValueError(f"Expected {self.n_features} features, got {X.shape[1]}")
+        return X
+
+
+def compile_model(model, scaler=None):
+    """
+    Compile a fitted binary classifier and the scaler applied before it
+
+    Supports GradientBoostingClassifier and HistGradientBoostingClassifier
+    (without categorical features). Returns None for anything else, such
+    as XGBoost models, which keep using their own predict_proba.
+    """
+    compiler = _COMPILERS.get(type(model).__name__)
+    if compiler is None:
+        return None
+    compiled = compiler(model)
+    if compiled is None:
+        return None
+    trees, base_score, split_dtype = compiled
+
+    n_features = model.n_features_in_
+    mean = np.zeros(n_features)
+    scale = np.ones(n_features)
+    if scaler is not None:
+        if scaler.mean_ is not None:
+            mean = np.asarray(scaler.mean_, dtype=np.float64)
+        if scaler.scale_ is not None:
+            scale = np.asarray(scaler.scale_, dtype=np.float64)
+
+    features, thresholds, lefts, rights, values, expected, roots = [], [], [], [], [], [], []
+    depth = 0
+    start = 0
+    for feature, threshold, left, right, value, count, is_leaf, tree_depth in trees:
+        size = len(feature)
+        node_ids = np.arange(start, start + size)
+        features.append(np.where(is_leaf, 0, feature))
+        thresholds.append(np.where(is_leaf, 0.0, threshold))
+        lefts.append(np.where(is_leaf, node_ids, left + start))
+        rights.append(np.where(is_leaf, node_ids, right + start))
+        values.append(value)
+        expected.append(_expected_values(value, count, left, right, is_leaf))
+        roots.append(start)
+        depth = max(depth, tree_depth)
+        start += size
+
+    feature = np.concatenate(features).astype(np.intp)
+    threshold = np.concatenate(thresholds).astype(np.float64)
+    is_split = ~np.concatenate([tree[6] for tree in trees])
+    threshold[is_split] = _fold_thresholds(
+        threshold[is_split], mean[feature[is_split]], scale[feature[is_split]], split_dtype
+    )
+
+    return CompiledModel(
+        feature=feature,
+        threshold=threshold,
+        left=np.concatenate(lefts).astype(np.intp),
+        right=np.concatenate(rights).astype(np.intp),
+        value=np.concatenate(values).astype(np.float64),
+        expected=np.concatenate(expected),
+        roots=np.asarray(roots, dtype=np.intp),
+        depth=int(depth),
+        base_score=float(base_score),
+        n_features=n_features,
+        source=type(model).__name__,
+    )
+
+
+def _gradient_boosting_trees(model):
+    """Trees of a GradientBoostingClassifier; its trees compare float32 inputs"""
+    if model.estimators_.shape[1] != 1:
+        return None
+    trees = []
+    for estimator in model.estimators_[:, 0]:
+        tree = estimator.tree_
+        is_leaf = tree.children_left == -1
+        trees.append((
+            tree.feature, tree.threshold, tree.children_left, tree.children_right,
+            # predict_stages adds learning_rate * leaf value per tree
+            model.learning_rate * tree.value[:, 0, 0], tree.weighted_n_node_samples, is_leaf, tree.max_depth,
+        ))
+    base_score = model._raw_predict_init(np.zeros((1, model.n_features_in_)))[0, 0]
+    return trees, base_score, np.float32
+
+
+def _hist_gradient_boosting_trees(model):
+    """Trees of a HistGradientBoostingClassifier; its leaf values are already shrunk"""
+    if model.n_trees_per_iteration_ != 1 or model._preprocessor is not None:
+        return None
+    trees = []
+    for (predictor,) in model._predictors:
+        nodes = predictor.nodes
+        if nodes['is_categorical'].any():
+            return None
+        trees.append((
+            nodes['feature_idx'], nodes['num_threshold'], nodes['left'], nodes['right'],
+            nodes['value'], nodes['count'], nodes['is_leaf'].astype(bool), int(nodes['depth'].max()),
+        ))
+    return trees, model._baseline_prediction[0, 0], np.float64
+
+
+_COMPILERS = {
+    'GradientBoostingClassifier': _gradient_boosting_trees,
+    'HistGradientBoostingClassifier': _hist_gradient_boosting_trees,
+}
+
+
+def _expected_values(value, count, left, right, is_leaf):
+    """Training-sample weighted mean leaf value below each node of one tree"""
+    expected = np.where(is_leaf, value, 0.0).astype(np.float64)
+    count = np.asarray(count, dtype=np.float64)
+    # Children are always numbered after their parent, so a reverse pass sees them first
+    for node in np.flatnonzero(~is_leaf)[::-1]:
+        l, r = left[node], right[node]
+        expected[node] = (count[l] * expected[l] + count[r] * expected[r]) / (count[l] + count[r])
+    return expected
+
+
+def _fold_thresholds(threshold, mean, scale, split_dtype):
+    """
+    Raw-unit thresholds T such that x <= T exactly when the scaled x is
+
+    The model compares split_dtype((x - mean) / scale) <= threshold,
+    which is monotone in x, so the values sent left are all floats up to
+    some largest one. That float is found by bisecting over the ordered
+    bit patterns of float64 values: at most 64 steps, all splits at once.
+    """
+    def goes_left(key):
+        x = _from_ordered(key)
+        with np.errstate(over='ignore', invalid='ignore'):
+            return ((x - mean) / scale).astype(split_dtype) <= threshold
+
+    # Invariant: lo goes left, hi goes right
+    lo = np.full(threshold.shape, _to_ordered(np.array(-np.inf)))
+    hi = np.full(threshold.shape, _to_ordered(np.array(np.inf)))
+    while True:
+        open_ = hi - lo > 1
+        if not open_.any():
+            return _from_ordered(lo)
+        mid = lo + (hi - lo) // 2
+        left = goes_left(mid)
+        lo = np.where(open_ & left, mid, lo)
+        hi = np.where(open_ & ~left, mid, hi)
+
+
+def _to_ordered(x):
+    """Map float64 values to uint64 keys that sort in the same order"""
+    bits = np.asarray(x, dtype=np.float64).view(np.uint64)
+    return np.where(bits & SIGN_BIT, ~bits, bits | SIGN_BIT)
+
+
+def _from_ordered(key):
+    bits = np.where(key & SIGN_BIT, key & ~SIGN_BIT, ~key)
+    return bits.view(np.float64)
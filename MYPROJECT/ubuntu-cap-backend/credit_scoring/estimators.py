@@ -0,0 +1,131 @@
+# Settings shared by every backend so their results are comparable
+TRAINING_ESTIMATORS = 100
+MAX_DEPTH = 6
+LEARNING_RATE = 0.1
+RANDOM_STATE = 42
+
+DEFAULT_ESTIMATOR = 'gbm'
+
+class EstimatorBackend:
+    """
+    Builds and fits one kind of boosted tree classifier with predict_proba() for the credit model
+    monitor(stage, model, locals) is called after boosting stages where the library allows it
+    """
+    
+    name = None
+    
+    def build(self):
+        raise NotImplementedError
+    
+    def fit(self, model, X, y, monitor=None):
+        model.fit(X, y)
+        return model
+
+class GradientBoostingBackend(EstimatorBackend):
+    """scikit-learn's exact, single-threaded GradientBoostingClassifier"""
+    
+    name = 'gbm'
+    
+    def build(self):
+        from sklearn.ensemble import GradientBoostingClassifier
+        return GradientBoostingClassifier(
+            n_estimators=TRAINING_ESTIMATORS,
+            learning_rate=LEARNING_RATE,
+            max_depth=MAX_DEPTH,
+            random_state=RANDOM_STATE
+        )
+    
+    def fit(self, model, X, y, monitor=None):
+        model.fit(X, y, monitor=monitor)
+        return model
+
+class HistGradientBoostingBackend(EstimatorBackend):
+    """scikit-learn's binned HistGradientBoostingClassifier, multi-threaded through OpenMP"""
+    
+    name = 'hist'
+    
+    def build(self):
+        from sklearn.ensemble import HistGradientBoostingClassifier
+        return HistGradientBoostingClassifier(
+            max_iter=TRAINING_ESTIMATORS,
+            learning_rate=LEARNING_RATE,
+            max_depth=MAX_DEPTH,
+            early_stopping=False,
+            random_state=RANDOM_STATE
+        )
+    
+    def fit(self, model, X, y, monitor=None):
+        model.fit(X, y)
+        # No per-iteration hook: report the final stage once fitting is done
+        if monitor is not None:
+            monitor(model.n_iter_ - 1, model, {})
+        return model
+
+class XGBoostBackend(EstimatorBackend):
+    """XGBoost with the hist tree method, using all cores"""
+    
+    name = 'xgboost'
+    
+    def build(self):
+        try:
+            from xgboost import XGBClassifier
+        except ImportError:
+            raise ValueError("The xgboost estimator requires the xgboost package")
+        return XGBClassifier(
+            n_estimators=TRAINING_ESTIMATORS,
+            learning_rate=LEARNING_RATE,
+            max_depth=MAX_DEPTH,
+            tree_method='hist',
+            n_jobs=-1,
+            random_state=RANDOM_STATE
+        )
+    
+    def fit(self, model, X, y, monitor=None):
+        if monitor is None:
+            model.fit(X, y)
+            return model
+        
+        from xgboost.callback import TrainingCallback
+        
+        class Monitor(TrainingCallback):
+            def after_iteration(self, booster, epoch, evals_log):
+                return bool(monitor(epoch, model, {}))
+        
+        model.set_params(callbacks=[Monitor()])
+        try:
+            model.fit(X, y)
+        finally:
+            # Keep the callback (and the job it reports to) out of the saved artifact
+            model.set_params(callbacks=None)
+        return model
+
+ESTIMATOR_BACKENDS = {
+    backend.name: backend
+    for backend in [GradientBoostingBackend(), HistGradientBoostingBackend(), XGBoostBackend()]
+}
+
+def get_backend(name):
+    """Backend registered under name; ValueError for unknown names"""
+    try:
+        return ESTIMATOR_BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown estimator '{name}'. Choose from: {', '.join(ESTIMATOR_BACKENDS)}")
+
+def feature_importances(model):
+    """
+    Normalised per-feature importances for any backend's fitted model
+    """
+    import numpy as np
+    
+    importances = getattr(model, 'feature_importances_', None)
+    if importances is not None:
+        return np.asarray(importances)
+    
+    # HistGradientBoostingClassifier has no feature_importances_: sum its split gains over all trees
+    importances = np.zeros(model.n_features_in_)
+    for stage in model._predictors:
+        for predictor in stage:
+            splits = predictor.nodes[~predictor.nodes['is_leaf'].astype(bool)]
+            np.add.at(importances, splits['feature_idx'], splits['gain'])
+    total = importances.sum()
+    return importances / total if total > 0 else importances
@@ -0,0 +1,128 @@
+import statistics
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from sklearn.metrics import roc_auc_score
+from sklearn.preprocessing import StandardScaler
+
+from credit_scoring.compiled import compile_model
+from credit_scoring.estimators import ESTIMATOR_BACKENDS, get_backend
+from credit_scoring.registry import model_registry
+from credit_scoring.synthetic import SyntheticCreditData
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare fit time, predict_proba latency and AUC of the credit model estimator backends, '
+        'and of their compiled forms where they have one'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', type=int, default=50000,
+            help='Synthetic training rows (default: 50000)'
+        )
+        parser.add_argument(
+            '--estimators', default=','.join(ESTIMATOR_BACKENDS),
+            help=f'Comma-separated backends to compare (default: {",".join(ESTIMATOR_BACKENDS)})'
+        )
+        parser.add_argument(
+            '--batch-sizes', default='1,100,10000',
+            help='Comma-separated predict_proba batch sizes (default: 1,100,10000)'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='predict_proba calls timed per batch size; the median is reported (default: 20)'
+        )
+        parser.add_argument(
+            '--label-noise', type=float, default=0.1,
+            help='Share of labels flipped so the synthetic classes overlap and AUC is informative (default: 0.1)'
+        )
+        parser.add_argument(
+            '--seed', type=int, default=42,
+            help='Random seed (default: 42)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            backends = [get_backend(name.strip()) for name in options['estimators'].split(',')]
+            batch_sizes = [int(size) for size in options['batch_sizes'].split(',')]
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options['rows'] < 100 or options['repeat'] < 1 or min(batch_sizes) < 1:
+            raise CommandError('--rows must be at least 100; --repeat and batch sizes must be positive')
+
+        X_train, y_train, X_eval, y_eval = self._datasets(options, max(batch_sizes))
+        scaler = StandardScaler().fit(X_train)
+        X_train_scaled = scaler.transform(X_train)
+        X_eval_scaled = scaler.transform(X_eval)
+        self.stdout.write(f'Training rows: {len(y_train)}, evaluation rows: {len(y_eval)}')
+
+        results = []
+        for backend in backends:
+            model = backend.build()
+            started = time.perf_counter()
+            backend.fit(model, X_train_scaled, y_train)
+            fit_seconds = time.perf_counter() - started
+            results.append(self._evaluate(backend.name, model, fit_seconds, X_eval_scaled, y_eval, batch_sizes, options['repeat']))
+            # The compiled model takes raw features: its timings include scaling
+            compiled = compile_model(model, scaler)
+            if compiled is not None:
+                results.append(self._evaluate(
+                    f'{backend.name} (compiled)', compiled, None, X_eval, y_eval, batch_sizes, options['repeat']
+                ))
+
+        # The model currently served, scored with its own scaler
+        entry = model_registry.get()
+        if entry is not None:
+            results.append(self._evaluate(
+                f'current ({type(entry.model).__name__})', entry.model, None,
+                entry.scaler.transform(X_eval), y_eval, batch_sizes, options['repeat']
+            ))
+            if entry.compiled is not None:
+                results.append(self._evaluate(
+                    'current (compiled)', entry.compiled, None, X_eval, y_eval, batch_sizes, options['repeat']
+                ))
+        else:
+            self.stdout.write(self.style.WARNING('No trained model found; skipping the current model'))
+
+        self._report(results, batch_sizes)
+
+    def _datasets(self, options, max_batch):
+        generator = SyntheticCreditData(seed=options['seed'])
+        rng = np.random.default_rng(options['seed'])
+        X_train, y_train = generator.generate(options['rows'])
+        X_eval, y_eval = generator.generate(max(max_batch, options['rows'] // 4))
+
+        for y in (y_train, y_eval):
+            flip = rng.random(len(y)) < options['label_noise']
+            y[flip] = 1 - y[flip]
+        return X_train, y_train, X_eval, y_eval
+
+    def _evaluate(self, name, model, fit_seconds, X_eval, y_eval, batch_sizes, repeat):
+        auc = roc_auc_score(y_eval, model.predict_proba(X_eval)[:, 1])
+        latencies = {}
+        for size in batch_sizes:
+            batch = X_eval[:size]
+            model.predict_proba(batch)  # warm up
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                model.predict_proba(batch)
+                timings.append(time.perf_counter() - started)
+            latencies[size] = statistics.median(timings) * 1000
+        return {'name': name, 'fit_seconds': fit_seconds, 'auc': auc, 'latencies': latencies}
+
+    def _report(self, results, batch_sizes):
+        header = f'{"estimator":<40} {"fit (s)":>8} {"AUC":>7}' + ''.join(
+            f' {f"p50 @{size} (ms)":>16}' for size in batch_sizes
+        )
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for result in results:
+            fit = f'{result["fit_seconds"]:.2f}' if result['fit_seconds'] is not None else '-'
+            line = f'{result["name"]:<40} {fit:>8} {result["auc"]:>7.4f}' + ''.join(
+                f' {result["latencies"][size]:>16.3f}' for size in batch_sizes
+            )
+            self.stdout.write(line)
@@ -0,0 +1,86 @@
+import os
+
+import joblib
+from django.core.management.base import BaseCommand, CommandError
+
+from credit_scoring.registry import model_registry
+from credit_scoring.score_cache import score_cache
+from credit_scoring.services import FEATURE_NAMES
+
+
+class Command(BaseCommand):
+    help = 'List, promote, import and prune stored credit model versions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--promote', metavar='VERSION',
+            help='Serve VERSION from now on (also used to roll back)'
+        )
+        parser.add_argument(
+            '--import-legacy', action='store_true',
+            help='Store credit_model.pkl and scaler.pkl from the model directory as a version and promote it'
+        )
+        parser.add_argument(
+            '--prune', type=int, metavar='KEEP',
+            help='Remove all but the KEEP newest versions (the promoted version is always kept)'
+        )
+
+    def handle(self, *args, **options):
+        store = model_registry.store
+
+        if options['import_legacy']:
+            self._import_legacy(store)
+        if options['promote']:
+            try:
+                store.promote(options['promote'])
+            except ValueError as e:
+                raise CommandError(str(e))
+            score_cache.invalidate_all()
+            self.stdout.write(self.style.SUCCESS(f"Promoted {options['promote']}"))
+        if options['prune'] is not None:
+            self._prune(store, options['prune'])
+
+        self._list(store)
+
+    def _import_legacy(self, store):
+        model_path = os.path.join(store.root, 'credit_model.pkl')
+        scaler_path = os.path.join(store.root, 'scaler.pkl')
+        if not (os.path.exists(model_path) and os.path.exists(scaler_path)):
+            raise CommandError(f'No legacy credit_model.pkl / scaler.pkl in {store.root}')
+
+        version = store.save(joblib.load(model_path), joblib.load(scaler_path), {
+            'estimator': 'legacy',
+            'feature_names': FEATURE_NAMES,
+        })
+        store.promote(version)
+        score_cache.invalidate_all()
+        self.stdout.write(self.style.SUCCESS(f'Imported legacy model as {version}'))
+
+    def _prune(self, store, keep):
+        if keep < 1:
+            raise CommandError('--prune must keep at least one version')
+        current = store.current_version()
+        removed = 0
+        for manifest in store.versions()[keep:]:
+            if manifest['version'] != current:
+                store.remove(manifest['version'])
+                removed += 1
+        self.stdout.write(f'Removed {removed} old versions')
+
+    def _list(self, store):
+        current = store.current_version()
+        versions = store.versions()
+        if not versions:
+            self.stdout.write('No stored model versions')
+            return
+
+        for manifest in versions:
+            marker = '*' if manifest['version'] == current else ' '
+            line = (
+                f"{marker} {manifest['version']}  {manifest.get('created_at', '')}  "
+                f"{manifest.get('estimator', '?'):<8} {manifest.get('model_type', '')}"
+            )
+            accuracy = (manifest.get('metrics') or {}).get('test_accuracy')
+            if accuracy is not None:
+                line += f'  test_accuracy={accuracy:.3f}'
+            self.stdout.write(line)
@@ -0,0 +1,138 @@
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from users.models import User
+from credit_scoring.workers import init_worker, score_chunk
+
+
+class Command(BaseCommand):
+    help = 'Rescore all consenting users with the current credit model in chunked batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help='Number of users scored per batch (default: 500)'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Number of parallel worker processes (default: 1)'
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='JSON file recording the last fully scored user'
+        )
+        parser.add_argument(
+            '--resume', action='store_true',
+            help='Continue after the user recorded in --checkpoint'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report how many users would be rescored without scoring them'
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        workers = options['workers']
+        self.checkpoint_path = options['checkpoint']
+
+        if chunk_size < 1 or workers < 1:
+            raise CommandError('--chunk-size and --workers must be positive')
+        if options['resume'] and not self.checkpoint_path:
+            raise CommandError('--resume requires --checkpoint')
+
+        last_user_id = None
+        if options['resume'] and os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as f:
+                last_user_id = json.load(f).get('last_user_id')
+            self.stdout.write(f'Resuming after user {last_user_id}')
+
+        users = User.objects.filter(
+            is_active=True,
+            consents__consent_type='MPESA_ANALYSIS',
+            consents__consented=True
+        )
+        if options['dry_run']:
+            count = (users.filter(id__gt=last_user_id) if last_user_id else users).distinct().count()
+            self.stdout.write(f'{count} users would be rescored in {-(-count // chunk_size)} chunks of {chunk_size}')
+            return
+
+        chunks = self._chunks(users, last_user_id, chunk_size)
+
+        self.started = time.monotonic()
+        self.users_seen = 0
+        self.users_scored = 0
+
+        if workers == 1:
+            for chunk in chunks:
+                self._finish_chunk(chunk, score_chunk(chunk))
+        else:
+            in_flight = deque()
+            # spawn, not fork: each worker must open its own database connection
+            # instead of sharing the one _chunks() uses in this process
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_worker
+            ) as executor:
+                for chunk in chunks:
+                    in_flight.append((chunk, executor.submit(score_chunk, chunk)))
+                    if len(in_flight) >= workers * 2:
+                        chunk, future = in_flight.popleft()
+                        self._finish_chunk(chunk, future.result())
+                # Chunks are finished in submission order so the checkpoint
+                # never skips past a chunk that is still running
+                while in_flight:
+                    chunk, future = in_flight.popleft()
+                    self._finish_chunk(chunk, future.result())
+
+        self._write_checkpoint(None, completed=True)
+        elapsed = time.monotonic() - self.started
+        self.stdout.write(self.style.SUCCESS(
+            f'Rescored {self.users_scored} of {self.users_seen} users in {elapsed:.1f}s'
+        ))
+
+    def _chunks(self, users, after, chunk_size):
+        """Yield lists of user ids in id order using keyset pagination"""
+        while True:
+            queryset = users.filter(id__gt=after) if after else users
+            user_ids = list(queryset.order_by('id').values_list('id', flat=True)[:chunk_size])
+            if not user_ids:
+                return
+            yield user_ids
+            after = user_ids[-1]
+
+    def _finish_chunk(self, chunk, scored):
+        self.users_seen += len(chunk)
+        self.users_scored += scored
+        self._write_checkpoint(chunk[-1])
+
+        elapsed = time.monotonic() - self.started
+        rate = self.users_seen / elapsed if elapsed > 0 else 0
+        self.stdout.write(
+            f'Scored {scored}/{len(chunk)} users in chunk '
+            f'({self.users_seen} processed, {rate:.0f} users/sec)'
+        )
+
+    def _write_checkpoint(self, last_user_id, completed=False):
+        if not self.checkpoint_path:
+            return
+        if last_user_id is not None:
+            self.last_user_id = str(last_user_id)
+        state = {
+            'last_user_id': getattr(self, 'last_user_id', None),
+            'users_processed': self.users_seen,
+            'users_scored': self.users_scored,
+            'completed': completed,
+            'updated_at': timezone.now().isoformat(),
+        }
+        tmp_path = f'{self.checkpoint_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.checkpoint_path)
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:32
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credit_scoring', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrainingJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('RUNNING', 'Running'), ('SUCCEEDED', 'Succeeded'), ('FAILED', 'Failed')], default='RUNNING', max_length=20)),
+                ('n_samples', models.IntegerField()),
+                ('progress', models.IntegerField(default=0)),
+                ('stage', models.CharField(blank=True, max_length=50)),
+                ('train_accuracy', models.FloatField(blank=True, null=True)),
+                ('test_accuracy', models.FloatField(blank=True, null=True)),
+                ('duration_ms', models.IntegerField(blank=True, null=True)),
+                ('artifact_path', models.CharField(blank=True, max_length=255)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status', 'RUNNING')), fields=('status',), name='single_running_training_job')],
+            },
+        ),
+    ]
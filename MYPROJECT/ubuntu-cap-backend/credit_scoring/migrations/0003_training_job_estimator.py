@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credit_scoring', '0002_training_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trainingjob',
+            name='estimator',
+            field=models.CharField(choices=[('gbm', 'Gradient Boosting'), ('hist', 'Histogram Gradient Boosting'), ('xgboost', 'XGBoost (hist)')], default='gbm', max_length=20),
+        ),
+    ]
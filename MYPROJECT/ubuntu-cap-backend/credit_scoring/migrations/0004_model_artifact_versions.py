@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credit_scoring', '0003_training_job_estimator'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trainingjob',
+            name='model_version',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='creditscore',
+            name='model_version',
+            field=models.CharField(default='v1', max_length=64),
+        ),
+    ]
@@ -1,10 +1,11 @@
+import uuid
 from django.db import models
 from users.models import User
 
 class CreditScore(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     score = models.IntegerField()  # 1-100
-    model_version = models.CharField(max_length=10, default='v1')
+    model_version = models.CharField(max_length=64, default='v1')  # Artifact version, or RB_v1 for rule-based
     calculated_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -21,4 +22,54 @@ class LoanOffer(models.Model):
         default='PENDING'
     )
     created_at = models.DateTimeField(auto_now_add=True)
-    expires_at = models.DateTimeField()
\ No newline at end of file
+    expires_at = models.DateTimeField()
+
+class TrainingJob(models.Model):
+    """
+    One background training run of the credit scoring model
+    """
+    STATUS_CHOICES = [
+        ('RUNNING', 'Running'),
+        ('SUCCEEDED', 'Succeeded'),
+        ('FAILED', 'Failed'),
+    ]
+    ESTIMATOR_CHOICES = [
+        ('gbm', 'Gradient Boosting'),
+        ('hist', 'Histogram Gradient Boosting'),
+        ('xgboost', 'XGBoost (hist)'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='RUNNING')
+    n_samples = models.IntegerField()
+    estimator = models.CharField(max_length=20, choices=ESTIMATOR_CHOICES, default='gbm')
+    progress = models.IntegerField(default=0)  # 0-100
+    stage = models.CharField(max_length=50, blank=True)
+    
+    # Results
+    train_accuracy = models.FloatField(null=True, blank=True)
+    test_accuracy = models.FloatField(null=True, blank=True)
+    duration_ms = models.IntegerField(null=True, blank=True)
+    model_version = models.CharField(max_length=64, blank=True)
+    artifact_path = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    
+    # Timestamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)  # Doubles as the worker heartbeat
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            # Only one training job may run at a time
+            models.UniqueConstraint(
+                fields=['status'],
+                condition=models.Q(status='RUNNING'),
+                name='single_running_training_job'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"Training job {self.id} - {self.status} ({self.progress}%)"
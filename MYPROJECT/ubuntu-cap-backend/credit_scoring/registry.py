@@ -0,0 +1,259 @@
+import hashlib
+import json
+import os
+import threading
+import logging
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+MODEL_DIR = os.path.join(settings.BASE_DIR, 'credit_scoring', 'ml_models')
+
+# Hex digits of a bundle's SHA-256 used as its version
+VERSION_LENGTH = 12
+
+class ArtifactStore:
+    """
+    Content-addressed store of trained model bundles
+    Each bundle holds the model, scaler and metadata and is named by its SHA-256;
+    CURRENT names the promoted version
+    """
+    
+    def __init__(self, root=None):
+        self.root = root or MODEL_DIR
+        self.versions_dir = os.path.join(self.root, 'versions')
+        self.pointer_path = os.path.join(self.root, 'CURRENT')
+    
+    def bundle_path(self, version):
+        return os.path.join(self.versions_dir, f'{version}.joblib')
+    
+    def manifest_path(self, version):
+        return os.path.join(self.versions_dir, f'{version}.json')
+    
+    def save(self, model, scaler, metadata=None, compiled=None):
+        """
+        Store a bundle and its JSON manifest and return its version (not promoted)
+        """
+        import joblib
+        
+        metadata = metadata or {}
+        # The compiled model is stored too, so workers need not compile it on load
+        os.makedirs(self.versions_dir, exist_ok=True)
+        tmp_path = os.path.join(self.versions_dir, f'.{os.getpid()}.{threading.get_ident()}.tmp')
+        # Uncompressed, so arrays in the bundle can be memory-mapped on load
+        joblib.dump({'model': model, 'scaler': scaler, 'compiled': compiled, 'metadata': metadata}, tmp_path)
+        
+        digest = _sha256(tmp_path)
+        version = digest[:VERSION_LENGTH]
+        path = self.bundle_path(version)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+        
+        if not os.path.exists(self.manifest_path(version)):
+            manifest = {
+                'version': version,
+                'sha256': digest,
+                'size': os.path.getsize(path),
+                'created_at': timezone.now().isoformat(),
+                'model_type': type(model).__name__,
+                'compiled': compiled is not None,
+                **metadata,
+            }
+            _write_atomic(self.manifest_path(version), json.dumps(manifest, indent=2, default=str))
+        return version
+    
+    def promote(self, version):
+        """Make version the one served by every worker"""
+        if not os.path.exists(self.bundle_path(version)):
+            raise ValueError(f"Unknown model version '{version}'")
+        _write_atomic(self.pointer_path, version)
+        logger.info(f"Promoted model version {version}")
+    
+    def current_version(self):
+        try:
+            with open(self.pointer_path) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+    
+    def manifest(self, version):
+        try:
+            with open(self.manifest_path(version)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+    
+    def versions(self):
+        """Manifests of all stored versions, newest first"""
+        if not os.path.isdir(self.versions_dir):
+            return []
+        manifests = [
+            self.manifest(name[:-len('.json')])
+            for name in os.listdir(self.versions_dir)
+            if name.endswith('.json')
+        ]
+        return sorted(filter(None, manifests), key=lambda m: m.get('created_at', ''), reverse=True)
+    
+    def load(self, version):
+        """
+        Load a bundle with its numpy arrays memory-mapped read-only,
+        so workers share them through the OS page cache
+        """
+        import joblib
+        
+        return joblib.load(self.bundle_path(version), mmap_mode='r')
+    
+    def remove(self, version):
+        if version == self.current_version():
+            raise ValueError("The promoted model version cannot be removed")
+        for path in (self.bundle_path(version), self.manifest_path(version)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+class ModelEntry:
+    """
+    A loaded bundle: model, scaler and compiled model swapped in and out as one unit
+    """
+    
+    def __init__(self, model, scaler, version, metadata, signature, compiled=None):
+        self.model = model
+        self.scaler = scaler
+        self.compiled = compiled
+        self.version = version
+        self.metadata = metadata
+        self.signature = signature
+        self.loaded_at = timezone.now()
+    
+    @property
+    def feature_names(self):
+        return self.metadata.get('feature_names')
+
+class ModelRegistry:
+    """
+    Per-process cache of the promoted model bundle
+    Each lookup stats the CURRENT pointer, so a promotion or rollback is picked up on the next call
+    """
+    
+    def __init__(self, store=None):
+        self.store = store or ArtifactStore()
+        self._entry = None
+        self._lock = threading.Lock()
+        self.loads = 0
+    
+    def get(self):
+        """
+        Return the current ModelEntry, or None if no model has been promoted
+        """
+        signature = self._signature()
+        entry = self._entry
+        if entry is not None and entry.signature == signature:
+            return entry
+        if signature is None:
+            if entry is not None:
+                logger.warning("Promoted model pointer removed; dropping loaded model")
+                self._entry = None
+            return None
+        
+        with self._lock:
+            # Another thread may have loaded this version while we waited
+            entry = self._entry
+            if entry is not None and entry.signature == signature:
+                return entry
+            return self._load(signature)
+    
+    def reload(self):
+        """Drop the loaded entry so the next get() reads the store again"""
+        with self._lock:
+            self._entry = None
+        return self.get()
+    
+    def status(self):
+        """
+        Describe the model currently served by this worker
+        """
+        entry = self.get()
+        return {
+            'model_loaded': entry is not None and entry.model is not None,
+            'model_type': type(entry.model).__name__ if entry else 'None',
+            'scaler_loaded': entry is not None and entry.scaler is not None,
+            'compiled': entry is not None and entry.compiled is not None,
+            'model_version': entry.version if entry else None,
+            'promoted_version': self.store.current_version(),
+            'artifact_path': self.store.bundle_path(entry.version) if entry else None,
+            'metrics': entry.metadata.get('metrics') if entry else None,
+            'loaded_at': entry.loaded_at.isoformat() if entry else None,
+            'loads_in_process': self.loads,
+        }
+    
+    def _signature(self):
+        """Identity of the CURRENT pointer file, or None if nothing is promoted"""
+        try:
+            stat = os.stat(self.store.pointer_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    
+    def _load(self, signature):
+        version = self.store.current_version()
+        if version is None:
+            return None
+        
+        entry = self._entry
+        if entry is not None and entry.version == version:
+            # Pointer rewritten with the same version: nothing to load
+            entry.signature = signature
+            return entry
+        
+        try:
+            bundle = self.store.load(version)
+        except Exception as e:
+            logger.error(f"Error loading ML model version {version}: {str(e)}")
+            return self._entry
+        
+        compiled = self._compiled(bundle, version)
+        
+        self._entry = ModelEntry(
+            bundle['model'], bundle['scaler'], version, bundle.get('metadata', {}), signature, compiled
+        )
+        self.loads += 1
+        logger.info(f"ML model loaded successfully (version {version})")
+        return self._entry
+    
+    def _compiled(self, bundle, version):
+        """
+        The bundle's compiled model, compiled again if missing or outdated (None means predict_proba is used)
+        """
+        from .compiled import COMPILED_FORMAT, compile_model
+        
+        compiled = bundle.get('compiled')
+        if compiled is not None and getattr(compiled, 'format', None) == COMPILED_FORMAT:
+            return compiled
+        try:
+            return compile_model(bundle['model'], bundle['scaler'])
+        except Exception as e:
+            logger.error(f"Error compiling ML model version {version}: {str(e)}")
+            return None
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _write_atomic(path, text):
+    """Write a small file next to its target and rename it into place"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+model_registry = ModelRegistry()
@@ -0,0 +1,108 @@
+import threading
+import time
+import uuid
+import logging
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Seconds a cached credit score response is served
+SCORE_CACHE_TIMEOUT = 86400
+
+
+class ScoreCache:
+    """
+    Namespaced, versioned cache of credit score responses
+
+    Entries live under credit_score_<user id>:g<generation>:v<user version>.
+    The generation is a single counter shared through the cache, so bumping
+    it after a retrain orphans every cached score at once without touching
+    other keys in the backend (sessions, throttle counters, dashboards).
+    Invalidating one user assigns them a new version instead of deleting
+    the entry, so per-process cache tiers never serve the old entry again.
+    Control keys (credit_score:...) hold the generation and the user
+    versions, which therefore cover all workers. Hit/miss counts are kept
+    per process, so a lookup never writes to the shared cache.
+    """
+
+    def __init__(self, prefix='credit_score', timeout=SCORE_CACHE_TIMEOUT, backend=None):
+        self.prefix = prefix
+        self.timeout = timeout
+        self.cache = backend or cache
+        self.generation_key = f'{prefix}:generation'
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def user_version_key(self, user_id):
+        return f'{self.prefix}:user:{user_id}'
+
+    def generation(self):
+        """Current generation number, created on first use"""
+        generation = self.cache.get(self.generation_key)
+        if generation is None:
+            # Seed from the clock so an evicted counter never reuses an old generation
+            self.cache.add(self.generation_key, int(time.time()), None)
+            generation = self.cache.get(self.generation_key)
+        return generation
+
+    def key(self, user_id):
+        """Entry key for the user's current generation and version"""
+        version_key = self.user_version_key(user_id)
+        versions = self.cache.get_many([self.generation_key, version_key])
+        generation = versions.get(self.generation_key)
+        if generation is None:
+            generation = self.generation()
+        return f'{self.prefix}_{user_id}:g{generation}:v{versions.get(version_key, 0)}'
+
+    def get(self, user_id):
+        """Return the cached response for a user, or None"""
+        value = self.cache.get(self.key(user_id))
+        with self._lock:
+            if value is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return value
+
+    def set(self, user_id, value, timeout=None):
+        self.cache.set(self.key(user_id), value, self.timeout if timeout is None else timeout)
+
+    def invalidate(self, *user_ids):
+        """Move the given users to new versions so their cached scores are never read again"""
+        if not user_ids:
+            return
+        self.cache.set_many({
+            self.user_version_key(user_id): uuid.uuid4().hex[:12]
+            for user_id in user_ids
+        }, self.timeout)
+
+    def invalidate_all(self):
+        """Invalidate every cached score in O(1) by moving to a new generation"""
+        try:
+            generation = self.cache.incr(self.generation_key)
+        except ValueError:
+            # Counter missing or evicted: start a fresh one
+            generation = int(time.time())
+            self.cache.set(self.generation_key, generation, None)
+        logger.info(f"Credit score cache moved to generation {generation}")
+        return generation
+
+    def stats(self):
+        """Hit/miss counts for this process since the counters were last reset"""
+        hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            'generation': self.generation(),
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / lookups, 3) if lookups else None,
+        }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+
+score_cache = ScoreCache()
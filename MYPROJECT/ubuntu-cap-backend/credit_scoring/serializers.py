@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import CreditScore, LoanOffer
+from .models import CreditScore, LoanOffer, TrainingJob
+from .estimators import DEFAULT_ESTIMATOR, ESTIMATOR_BACKENDS
 from users.models import User  # Import if you need user details
 
 class CreditScoreSerializer(serializers.ModelSerializer):
@@ -199,6 +200,33 @@ class MLModelTrainingSerializer(serializers.Serializer):
         default=1000
     )
     retrain_existing = serializers.BooleanField(default=True)
+    estimator = serializers.ChoiceField(
+        choices=list(ESTIMATOR_BACKENDS),
+        default=DEFAULT_ESTIMATOR
+    )
+
+class TrainingJobSerializer(serializers.ModelSerializer):
+    """Serializer for background model training jobs"""
+    class Meta:
+        model = TrainingJob
+        fields = [
+            'id',
+            'status',
+            'n_samples',
+            'estimator',
+            'progress',
+            'stage',
+            'train_accuracy',
+            'test_accuracy',
+            'duration_ms',
+            'model_version',
+            'artifact_path',
+            'error',
+            'created_at',
+            'updated_at',
+            'finished_at'
+        ]
+        read_only_fields = fields
 
 class CreditScoreRequestSerializer(serializers.Serializer):
     """Serializer for credit score calculation requests"""
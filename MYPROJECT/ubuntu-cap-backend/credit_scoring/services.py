@@ -1,45 +1,106 @@
-import numpy as np
-import pandas as pd
-from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
-from sklearn.preprocessing import StandardScaler
-from sklearn.model_selection import train_test_split
 from django.utils import timezone
 from datetime import timedelta
 from django.db.models import Count, Sum, Avg, StdDev, Q
-import joblib
 import os
 from django.conf import settings
 import logging
 import random
-from mpesa.models import MpesaTransaction, MpesaProfile
+from mpesa.models import MpesaTransaction, MpesaProfile, MpesaDailyRollup
+from mpesa.services import TransactionRollupService
+from users.services import DashboardService
+from .models import CreditScore
+from .estimators import DEFAULT_ESTIMATOR, get_backend
+from .registry import model_registry
+from .score_cache import score_cache
 
 logger = logging.getLogger(__name__)
 
+# Feature names in the order produced by _extract_features
+FEATURE_NAMES = [
+    'total_transactions', 'total_volume', 'total_income', 'total_expenses',
+    'active_days', 'transaction_frequency', 'unique_counterparties',
+    'amount_std', 'evening_transactions_ratio', 'weekend_transactions_ratio',
+    'savings_ratio', 'expense_to_income_ratio', 'avg_transaction_amount'
+]
+
+# Reasons shown when a feature raised or lowered an applicant's score
+REASON_PHRASES = {
+    'total_transactions': ("Regular M-Pesa usage", "Few transactions on record"),
+    'total_volume': ("Healthy transaction volume", "Low transaction volume"),
+    'total_income': ("Strong income inflows", "Low income inflows"),
+    'total_expenses': ("Manageable expenses", "High expenses"),
+    'active_days': ("Active on most days", "Few active days"),
+    'transaction_frequency': ("Consistent transaction activity", "Irregular transaction activity"),
+    'unique_counterparties': ("Diverse financial network", "Narrow financial network"),
+    'amount_std': ("Steady transaction amounts", "Erratic transaction amounts"),
+    'evening_transactions_ratio': ("Balanced evening activity", "Heavy evening activity"),
+    'weekend_transactions_ratio': ("Balanced weekend activity", "Heavy weekend activity"),
+    'savings_ratio': ("Strong savings habit", "Low savings"),
+    'expense_to_income_ratio': ("Healthy spending limits", "Spending close to or above income"),
+    'avg_transaction_amount': ("Healthy transaction sizes", "Small transaction sizes"),
+}
+
+# Count-valued features, returned as ints in the feature dict
+INTEGER_FEATURES = ['total_transactions', 'active_days', 'unique_counterparties']
+
+# Columns fetched per daily rollup row for feature extraction
+ROLLUP_FRAME_COLUMNS = [
+    'user_id', 'day', 'transaction_type', 'transaction_count', 'amount_sum', 'amount_sq_sum',
+    'credit_sum', 'debit_sum', 'evening_count', 'weekend_count', 'counterparties',
+]
+
+# Days of transaction history used for scoring
+FEATURE_WINDOW_DAYS = 180
+
+# Minimum transactions in the window for reliable analysis
+MIN_TRANSACTIONS = 10
+
+# Largest batch scored with the compiled model; scikit-learn's own tree walk is faster on bigger ones
+COMPILED_MAX_ROWS = 32
+
+def import_ml_stack():
+    """
+    Import the scientific libraries used for scoring and training
+    
+    They are imported lazily so request paths and management commands that
+    never score do not pay for them; a preforking server calls this before
+    forking so its workers share the loaded modules instead.
+    """
+    import numpy
+    import pandas
+    import joblib
+    import scipy.special
+    import sklearn.ensemble
+    import sklearn.model_selection
+    import sklearn.preprocessing
+
 class MLCreditScoringService:
     """
     Machine Learning powered credit scoring service
     """
     
-    def __init__(self):
+    def __init__(self, registry=None):
+        self.registry = registry or model_registry
         self.model = None
-        self.scaler = StandardScaler()
-        self.model_path = os.path.join(settings.BASE_DIR, 'credit_scoring', 'ml_models', 'credit_model.pkl')
-        self.scaler_path = os.path.join(settings.BASE_DIR, 'credit_scoring', 'ml_models', 'scaler.pkl')
+        self.scaler = None
+        self.compiled = None
+        self.model_version = None
         self.load_model()
     
     def load_model(self):
-        """Load trained ML model and scaler"""
-        try:
-            if os.path.exists(self.model_path) and os.path.exists(self.scaler_path):
-                self.model = joblib.load(self.model_path)
-                self.scaler = joblib.load(self.scaler_path)
-                logger.info("ML model loaded successfully")
-            else:
-                logger.warning("No trained model found. Using default scoring.")
-        except Exception as e:
-            logger.error(f"Error loading ML model: {str(e)}")
+        """Load trained ML model and scaler from the process-wide registry"""
+        entry = self.registry.get()
+        if entry is None:
+            logger.warning("No trained model found. Using default scoring.")
+        elif entry.feature_names and list(entry.feature_names) != FEATURE_NAMES:
+            logger.error(f"Model version {entry.version} was trained on different features. Using default scoring.")
+        else:
+            self.model = entry.model
+            self.scaler = entry.scaler
+            self.compiled = entry.compiled
+            self.model_version = entry.version
     
-    def train_model(self, training_data=None):
+    def train_model(self, training_data=None, n_samples=1000, estimator=DEFAULT_ESTIMATOR):
         """
         Train the credit scoring model
         In production, you'd use historical data with known outcomes
@@ -48,48 +109,80 @@ class MLCreditScoringService:
             # For demo, we'll create synthetic training data
             # In reality, you'd use your historical loan performance data
             if training_data is None:
-                X, y = self._generate_training_data()
+                X, y = self._generate_training_data(n_samples)
             else:
                 X, y = training_data
             
-            # Split data
-            X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-            
-            # Scale features
-            X_train_scaled = self.scaler.fit_transform(X_train)
-            X_test_scaled = self.scaler.transform(X_test)
-            
-            # Train model (using Gradient Boosting for better performance)
-            self.model = GradientBoostingClassifier(
-                n_estimators=100,
-                learning_rate=0.1,
-                max_depth=6,
-                random_state=42
-            )
-            
-            self.model.fit(X_train_scaled, y_train)
-            
-            # Save model and scaler
-            os.makedirs(os.path.dirname(self.model_path), exist_ok=True)
-            joblib.dump(self.model, self.model_path)
-            joblib.dump(self.scaler, self.scaler_path)
-            
-            # Calculate training accuracy
-            train_accuracy = self.model.score(X_train_scaled, y_train)
-            test_accuracy = self.model.score(X_test_scaled, y_test)
-            
-            logger.info(f"Model trained - Train Accuracy: {train_accuracy:.3f}, Test Accuracy: {test_accuracy:.3f}")
-            
-            return train_accuracy, test_accuracy
+            return self.fit(X, y, estimator=estimator)
             
         except Exception as e:
             logger.error(f"Error training model: {str(e)}")
             return 0, 0
     
+    def fit(self, X, y, monitor=None, estimator=DEFAULT_ESTIMATOR):
+        """
+        Fit, store and promote a model on (X, y), returning (train, test) accuracy
+        
+        estimator names a backend in estimators.ESTIMATOR_BACKENDS. monitor
+        is called after boosting stages (see EstimatorBackend). Errors are
+        raised to the caller.
+        """
+        from sklearn.model_selection import train_test_split
+        from sklearn.preprocessing import StandardScaler
+        from .compiled import compile_model
+        
+        backend = get_backend(estimator)
+        
+        # Split data
+        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+        
+        # Scale features (fit a fresh scaler; the loaded one is shared by other requests)
+        self.scaler = StandardScaler()
+        X_train_scaled = self.scaler.fit_transform(X_train)
+        X_test_scaled = self.scaler.transform(X_test)
+        
+        # Train model with the selected boosting backend
+        self.model = backend.build()
+        backend.fit(self.model, X_train_scaled, y_train, monitor=monitor)
+        
+        # Calculate training accuracy
+        train_accuracy = self.model.score(X_train_scaled, y_train)
+        test_accuracy = self.model.score(X_test_scaled, y_test)
+        
+        # Array form of the model and scaler for request-time scoring (None for XGBoost)
+        try:
+            self.compiled = compile_model(self.model, self.scaler)
+        except Exception as e:
+            logger.error(f"Error compiling ML model: {str(e)}")
+            self.compiled = None
+        
+        # Store model and scaler as one bundle, promote it and swap it into this worker's registry
+        store = self.registry.store
+        self.model_version = store.save(self.model, self.scaler, {
+            'estimator': estimator,
+            'feature_names': FEATURE_NAMES,
+            'training_rows': len(y),
+            'metrics': {
+                'train_accuracy': float(train_accuracy),
+                'test_accuracy': float(test_accuracy),
+            },
+        }, compiled=self.compiled)
+        store.promote(self.model_version)
+        self.registry.reload()
+        
+        # Scores cached under the old model are no longer valid
+        score_cache.invalidate_all()
+        
+        logger.info(f"Model trained - Train Accuracy: {train_accuracy:.3f}, Test Accuracy: {test_accuracy:.3f}")
+        
+        return train_accuracy, test_accuracy
+    
     def calculate_score(self, user):
         """
         Calculate credit score using ML model
         """
+        import numpy as np
+        
         try:
             # Extract features from user's transaction data
             features = self._extract_features(user)
@@ -97,193 +190,226 @@ class MLCreditScoringService:
             if features is None:
                 return self._fallback_score(user), "Insufficient data for ML analysis"
             
-            # Convert to numpy array and scale
-            features_array = np.array([list(features.values())])
-            features_scaled = self.scaler.transform(features_array)
-            
-            # Predict probability of good credit
-            if self.model:
-                probability_good = self.model.predict_proba(features_scaled)[0][1]
-                ml_score = int(probability_good * 100)
-                
-                # Get feature importance for reasoning
-                reasoning = self._generate_ml_reasoning(features, self.model.feature_importances_)
-                
-                return ml_score, reasoning
-            else:
+            if not self.model:
                 # Fallback to rule-based scoring if no ML model
                 return self._rule_based_score(features), "Using rule-based scoring (ML model not available)"
+            
+            # Convert to numpy array and predict probability of good credit
+            features_array = np.array([list(features.values())], dtype=float)
+            probability_good = self._probability_good(features_array)[0]
+            ml_score = int(probability_good * 100)
+            
+            # Reasoning from the features that moved this applicant's score most
+            reasoning = self._generate_ml_reasoning(self._feature_contributions(features_array))
+            
+            return ml_score, reasoning
                 
         except Exception as e:
             logger.error(f"Error in ML credit scoring: {str(e)}")
             return self._fallback_score(user), "Error in analysis, using fallback scoring"
     
+    def score_users(self, user_ids):
+        """
+        Score a batch of users in one pass and store a CreditScore for each
+        
+        Features for the whole batch come from a single transaction query,
+        and the scaler and model run once over the batch's feature matrix.
+        Users without enough transaction history are skipped.
+        Returns the list of created CreditScore rows.
+        """
+        matrix = self._extract_feature_matrix(user_ids)
+        if matrix.empty:
+            return []
+        
+        if self.model:
+            probability_good = self._probability_good(matrix[FEATURE_NAMES].to_numpy(dtype=float))
+            scores = (probability_good * 100).astype(int)
+            model_version = self.model_version
+        else:
+            scores = [self._rule_based_score(row) for row in matrix.to_dict('records')]
+            model_version = 'RB_v1'
+        
+        credit_scores = CreditScore.objects.bulk_create([
+            CreditScore(user_id=user_id, score=int(score), model_version=model_version)
+            for user_id, score in zip(matrix.index, scores)
+        ])
+        
+        # Cached score responses and dashboards for these users are now stale
+        score_cache.invalidate(*matrix.index)
+        DashboardService.invalidate(*matrix.index)
+        
+        return credit_scores
+    
+    def _probability_good(self, features):
+        """
+        Probability of good credit for rows of raw features
+        
+        Small batches use the compiled model when there is one: the same
+        probabilities as the scaler and model's predict_proba without
+        scikit-learn's per-call overhead.
+        """
+        if self.compiled is not None and len(features) <= COMPILED_MAX_ROWS:
+            return self.compiled.predict_proba(features)[:, 1]
+        return self.model.predict_proba(self.scaler.transform(features))[:, 1]
+    
+    def _feature_contributions(self, features):
+        """
+        Per-row log-odds contribution of each feature for rows of raw features
+        
+        Columns follow FEATURE_NAMES, then the bias. Tree path contributions
+        come from the compiled model, or from XGBoost's own pred_contribs.
+        Returns None for a model that offers neither.
+        """
+        if self.compiled is not None:
+            return self.compiled.predict_contributions(features)
+        if hasattr(self.model, 'get_booster'):
+            import xgboost
+            matrix = xgboost.DMatrix(self.scaler.transform(features))
+            return self.model.get_booster().predict(matrix, pred_contribs=True)
+        return None
+    
     def _extract_features(self, user):
         """
         Extract features from user's M-Pesa transaction data
         """
         try:
-            # Get transactions from last 6 months
-            six_months_ago = timezone.now() - timedelta(days=180)
-            transactions = MpesaTransaction.objects.filter(
-                user=user,
-                transaction_date__gte=six_months_ago
-            )
+            matrix = self._extract_feature_matrix([user.id])
             
-            if transactions.count() < 10:  # Minimum transactions for reliable analysis
+            if matrix.empty:
                 return None
             
-            # Basic transaction metrics
-            total_transactions = transactions.count()
-            total_volume = transactions.aggregate(total=Sum('amount'))['total'] or 0
-            
-            # Income vs Expense analysis
-            income_transactions = transactions.filter(
-                Q(transaction_type='B2C') | 
-                Q(transaction_type='C2C', amount__gt=0)
-            )
-            total_income = income_transactions.aggregate(total=Sum('amount'))['total'] or 0
-            
-            expense_transactions = transactions.filter(
-                Q(transaction_type='C2B') |
-                Q(transaction_type='C2C', amount__lt=0)
-            )
-            total_expenses = abs(expense_transactions.aggregate(total=Sum('amount'))['total'] or 0)
-            
-            # Transaction patterns
-            transaction_dates = transactions.values_list('transaction_date', flat=True)
-            if transaction_dates:
-                dates_series = pd.Series(transaction_dates)
-                active_days = dates_series.dt.date.nunique()
-                transaction_frequency = total_transactions / active_days if active_days > 0 else 0
-            else:
-                active_days = 0
-                transaction_frequency = 0
-            
-            # Network diversity
-            unique_counterparties = transactions.values('counterparty').distinct().count()
-            
-            # Consistency metrics (standard deviation of transaction amounts)
-            amount_std = transactions.aggregate(std=StdDev('amount'))['std'] or 0
-            
-            # Time-based features
-            evening_transactions = transactions.filter(
-                transaction_date__hour__gte=18
-            ).count()
-            weekend_transactions = transactions.filter(
-                transaction_date__week_day__in=[1, 7]  # Saturday and Sunday
-            ).count()
-            
-            # Financial health indicators
-            savings_ratio = (total_income - total_expenses) / total_income if total_income > 0 else 0
-            expense_to_income_ratio = total_expenses / total_income if total_income > 0 else 1
-            
-            features = {
-                'total_transactions': total_transactions,
-                'total_volume': float(total_volume),
-                'total_income': float(total_income),
-                'total_expenses': float(total_expenses),
-                'active_days': active_days,
-                'transaction_frequency': transaction_frequency,
-                'unique_counterparties': unique_counterparties,
-                'amount_std': float(amount_std),
-                'evening_transactions_ratio': evening_transactions / total_transactions,
-                'weekend_transactions_ratio': weekend_transactions / total_transactions,
-                'savings_ratio': savings_ratio,
-                'expense_to_income_ratio': expense_to_income_ratio,
-                'avg_transaction_amount': float(total_volume / total_transactions),
-            }
-            
-            return features
+            return self._feature_dict(matrix.iloc[0])
             
         except Exception as e:
             logger.error(f"Error extracting features: {str(e)}")
             return None
     
-    def _generate_training_data(self, n_samples=1000):
+    def _extract_feature_matrix(self, user_ids):
+        """
+        Build the feature matrix for a set of users from their daily rollups
+        
+        Returns a frame indexed by user id with one column per feature.
+        Users with fewer than MIN_TRANSACTIONS in the window are left out.
+        """
+        # Fold any transactions the ingest paths have not rolled up yet
+        TransactionRollupService.refresh_stale(user_ids)
+        
+        # Get the last 6 months of rollups in a single query
+        rows = MpesaDailyRollup.objects.filter(
+            user_id__in=user_ids,
+            day__gte=TransactionRollupService.window_start(FEATURE_WINDOW_DAYS)
+        ).order_by().values_list(*ROLLUP_FRAME_COLUMNS)
+        
+        frame = self._rollup_frame(rows)
+        matrix = self._feature_matrix(frame)
+        
+        # Minimum transactions for reliable analysis
+        return matrix[matrix['total_transactions'] >= MIN_TRANSACTIONS]
+    
+    def _rollup_frame(self, rows):
+        """Load daily rollup rows into a columnar frame"""
+        import pandas as pd
+        
+        frame = pd.DataFrame.from_records(list(rows), columns=ROLLUP_FRAME_COLUMNS)
+        for column in ['amount_sum', 'amount_sq_sum', 'credit_sum', 'debit_sum']:
+            frame[column] = frame[column].astype(float)
+        return frame
+    
+    def _feature_matrix(self, frame):
+        """
+        Compute the model features for every user in a rollup frame at once
+        """
+        import numpy as np
+        import pandas as pd
+        
+        types = frame['transaction_type']
+        
+        # Income vs Expense analysis: B2C and incoming C2C are income,
+        # C2B and outgoing C2C are expenses
+        income = frame['amount_sum'].where(types == 'B2C', 0.0) + frame['credit_sum'].where(types == 'C2C', 0.0)
+        expense = frame['amount_sum'].where(types == 'C2B', 0.0) + frame['debit_sum'].where(types == 'C2C', 0.0)
+        
+        columns = pd.DataFrame({
+            'user_id': frame['user_id'],
+            'day': frame['day'],
+            'count': frame['transaction_count'],
+            'amount_sum': frame['amount_sum'],
+            'amount_sq_sum': frame['amount_sq_sum'],
+            'income': income,
+            'expense': expense,
+            'evening': frame['evening_count'],
+            'weekend': frame['weekend_count'],
+        })
+        grouped = columns.groupby('user_id', sort=False)
+        
+        matrix = grouped.agg(
+            total_transactions=('count', 'sum'),
+            total_volume=('amount_sum', 'sum'),
+            amount_sq_sum=('amount_sq_sum', 'sum'),
+            total_income=('income', 'sum'),
+            total_expenses=('expense', 'sum'),
+            active_days=('day', 'nunique'),  # Local calendar days
+            evening_transactions=('evening', 'sum'),
+            weekend_transactions=('weekend', 'sum'),
+        )
+        matrix['total_expenses'] = matrix['total_expenses'].abs()
+        
+        # Network diversity (a missing counterparty counts as one contact)
+        counterparties = frame[['user_id', 'counterparties']].explode('counterparties')
+        matrix['unique_counterparties'] = counterparties.groupby('user_id', sort=False)['counterparties'].nunique(dropna=False)
+        
+        # Consistency metrics (population standard deviation of transaction amounts)
+        count = matrix['total_transactions']
+        mean = matrix['total_volume'] / count
+        variance = (matrix['amount_sq_sum'] / count - mean ** 2).clip(lower=0)
+        matrix['amount_std'] = np.sqrt(variance)
+        
+        # Transaction patterns and financial health indicators
+        income = matrix['total_income']
+        has_income = income > 0
+        matrix['transaction_frequency'] = count / matrix['active_days']
+        matrix['evening_transactions_ratio'] = matrix['evening_transactions'] / count
+        matrix['weekend_transactions_ratio'] = matrix['weekend_transactions'] / count
+        matrix['savings_ratio'] = ((income - matrix['total_expenses']) / income).where(has_income, 0.0)
+        matrix['expense_to_income_ratio'] = (matrix['total_expenses'] / income).where(has_income, 1.0)
+        matrix['avg_transaction_amount'] = mean
+        
+        return matrix[FEATURE_NAMES]
+    
+    def _feature_dict(self, row):
+        """Convert one row of the feature matrix into the ordered feature dict"""
+        features = {name: float(row[name]) for name in FEATURE_NAMES}
+        for name in INTEGER_FEATURES:
+            features[name] = int(features[name])
+        return features
+    
+    def _generate_training_data(self, n_samples=1000, good_ratio=0.6):
         """
         Generate synthetic training data for demo purposes
         In production, replace with real historical data
         """
-        np.random.seed(42)
-        
-        # Feature names matching _extract_features
-        feature_names = [
-            'total_transactions', 'total_volume', 'total_income', 'total_expenses',
-            'active_days', 'transaction_frequency', 'unique_counterparties',
-            'amount_std', 'evening_transactions_ratio', 'weekend_transactions_ratio',
-            'savings_ratio', 'expense_to_income_ratio', 'avg_transaction_amount'
-        ]
-        
-        X = np.zeros((n_samples, len(feature_names)))
-        y = np.zeros(n_samples)
-        
-        for i in range(n_samples):
-            # Good credit users (60% of samples)
-            if i < n_samples * 0.6:
-                # Good credit patterns
-                X[i, 0] = np.random.normal(150, 30)  # More transactions
-                X[i, 1] = np.random.normal(500000, 100000)  # Higher volume
-                X[i, 2] = np.random.normal(300000, 50000)   # Higher income
-                X[i, 3] = np.random.normal(200000, 40000)   # Moderate expenses
-                X[i, 4] = np.random.normal(120, 20)         # Many active days
-                X[i, 5] = np.random.normal(1.5, 0.3)        # Good frequency
-                X[i, 6] = np.random.normal(25, 5)           # Diverse network
-                X[i, 7] = np.random.normal(5000, 1000)      # Moderate std
-                X[i, 8] = np.random.normal(0.1, 0.05)       # Low evening transactions
-                X[i, 9] = np.random.normal(0.15, 0.05)      # Low weekend transactions
-                X[i, 10] = np.random.normal(0.3, 0.1)       # Good savings ratio
-                X[i, 11] = np.random.normal(0.6, 0.1)       # Healthy expense ratio
-                X[i, 12] = np.random.normal(3500, 500)      # Good avg transaction
-                y[i] = 1  # Good credit
-            else:
-                # Poor credit users
-                X[i, 0] = np.random.normal(30, 10)          # Fewer transactions
-                X[i, 1] = np.random.normal(50000, 20000)    # Lower volume
-                X[i, 2] = np.random.normal(80000, 20000)    # Lower income
-                X[i, 3] = np.random.normal(90000, 30000)    # High expenses
-                X[i, 4] = np.random.normal(30, 10)          # Few active days
-                X[i, 5] = np.random.normal(0.8, 0.2)        # Poor frequency
-                X[i, 6] = np.random.normal(8, 3)            # Limited network
-                X[i, 7] = np.random.normal(15000, 5000)     # High std (volatile)
-                X[i, 8] = np.random.normal(0.4, 0.1)        # High evening transactions
-                X[i, 9] = np.random.normal(0.5, 0.1)        # High weekend transactions
-                X[i, 10] = np.random.normal(-0.2, 0.1)      # Negative savings
-                X[i, 11] = np.random.normal(1.2, 0.2)       # High expense ratio
-                X[i, 12] = np.random.normal(1500, 500)      # Low avg transaction
-                y[i] = 0  # Poor credit
-        
-        return X, y
+        from .synthetic import SyntheticCreditData
+        
+        return SyntheticCreditData(good_ratio=good_ratio).generate(n_samples)
     
-    def _generate_ml_reasoning(self, features, feature_importances):
-        """Generate reasoning based on ML model feature importance"""
-        feature_names = [
-            'Transaction Count', 'Transaction Volume', 'Income Level', 'Expense Level',
-            'Active Days', 'Transaction Frequency', 'Network Diversity', 
-            'Spending Consistency', 'Evening Activity', 'Weekend Activity',
-            'Savings Rate', 'Expense-to-Income Ratio', 'Average Transaction Size'
-        ]
-        
-        # Get top 3 most important features for this prediction
-        top_indices = np.argsort(feature_importances)[-3:][::-1]
+    def _generate_ml_reasoning(self, contributions):
+        """Generate reasoning from one applicant's feature contributions"""
+        import numpy as np
         
+        if contributions is None:
+            return "Based on comprehensive financial behavior analysis"
+        
+        # Largest effects first, in either direction; the bias column is not a feature
+        contributions = contributions[0][:len(FEATURE_NAMES)]
         reasoning_parts = []
-        for idx in top_indices:
-            feature_name = feature_names[idx]
-            importance = feature_importances[idx]
-            value = list(features.values())[idx]
-            
-            if feature_name == 'Savings Rate' and value > 0.2:
-                reasoning_parts.append("Strong savings habit")
-            elif feature_name == 'Expense-to-Income Ratio' and value < 0.8:
-                reasoning_parts.append("Healthy spending limits")
-            elif feature_name == 'Transaction Frequency' and value > 1.2:
-                reasoning_parts.append("Consistent transaction activity")
-            elif feature_name == 'Network Diversity' and value > 15:
-                reasoning_parts.append("Diverse financial network")
+        for idx in np.argsort(-np.abs(contributions))[:2]:  # Limit to top 2 reasons
+            if contributions[idx] == 0:
+                break
+            raised, lowered = REASON_PHRASES[FEATURE_NAMES[idx]]
+            reasoning_parts.append(raised if contributions[idx] > 0 else lowered)
         
         if reasoning_parts:
-            return " | ".join(reasoning_parts[:2])  # Limit to top 2 reasons
+            return " | ".join(reasoning_parts)
         else:
             return "Based on comprehensive financial behavior analysis"
     
@@ -0,0 +1,14 @@
+from django.db.models.signals import post_delete, post_save
+
+from .score_cache import score_cache
+
+
+def invalidate_user_score(sender, instance, **kwargs):
+    """Drop the cached credit score of the user a new score or consent change belongs to"""
+    score_cache.invalidate(instance.user_id)
+
+
+def connect_signals():
+    for label in ['credit_scoring.CreditScore', 'users.UserConsent']:
+        post_save.connect(invalidate_user_score, sender=label, dispatch_uid=f'score_cache_{label}_save')
+        post_delete.connect(invalidate_user_score, sender=label, dispatch_uid=f'score_cache_{label}_delete')
@@ -0,0 +1,106 @@
+import numpy as np
+
+# Per-class feature distributions as (mean, std), in FEATURE_NAMES order
+GOOD_CREDIT_PROFILE = [
+    (150, 30),           # More transactions
+    (500000, 100000),    # Higher volume
+    (300000, 50000),     # Higher income
+    (200000, 40000),     # Moderate expenses
+    (120, 20),           # Many active days
+    (1.5, 0.3),          # Good frequency
+    (25, 5),             # Diverse network
+    (5000, 1000),        # Moderate std
+    (0.1, 0.05),         # Low evening transactions
+    (0.15, 0.05),        # Low weekend transactions
+    (0.3, 0.1),          # Good savings ratio
+    (0.6, 0.1),          # Healthy expense ratio
+    (3500, 500),         # Good avg transaction
+]
+POOR_CREDIT_PROFILE = [
+    (30, 10),            # Fewer transactions
+    (50000, 20000),      # Lower volume
+    (80000, 20000),      # Lower income
+    (90000, 30000),      # High expenses
+    (30, 10),            # Few active days
+    (0.8, 0.2),          # Poor frequency
+    (8, 3),              # Limited network
+    (15000, 5000),       # High std (volatile)
+    (0.4, 0.1),          # High evening transactions
+    (0.5, 0.1),          # High weekend transactions
+    (-0.2, 0.1),         # Negative savings
+    (1.2, 0.2),          # High expense ratio
+    (1500, 500),         # Low avg transaction
+]
+
+# Within-class correlations between feature columns (index pairs)
+FEATURE_CORRELATIONS = {
+    (0, 1): 0.4,     # transactions / volume
+    (0, 4): 0.5,     # transactions / active days
+    (0, 5): 0.3,     # transactions / frequency
+    (0, 6): 0.3,     # transactions / counterparties
+    (1, 2): 0.5,     # volume / income
+    (1, 3): 0.4,     # volume / expenses
+    (2, 3): 0.3,     # income / expenses
+    (1, 12): 0.3,    # volume / average amount
+    (7, 12): 0.3,    # amount std / average amount
+    (8, 9): 0.3,     # evening / weekend activity
+    (10, 11): -0.6,  # savings ratio / expense ratio
+}
+
+# Rows generated per chunk in streaming mode
+DEFAULT_CHUNK_SIZE = 100000
+
+
+class SyntheticCreditData:
+    """
+    Vectorized generator of synthetic labelled credit features
+
+    Rows are drawn per class from GOOD_CREDIT_PROFILE / POOR_CREDIT_PROFILE
+    with a private np.random.Generator (the global RNG is left alone).
+    Features are independent by default, as they always were; with
+    correlated=True, draws multiply standard normals by the Cholesky factor
+    of FEATURE_CORRELATIONS. iter_chunks() streams arbitrarily many rows in
+    fixed-size chunks so memory stays bounded by the chunk size.
+    """
+
+    def __init__(self, good_ratio=0.6, correlated=False, seed=42, dtype=np.float64):
+        if not 0 <= good_ratio <= 1:
+            raise ValueError("good_ratio must be between 0 and 1")
+        self.good_ratio = good_ratio
+        self.dtype = dtype
+        self.rng = np.random.default_rng(seed)
+
+        good = np.array(GOOD_CREDIT_PROFILE, dtype=np.float64)
+        poor = np.array(POOR_CREDIT_PROFILE, dtype=np.float64)
+        # Row 0 is the poor class, row 1 the good class, so labels index directly
+        self.means = np.stack([poor[:, 0], good[:, 0]])
+        self.stds = np.stack([poor[:, 1], good[:, 1]])
+        self.cholesky = self._correlation_cholesky() if correlated else None
+
+    def generate(self, n_samples):
+        """Return (X, y) with exactly round(n_samples * good_ratio) good rows"""
+        return self._chunk(0, n_samples)
+
+    def iter_chunks(self, n_samples, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Yield (X, y) chunks totalling n_samples rows"""
+        for start in range(0, n_samples, chunk_size):
+            yield self._chunk(start, min(chunk_size, n_samples - start))
+
+    def _chunk(self, start, size):
+        # Keep the class balance exact over the whole stream, not just per chunk
+        n_good = round((start + size) * self.good_ratio) - round(start * self.good_ratio)
+        y = np.zeros(size, dtype=np.int8)
+        y[:n_good] = 1
+        self.rng.shuffle(y)
+
+        z = self.rng.standard_normal((size, self.means.shape[1]))
+        if self.cholesky is not None:
+            z = z @ self.cholesky.T
+        X = self.means[y] + z * self.stds[y]
+        return X.astype(self.dtype, copy=False), y
+
+    def _correlation_cholesky(self):
+        correlation = np.eye(self.means.shape[1])
+        for (i, j), value in FEATURE_CORRELATIONS.items():
+            correlation[i, j] = correlation[j, i] = value
+        return np.linalg.cholesky(correlation)
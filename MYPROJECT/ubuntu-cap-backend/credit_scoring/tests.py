@@ -1,3 +1,721 @@
-from django.test import TestCase
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db.models import Q, StdDev, Sum
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, override_settings
+from unittest import mock
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from mpesa.models import MpesaTransaction
+from users.models import User, UserConsent
+from users.services import DashboardService
+from .models import CreditScore, TrainingJob
+from .compiled import compile_model
+from .estimators import ESTIMATOR_BACKENDS, feature_importances, get_backend
+from .registry import ArtifactStore, ModelRegistry, model_registry
+from .score_cache import ScoreCache, score_cache
+from ubuntu_core.cache import TieredCache
+from .services import FEATURE_NAMES, REASON_PHRASES, MLCreditScoringService
+from .synthetic import SyntheticCreditData
+from .training import TrainingJobConflict, TrainingJobService, TRAINING_JOB_STALE_AFTER
+
+
+def create_transactions(user, count, start=None):
+    """Create a deterministic mix of transactions at local mid-day hours"""
+    start = start or timezone.localtime() - timedelta(days=120)
+    start = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    types = ['B2C', 'C2B', 'C2C', 'C2C', 'B2B']
+    counterparties = ['EMPLOYER_CO', 'KPLC', 'FRIEND', None, 'MERCHANT', 'SACCO']
+    transactions = []
+    for i in range(count):
+        transaction_type = types[i % len(types)]
+        amount = Decimal(str(100 + (i * 137) % 5000))
+        if transaction_type == 'C2C' and i % 2:
+            amount = -amount
+        transactions.append(MpesaTransaction(
+            user=user,
+            transaction_type=transaction_type,
+            transaction_category='PAYMENT',
+            amount=amount,
+            phone_number=user.phone_number,
+            counterparty=counterparties[i % len(counterparties)],
+            transaction_date=start + timedelta(days=(i * 3) % 100, hours=6 + (i * 5) % 17),
+        ))
+    MpesaTransaction.objects.bulk_create(transactions)
+
+
+def use_temporary_model_store(test_case):
+    """Point the model registry at an empty store that is removed after the test"""
+    model_dir = tempfile.TemporaryDirectory()
+    test_case.addCleanup(model_dir.cleanup)
+    store = ArtifactStore(model_dir.name)
+    for attribute, value in [('store', store), ('_entry', None)]:
+        patcher = mock.patch.object(model_registry, attribute, value)
+        patcher.start()
+        test_case.addCleanup(patcher.stop)
+    return store
+
+
+def orm_features(user):
+    """Reference implementation of the original per-query ORM feature path"""
+    six_months_ago = timezone.now() - timedelta(days=180)
+    transactions = MpesaTransaction.objects.filter(user=user, transaction_date__gte=six_months_ago)
+    total_transactions = transactions.count()
+    total_volume = transactions.aggregate(total=Sum('amount'))['total'] or 0
+    total_income = transactions.filter(
+        Q(transaction_type='B2C') | Q(transaction_type='C2C', amount__gt=0)
+    ).aggregate(total=Sum('amount'))['total'] or 0
+    total_expenses = abs(transactions.filter(
+        Q(transaction_type='C2B') | Q(transaction_type='C2C', amount__lt=0)
+    ).aggregate(total=Sum('amount'))['total'] or 0)
+    dates_series = pd.Series(transactions.values_list('transaction_date', flat=True))
+    active_days = dates_series.dt.date.nunique()
+    evening_transactions = transactions.filter(transaction_date__hour__gte=18).count()
+    weekend_transactions = transactions.filter(transaction_date__week_day__in=[1, 7]).count()
+    return {
+        'total_transactions': total_transactions,
+        'total_volume': float(total_volume),
+        'total_income': float(total_income),
+        'total_expenses': float(total_expenses),
+        'active_days': active_days,
+        'transaction_frequency': total_transactions / active_days,
+        'unique_counterparties': transactions.values('counterparty').distinct().count(),
+        'amount_std': float(transactions.aggregate(std=StdDev('amount'))['std'] or 0),
+        'evening_transactions_ratio': evening_transactions / total_transactions,
+        'weekend_transactions_ratio': weekend_transactions / total_transactions,
+        'savings_ratio': float((total_income - total_expenses) / total_income),
+        'expense_to_income_ratio': float(total_expenses / total_income),
+        'avg_transaction_amount': float(total_volume / total_transactions),
+    }
+
+
+class FeatureExtractionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(phone_number='254700000001', password='test-pass-123')
+        self.service = MLCreditScoringService()
+
+    def test_features_match_orm_path(self):
+        create_transactions(self.user, 250)
+        # Rows outside the 180-day window must be ignored by both paths
+        create_transactions(self.user, 15, start=timezone.localtime() - timedelta(days=400))
+
+        features = self.service._extract_features(self.user)
+        expected = orm_features(self.user)
+
+        self.assertEqual(list(features), FEATURE_NAMES)
+        for name in FEATURE_NAMES:
+            self.assertAlmostEqual(features[name], expected[name], places=6, msg=name)
+
+    def test_insufficient_transactions_returns_none(self):
+        create_transactions(self.user, 9)
+
+        self.assertIsNone(self.service._extract_features(self.user))
+
+
+
+class BatchScoringTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.store = use_temporary_model_store(self)
+        self.users = [
+            User.objects.create_user(phone_number=f'2547000002{i:02d}', password='test-pass-123')
+            for i in range(4)
+        ]
+        for i, user in enumerate(self.users[:3]):
+            create_transactions(user, 30 + 25 * i)
+        # Too little history to be scored
+        create_transactions(self.users[3], 5)
+
+    def assert_batch_matches_single_scores(self, model_version):
+        service = MLCreditScoringService()
+        expected = {user.id: service.calculate_score(user)[0] for user in self.users[:3]}
+
+        credit_scores = service.score_users([user.id for user in self.users])
+
+        self.assertEqual({score.user_id: score.score for score in credit_scores}, expected)
+        self.assertEqual({score.model_version for score in credit_scores}, {model_version})
+        self.assertEqual(CreditScore.objects.count(), 3)
+
+    def test_rule_based_batch_matches_single_scores(self):
+        self.assert_batch_matches_single_scores('RB_v1')
+
+    def test_model_batch_matches_single_scores(self):
+        service = MLCreditScoringService()
+        service.fit(*SyntheticCreditData(seed=8).generate(300))
+        self.assert_batch_matches_single_scores(service.model_version)
+
+    def test_scoring_invalidates_cached_scores_and_dashboards(self):
+        for user in self.users:
+            score_cache.set(user.id, {'credit_score': 50})
+            cache.set(DashboardService.cache_key(user.id), {'cached': True})
+
+        MLCreditScoringService().score_users([user.id for user in self.users[:2]])
+
+        for user in self.users[:2]:
+            self.assertIsNone(score_cache.get(user.id))
+            self.assertIsNone(cache.get(DashboardService.cache_key(user.id)))
+        self.assertEqual(score_cache.get(self.users[2].id), {'credit_score': 50})
+        self.assertEqual(cache.get(DashboardService.cache_key(self.users[2].id)), {'cached': True})
+
+    def test_command_scores_consenting_users_in_chunks(self):
+        for user in self.users:
+            UserConsent.objects.create(user=user, consent_type='MPESA_ANALYSIS', consented=user != self.users[2])
+
+        out = io.StringIO()
+        call_command('rescore_users', '--chunk-size', '2', '--dry-run', stdout=out)
+        self.assertEqual(out.getvalue().strip(), '3 users would be rescored in 2 chunks of 2')
+        self.assertFalse(CreditScore.objects.exists())
+
+        checkpoint = os.path.join(self.store.root, 'rescore.json')
+        out = io.StringIO()
+        call_command('rescore_users', '--chunk-size', '2', '--checkpoint', checkpoint, stdout=out)
+
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len([line for line in lines if line.startswith('Scored ')]), 2)
+        self.assertIn('Rescored 2 of 3 users', lines[-1])
+        self.assertCountEqual(
+            CreditScore.objects.values_list('user_id', flat=True), [self.users[0].id, self.users[1].id]
+        )
+        with open(checkpoint) as f:
+            state = json.load(f)
+        self.assertEqual((state['users_processed'], state['completed']), (3, True))
+
+        # Resuming a completed run has nothing left to score
+        out = io.StringIO()
+        call_command('rescore_users', '--checkpoint', checkpoint, '--resume', '--dry-run', stdout=out)
+        self.assertIn('0 users would be rescored', out.getvalue())
+
+    def test_command_workers_are_spawned(self):
+        from concurrent.futures import Future
+
+        for user in self.users:
+            UserConsent.objects.create(user=user, consent_type='MPESA_ANALYSIS', consented=True)
+        pools = []
+
+        class InlineExecutor:
+            """Runs submitted chunks in this process (spawned workers would not see the test database)"""
+
+            def __init__(self, **kwargs):
+                pools.append(kwargs)
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc_info):
+                return False
+
+            def submit(self, fn, *args):
+                future = Future()
+                future.set_result(fn(*args))
+                return future
+
+        with mock.patch('credit_scoring.management.commands.rescore_users.ProcessPoolExecutor', InlineExecutor):
+            call_command('rescore_users', '--chunk-size', '2', '--workers', '2', stdout=io.StringIO())
+
+        self.assertEqual(len(pools), 1)
+        self.assertEqual(pools[0]['mp_context'].get_start_method(), 'spawn')
+        self.assertEqual(CreditScore.objects.count(), 3)
+
+class ScoreCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        score_cache.reset_stats()
+        self.users = [
+            User.objects.create_user(phone_number=f'25470000010{i}', password='test-pass-123')
+            for i in range(2)
+        ]
+        for user in self.users:
+            score_cache.set(user.id, {'credit_score': 50})
+
+    def test_generation_bump_invalidates_every_score_only(self):
+        cache.set('unrelated', 'kept')
+
+        score_cache.invalidate_all()
+
+        self.assertIsNone(score_cache.get(self.users[0].id))
+        self.assertIsNone(score_cache.get(self.users[1].id))
+        self.assertEqual(cache.get('unrelated'), 'kept')
+
+    def test_new_score_and_consent_invalidate_one_user(self):
+        CreditScore.objects.create(user=self.users[0], score=70, model_version='ML_v1')
+        self.assertIsNone(score_cache.get(self.users[0].id))
+        self.assertEqual(score_cache.get(self.users[1].id), {'credit_score': 50})
+
+        UserConsent.objects.create(user=self.users[1], consent_type='MPESA_ANALYSIS', consented=False)
+        self.assertIsNone(score_cache.get(self.users[1].id))
+
+        self.assertEqual(score_cache.stats()['hits'], 1)
+        self.assertEqual(score_cache.stats()['misses'], 2)
+
+    def test_new_transactions_invalidate_score(self):
+        create_transactions(self.users[0], 12)
+        MLCreditScoringService()._extract_features(self.users[0])
+
+        self.assertIsNone(score_cache.get(self.users[0].id))
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'test_shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-shared'},
+})
+class TieredScoreCacheTests(TestCase):
+    """Two TieredCache instances over one shared tier stand in for two gunicorn workers"""
+
+    def setUp(self):
+        params = {'OPTIONS': {
+            'SHARED_CACHE': 'test_shared',
+            'L1_MAX_ENTRIES': 2,
+            'SHARED_PREFIXES': ['throttle_', 'credit_score:'],
+        }}
+        self.worker_a = TieredCache(None, params)
+        self.worker_b = TieredCache(None, params)
+        self.worker_a.clear()
+
+    def test_user_invalidation_is_seen_by_other_workers(self):
+        scores_a = ScoreCache(backend=self.worker_a)
+        scores_b = ScoreCache(backend=self.worker_b)
+
+        scores_a.set('user-1', {'credit_score': 61})
+        self.assertEqual(scores_a.get('user-1'), {'credit_score': 61})
+        self.assertEqual(scores_b.get('user-1'), {'credit_score': 61})
+
+        scores_b.invalidate('user-1')
+        self.assertIsNone(scores_a.get('user-1'))
+
+        scores_a.set('user-1', {'credit_score': 64})
+        scores_b.invalidate_all()
+        self.assertIsNone(scores_a.get('user-1'))
+
+    def test_lookups_count_per_process_without_writing_to_the_shared_tier(self):
+        scores_a = ScoreCache(backend=self.worker_a)
+        scores_b = ScoreCache(backend=self.worker_b)
+        scores_a.set('user-1', {'credit_score': 61})
+        shared = caches['test_shared']
+
+        with mock.patch.object(shared, 'set') as shared_set, \
+                mock.patch.object(shared, 'add') as shared_add, \
+                mock.patch.object(shared, 'incr') as shared_incr:
+            scores_a.get('user-1')
+            scores_a.get('user-2')
+            scores_b.get('user-1')
+
+        shared_set.assert_not_called()
+        shared_add.assert_not_called()
+        shared_incr.assert_not_called()
+        self.assertEqual((scores_a.stats()['hits'], scores_a.stats()['misses']), (1, 1))
+        self.assertEqual((scores_b.stats()['hits'], scores_b.stats()['misses']), (1, 0))
+
+    def test_shared_prefixes_skip_the_local_tier(self):
+        self.worker_a.set('throttle_user_1', [1.0])
+        self.worker_b.set('throttle_user_1', [1.0, 2.0])
+        self.assertEqual(self.worker_a.get('throttle_user_1'), [1.0, 2.0])
+
+        # Without a version key, L1 may serve a stale value until it expires
+        self.worker_a.set('profile_1', 'old')
+        self.worker_b.set('profile_1', 'new')
+        self.assertEqual(self.worker_a.get('profile_1'), 'old')
+
+    def test_local_tier_is_bounded(self):
+        for i in range(5):
+            self.worker_a.set(f'key_{i}', i)
+
+        self.assertEqual(self.worker_a.local_stats()['entries'], 2)
+        self.assertEqual(self.worker_a.get('key_0'), 0)
+        self.assertEqual(self.worker_a.get_many(['key_1', 'key_4']), {'key_1': 1, 'key_4': 4})
+
+
+class SyntheticDataTests(TestCase):
+    def test_generation_is_deterministic_and_balanced(self):
+        X, y = SyntheticCreditData(good_ratio=0.25, seed=7).generate(1000)
+        X_again, y_again = SyntheticCreditData(good_ratio=0.25, seed=7).generate(1000)
+
+        self.assertEqual(X.shape, (1000, len(FEATURE_NAMES)))
+        self.assertEqual(int(y.sum()), 250)
+        np.testing.assert_array_equal(X, X_again)
+        np.testing.assert_array_equal(y, y_again)
+
+        # Classes keep their profiles: good users transact far more often
+        self.assertGreater(X[y == 1, 0].mean(), 120)
+        self.assertLess(X[y == 0, 0].mean(), 40)
+
+    def test_correlated_draws_are_opt_in(self):
+        X, y = SyntheticCreditData(correlated=True, seed=1).generate(20000)
+        good = X[y == 1]
+        correlation = np.corrcoef(good, rowvar=False)
+
+        self.assertAlmostEqual(correlation[1, 2], 0.5, delta=0.05)
+        self.assertAlmostEqual(correlation[10, 11], -0.6, delta=0.05)
+
+        # By default features are independent, as the original generator drew them
+        X, y = SyntheticCreditData(seed=1).generate(20000)
+        self.assertAlmostEqual(np.corrcoef(X[y == 1], rowvar=False)[1, 2], 0, delta=0.05)
+
+    def test_chunks_cover_requested_rows_with_exact_balance(self):
+        chunks = list(SyntheticCreditData(good_ratio=0.6).iter_chunks(1005, chunk_size=100))
+
+        self.assertEqual(len(chunks), 11)
+        self.assertEqual(sum(len(y) for _, y in chunks), 1005)
+        self.assertEqual(sum(int(y.sum()) for _, y in chunks), 603)
+        self.assertTrue(all(X.shape[1] == len(FEATURE_NAMES) for X, _ in chunks))
+
+    def test_training_data_does_not_reseed_global_rng(self):
+        np.random.seed(3)
+        expected = np.random.random()
+        np.random.seed(3)
+        MLCreditScoringService._generate_training_data(None, 50)
+        self.assertEqual(np.random.random(), expected)
+
+
+@override_settings(TRAINING_JOB_INLINE=True)
+class TrainingJobTests(TestCase):
+    def setUp(self):
+        self.store = use_temporary_model_store(self)
+
+        self.admin = User.objects.create_user(phone_number='254700000030', password='test-pass-123', is_staff=True)
+
+    def test_job_records_progress_and_results(self):
+        job = TrainingJobService.submit(200, requested_by=self.admin)
+
+        self.assertEqual(job.status, 'SUCCEEDED')
+        self.assertEqual(job.progress, 100)
+        self.assertGreater(job.test_accuracy, 0.9)
+        self.assertEqual(job.model_version, self.store.current_version())
+        self.assertEqual(job.artifact_path, self.store.bundle_path(job.model_version))
+        self.assertIsNotNone(job.duration_ms)
+        self.assertTrue(os.path.exists(job.artifact_path))
+        self.assertEqual(model_registry.get().version, job.model_version)
+
+    def test_each_estimator_backend_trains_and_reports_progress(self):
+        for estimator in ESTIMATOR_BACKENDS:
+            with self.subTest(estimator=estimator):
+                job = TrainingJobService.submit(300, estimator=estimator)
+
+                self.assertEqual(job.status, 'SUCCEEDED', job.error)
+                self.assertEqual(job.estimator, estimator)
+                self.assertEqual(job.progress, 100)
+                self.assertGreater(job.test_accuracy, 0.9)
+
+                model = model_registry.get().model
+                importances = feature_importances(model)
+                self.assertEqual(len(importances), len(FEATURE_NAMES))
+                self.assertAlmostEqual(float(importances.sum()), 1.0, places=5)
+                # Saved artifacts carry no training callbacks
+                self.assertIsNone(getattr(model, 'callbacks', None))
+
+    def test_only_one_job_runs_at_a_time(self):
+        running = TrainingJob.objects.create(n_samples=200)
+
+        with self.assertRaises(TrainingJobConflict) as raised:
+            TrainingJobService.submit(200)
+        self.assertEqual(raised.exception.job, running)
+
+        # A job whose worker stopped sending heartbeats no longer blocks training
+        TrainingJob.objects.filter(id=running.id).update(
+            updated_at=timezone.now() - TRAINING_JOB_STALE_AFTER - timedelta(minutes=1)
+        )
+        job = TrainingJobService.submit(200)
+        running.refresh_from_db()
+        self.assertEqual(running.status, 'FAILED')
+        self.assertEqual(job.status, 'SUCCEEDED')
+
+    def test_endpoints_report_jobs(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+
+        response = client.post('/api/credit/admin/train-model/', {'training_samples': 200}, format='json')
+        self.assertEqual(response.status_code, 202)
+        job_id = response.data['job']['id']
+
+        response = client.get('/api/credit/admin/model-status/')
+        self.assertIsNone(response.data['active_job'])
+        self.assertEqual(response.data['last_job']['id'], job_id)
+        self.assertEqual(response.data['last_job']['status'], 'SUCCEEDED')
+
+        response = client.get(f'/api/credit/admin/training-jobs/{job_id}/')
+        self.assertEqual(response.data['job']['progress'], 100)
+
+        response = client.post('/api/credit/admin/train-model/', {'estimator': 'lightgbm'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ArtifactStoreTests(TestCase):
+    def setUp(self):
+        self.store = use_temporary_model_store(self)
+        self.service = MLCreditScoringService()
+
+    def train(self, n_samples):
+        self.service.fit(*SyntheticCreditData(seed=n_samples).generate(n_samples))
+        return self.service.model_version
+
+    def test_bundle_is_content_addressed_and_promoted_atomically(self):
+        version = self.train(200)
+
+        manifest = self.store.manifest(version)
+        self.assertTrue(manifest['sha256'].startswith(version))
+        self.assertEqual(manifest['feature_names'], FEATURE_NAMES)
+        self.assertEqual(manifest['training_rows'], 200)
+        self.assertIn('test_accuracy', manifest['metrics'])
+        self.assertEqual(self.store.current_version(), version)
+
+        entry = model_registry.get()
+        self.assertEqual(entry.version, version)
+        # Arrays come straight from the bundle file instead of private copies
+        self.assertIsInstance(entry.scaler.mean_, np.memmap)
+        self.assertEqual(entry.model.predict_proba(entry.scaler.transform(np.ones((1, len(FEATURE_NAMES))))).shape, (1, 2))
+
+    def test_promoting_an_older_version_rolls_back(self):
+        first = self.train(200)
+        second = self.train(300)
+        self.assertNotEqual(first, second)
+        self.assertEqual(model_registry.get().version, second)
+
+        self.store.promote(first)
+        self.assertEqual(model_registry.get().version, first)
+        self.assertEqual([m['version'] for m in self.store.versions()], [second, first])
+
+        with self.assertRaises(ValueError):
+            self.store.remove(first)
+        with self.assertRaises(ValueError):
+            self.store.promote('0' * 12)
+
+    def test_scores_record_the_artifact_version(self):
+        version = self.train(200)
+        user = User.objects.create_user(phone_number='254700000040', password='test-pass-123')
+        create_transactions(user, 40)
+
+        credit_scores = MLCreditScoringService().score_users([user.id])
+
+        self.assertEqual([score.model_version for score in credit_scores], [version])
+
+    def test_model_trained_on_other_features_is_not_used(self):
+        self.store.promote(self.store.save(self.service.model, self.service.scaler, {'feature_names': ['income']}))
+
+        self.assertIsNone(MLCreditScoringService().model)
+
+
+
+class ModelRegistryTests(TestCase):
+    def setUp(self):
+        self.store = use_temporary_model_store(self)
+        self.registry = ModelRegistry(self.store)
+
+    def save(self, seed):
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.preprocessing import StandardScaler
+
+        X, y = SyntheticCreditData(seed=seed).generate(100)
+        scaler = StandardScaler().fit(X)
+        model = LogisticRegression().fit(scaler.transform(X), y)
+        return self.store.save(model, scaler, {'feature_names': FEATURE_NAMES})
+
+    def test_nothing_promoted(self):
+        self.assertIsNone(self.registry.get())
+        self.assertFalse(self.registry.status()['model_loaded'])
+        self.assertEqual(self.registry.loads, 0)
+
+    def test_bundle_is_loaded_once_per_process(self):
+        version = self.save(1)
+        self.store.promote(version)
+
+        entries = {id(self.registry.get()) for _ in range(5)}
+
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(self.registry.loads, 1)
+        status = self.registry.status()
+        self.assertEqual((status['model_version'], status['promoted_version']), (version, version))
+        self.assertTrue(status['model_loaded'] and status['scaler_loaded'])
+
+        # Rewriting the pointer with the same version does not load it again
+        self.store.promote(version)
+        self.assertEqual(self.registry.get().version, version)
+        self.assertEqual(self.registry.loads, 1)
+
+    def test_model_and_scaler_swap_together(self):
+        first, second = self.save(1), self.save(2)
+        self.store.promote(first)
+        old = self.registry.get()
+
+        self.store.promote(second)
+        new = self.registry.get()
+
+        self.assertEqual(new.version, second)
+        self.assertIsNot(new.model, old.model)
+        self.assertIsNot(new.scaler, old.scaler)
+        self.assertFalse(np.array_equal(new.scaler.mean_, old.scaler.mean_))
+        # The old entry is untouched, so a request already holding it keeps a consistent pair
+        self.assertEqual(old.version, first)
+        self.assertEqual(self.registry.loads, 2)
+
+    def test_unreadable_bundle_keeps_the_loaded_model(self):
+        first, second = self.save(1), self.save(2)
+        self.store.promote(first)
+        self.registry.get()
+
+        with open(self.store.bundle_path(second), 'wb') as f:
+            f.write(b'not a bundle')
+        self.store.promote(second)
+
+        self.assertEqual(self.registry.get().version, first)
+
+    def test_removed_pointer_drops_the_model(self):
+        self.store.promote(self.save(1))
+        self.registry.get()
+
+        os.remove(self.store.pointer_path)
+
+        self.assertIsNone(self.registry.get())
+        self.assertIsNone(self.registry.status()['model_version'])
+
+class CompiledModelTests(TestCase):
+    def fit(self, estimator):
+        from sklearn.preprocessing import StandardScaler
+
+        X, y = SyntheticCreditData(seed=3).generate(600)
+        # Overlapping classes, so probabilities spread out instead of saturating
+        y[::7] = 1 - y[::7]
+        scaler = StandardScaler().fit(X)
+        backend = get_backend(estimator)
+        model = backend.fit(backend.build(), scaler.transform(X), y)
+        return model, scaler
+
+    def assert_same_probabilities(self, model, scaler, compiled, X):
+        np.testing.assert_array_equal(compiled.predict_proba(X), model.predict_proba(scaler.transform(X)))
+
+    def test_compiled_trees_match_predict_proba(self):
+        X_eval, _ = SyntheticCreditData(seed=11).generate(2000)
+        for estimator in ['gbm', 'hist']:
+            with self.subTest(estimator=estimator):
+                model, scaler = self.fit(estimator)
+                compiled = compile_model(model, scaler)
+
+                self.assert_same_probabilities(model, scaler, compiled, X_eval)
+
+                # Rows sitting exactly on each folded threshold and one float above it
+                is_split = compiled.left != np.arange(len(compiled.left))
+                features = compiled.feature[is_split]
+                thresholds = compiled.threshold[is_split]
+                rows = np.arange(len(thresholds))
+                at = np.repeat(X_eval[:1], len(thresholds), axis=0)
+                above = at.copy()
+                at[rows, features] = thresholds
+                above[rows, features] = np.nextafter(thresholds, np.inf)
+                self.assert_same_probabilities(model, scaler, compiled, at)
+                self.assert_same_probabilities(model, scaler, compiled, above)
+
+    def test_contributions_add_up_to_the_log_odds(self):
+        X_eval, _ = SyntheticCreditData(seed=12).generate(200)
+        for estimator in ['gbm', 'hist']:
+            with self.subTest(estimator=estimator):
+                compiled = compile_model(*self.fit(estimator))
+
+                contributions = compiled.predict_contributions(X_eval)
+
+                self.assertEqual(contributions.shape, (200, len(FEATURE_NAMES) + 1))
+                np.testing.assert_allclose(contributions.sum(axis=1), compiled.decision_function(X_eval), atol=1e-9)
+                # The bias is the same for every row; the features' shares are not
+                self.assertEqual(len(set(contributions[:, -1])), 1)
+                self.assertGreater(np.ptp(contributions[:, :-1], axis=0).min(), 0)
+
+    def test_reasoning_follows_each_applicants_contributions(self):
+        use_temporary_model_store(self)
+        for estimator in ESTIMATOR_BACKENDS:
+            with self.subTest(estimator=estimator):
+                service = MLCreditScoringService()
+                X, y = SyntheticCreditData(seed=8).generate(300)
+                service.fit(X, y, estimator=estimator)
+
+                contributions = service._feature_contributions(X[:20])
+                self.assertEqual(contributions.shape, (20, len(FEATURE_NAMES) + 1))
+
+                good, poor = X[y == 1][:1], X[y == 0][:1]
+                good_reasoning = service._generate_ml_reasoning(service._feature_contributions(good))
+                poor_reasoning = service._generate_ml_reasoning(service._feature_contributions(poor))
+                raised = {phrase for phrase, _ in REASON_PHRASES.values()}
+                lowered = {phrase for _, phrase in REASON_PHRASES.values()}
+                self.assertTrue(set(good_reasoning.split(' | ')) <= raised, good_reasoning)
+                self.assertTrue(set(poor_reasoning.split(' | ')) <= lowered, poor_reasoning)
+
+    def test_unsupported_models_are_not_compiled(self):
+        self.assertIsNone(compile_model(object()))
+
+    def test_service_scores_with_the_compiled_model(self):
+        store = use_temporary_model_store(self)
+        service = MLCreditScoringService()
+        service.fit(*SyntheticCreditData(seed=5).generate(300), estimator='hist')
+
+        entry = model_registry.get()
+        self.assertIsNotNone(entry.compiled)
+        self.assertTrue(store.manifest(entry.version)['compiled'])
+        X, _ = SyntheticCreditData(seed=6).generate(20)
+        np.testing.assert_array_equal(
+            MLCreditScoringService()._probability_good(X),
+            entry.model.predict_proba(entry.scaler.transform(X))[:, 1]
+        )
+
+        # Bundles stored without a compiled model are compiled when loaded
+        store.promote(store.save(entry.model, entry.scaler, {'feature_names': FEATURE_NAMES}))
+        self.assertIsNotNone(model_registry.get().compiled)
+
+    def test_training_survives_a_compile_failure(self):
+        store = use_temporary_model_store(self)
+        service = MLCreditScoringService()
+
+        with mock.patch('credit_scoring.compiled.compile_model', side_effect=ValueError('unsupported tree')):
+            service.fit(*SyntheticCreditData(seed=5).generate(300), estimator='hist')
+            entry = model_registry.get()
+
+        self.assertIsNone(service.compiled)
+        self.assertFalse(store.manifest(service.model_version)['compiled'])
+        self.assertEqual(entry.version, service.model_version)
+        self.assertIsNone(entry.compiled)
+        X, _ = SyntheticCreditData(seed=6).generate(20)
+        np.testing.assert_array_equal(
+            MLCreditScoringService()._probability_good(X),
+            entry.model.predict_proba(entry.scaler.transform(X))[:, 1]
+        )
+
+
+class LazyImportTests(SimpleTestCase):
+    def test_boot_and_non_scoring_apps_do_not_import_ml_stack(self):
+        code = (
+            'import sys, django; django.setup(); '
+            'from django.urls import get_resolver; get_resolver().url_patterns; '
+            'import users.services, loans.services, mpesa.services, credit_scoring.training; '
+            "print(','.join(sorted(m for m in ('numpy', 'pandas', 'sklearn', 'scipy', 'joblib', 'xgboost') if m in sys.modules)))"
+        )
+        result = subprocess.run(
+            [sys.executable, '-c', code],
+            cwd=settings.BASE_DIR,
+            env=dict(os.environ, DJANGO_SETTINGS_MODULE='ubuntu_core.settings'),
+            capture_output=True, text=True
+        )
+
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), '')
+
+    def test_worker_entry_points_import_before_django_setup(self):
+        # What a spawned pool worker does before its initializer runs
+        code = (
+            'from credit_scoring.workers import init_worker, run_training_job, score_chunk; '
+            'init_worker(); import credit_scoring.training'
+        )
+        result = subprocess.run(
+            [sys.executable, '-c', code],
+            cwd=settings.BASE_DIR,
+            env=dict(os.environ, DJANGO_SETTINGS_MODULE='ubuntu_core.settings'),
+            capture_output=True, text=True
+        )
+
+        self.assertEqual(result.returncode, 0, result.stderr)
@@ -0,0 +1,199 @@
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import TrainingJob
+from .estimators import DEFAULT_ESTIMATOR, TRAINING_ESTIMATORS
+from .services import MLCreditScoringService
+from .workers import init_worker, run_training_job
+
+logger = logging.getLogger(__name__)
+
+# A running job whose heartbeat is older than this is assumed dead
+TRAINING_JOB_STALE_AFTER = timedelta(minutes=30)
+
+# Minimum seconds between progress writes during boosting
+PROGRESS_INTERVAL = 2
+
+class TrainingJobConflict(Exception):
+    """Raised when a training job is submitted while another one is running"""
+    
+    def __init__(self, job):
+        super().__init__('A training job is already running')
+        self.job = job
+
+class _ProgressMonitor:
+    """
+    GradientBoostingClassifier monitor that records progress after boosting stages
+    """
+    
+    def __init__(self, job_id, start, end):
+        self.job_id = job_id
+        self.start = start
+        self.end = end
+        self.last_write = time.monotonic()
+    
+    def __call__(self, stage, estimator, local_vars):
+        done = stage + 1
+        if done == TRAINING_ESTIMATORS or time.monotonic() - self.last_write >= PROGRESS_INTERVAL:
+            progress = self.start + (self.end - self.start) * done // TRAINING_ESTIMATORS
+            TrainingJobService.update_progress(self.job_id, progress, f'boosting stage {done}/{TRAINING_ESTIMATORS}')
+            self.last_write = time.monotonic()
+        # Returning True would stop training early
+        return False
+
+class TrainingJobService:
+    """
+    Runs model training in a background process and records it as a TrainingJob
+    Only one job runs at a time across all workers (enforced by a partial unique constraint)
+    """
+    
+    _executor = None
+    _executor_lock = threading.Lock()
+    
+    @staticmethod
+    def active_job():
+        return TrainingJob.objects.filter(status='RUNNING').first()
+    
+    @staticmethod
+    def last_job():
+        """Most recently finished job, successful or not"""
+        return TrainingJob.objects.exclude(status='RUNNING').order_by('-finished_at').first()
+    
+    @staticmethod
+    def expire_stale_jobs():
+        """Fail running jobs whose heartbeat is stale, so a crashed worker cannot block training"""
+        now = timezone.now()
+        expired = TrainingJob.objects.filter(
+            status='RUNNING',
+            updated_at__lt=now - TRAINING_JOB_STALE_AFTER
+        ).update(
+            status='FAILED',
+            error='Training worker stopped responding',
+            finished_at=now,
+            updated_at=now
+        )
+        if expired:
+            logger.warning(f"Marked {expired} stale training job(s) as failed")
+        return expired
+    
+    @classmethod
+    def submit(cls, n_samples, requested_by=None, estimator=DEFAULT_ESTIMATOR):
+        """
+        Record a new job and start it in the background pool
+        Raises TrainingJobConflict if another job is still running
+        """
+        cls.expire_stale_jobs()
+        try:
+            with transaction.atomic():
+                job = TrainingJob.objects.create(
+                    n_samples=n_samples,
+                    estimator=estimator,
+                    requested_by=requested_by,
+                    stage='queued'
+                )
+        except IntegrityError:
+            raise TrainingJobConflict(cls.active_job())
+        
+        if getattr(settings, 'TRAINING_JOB_INLINE', False):
+            cls.run(job.id)
+        else:
+            try:
+                cls._submit_to_pool(job.id)
+            except Exception as e:
+                cls._finish(job.id, 'FAILED', error=f'Could not start training worker: {str(e)}')
+                raise
+        
+        job.refresh_from_db()
+        return job
+    
+    @staticmethod
+    def run(job_id):
+        """Train the model for a job, recording progress and the outcome"""
+        job = TrainingJob.objects.get(id=job_id)
+        started = time.monotonic()
+        try:
+            service = MLCreditScoringService()
+            TrainingJobService.update_progress(job_id, 5, 'generating data')
+            X, y = service._generate_training_data(job.n_samples)
+            
+            TrainingJobService.update_progress(job_id, 10, 'fitting')
+            train_accuracy, test_accuracy = service.fit(
+                X, y,
+                monitor=_ProgressMonitor(job_id, 10, 95),
+                estimator=job.estimator
+            )
+        except Exception as e:
+            logger.error(f"Training job {job_id} failed: {str(e)}")
+            TrainingJobService._finish(job_id, 'FAILED', started=started, error=str(e))
+            return
+        
+        TrainingJobService._finish(
+            job_id, 'SUCCEEDED',
+            started=started,
+            progress=100,
+            train_accuracy=train_accuracy,
+            test_accuracy=test_accuracy,
+            model_version=service.model_version,
+            artifact_path=service.registry.store.bundle_path(service.model_version)
+        )
+        logger.info(f"Training job {job_id} finished in {time.monotonic() - started:.1f}s")
+    
+    @staticmethod
+    def update_progress(job_id, progress, stage):
+        TrainingJob.objects.filter(id=job_id, status='RUNNING').update(
+            progress=progress,
+            stage=stage,
+            updated_at=timezone.now()
+        )
+    
+    @staticmethod
+    def _finish(job_id, status, started=None, **fields):
+        now = timezone.now()
+        if started is not None:
+            fields['duration_ms'] = int((time.monotonic() - started) * 1000)
+        TrainingJob.objects.filter(id=job_id).update(
+            status=status,
+            stage=status.lower(),
+            finished_at=now,
+            updated_at=now,
+            **fields
+        )
+    
+    @classmethod
+    def _submit_to_pool(cls, job_id):
+        with cls._executor_lock:
+            if cls._executor is None:
+                cls._executor = cls._new_executor()
+            try:
+                future = cls._executor.submit(run_training_job, job_id)
+            except BrokenProcessPool:
+                # The previous worker died; start a fresh pool once
+                cls._executor = cls._new_executor()
+                future = cls._executor.submit(run_training_job, job_id)
+        future.add_done_callback(lambda f: cls._job_done(job_id, f))
+    
+    @staticmethod
+    def _job_done(job_id, future):
+        """Fail the job if the pool itself broke (training errors are recorded by run())"""
+        error = future.exception()
+        if error is not None:
+            logger.error(f"Training worker for job {job_id} crashed: {str(error)}")
+            TrainingJobService._finish(job_id, 'FAILED', error=f'Training worker crashed: {str(error)}')
+    
+    @staticmethod
+    def _new_executor():
+        # spawn, not fork: the child must not share the web worker's DB connections
+        return ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_worker
+        )
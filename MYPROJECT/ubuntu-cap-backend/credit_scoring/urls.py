@@ -17,6 +17,7 @@ urlpatterns = [
     # ML Model Management (Admin endpoints)
     path('admin/train-model/', views.train_ml_model, name='train-ml-model'),
     path('admin/model-status/', views.ml_model_status, name='ml-model-status'),
+    path('admin/training-jobs/<uuid:job_id>/', views.training_job_status, name='training-job-status'),
     path('admin/clear-cache/', views.clear_credit_cache, name='clear-credit-cache'),
     
     # Health Check & System Status
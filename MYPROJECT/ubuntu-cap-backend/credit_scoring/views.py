@@ -6,11 +6,15 @@ from rest_framework.throttling import UserRateThrottle
 from django.utils import timezone
 from datetime import timedelta
 from django.core.cache import cache
-from django.db.models import Avg, Max, Count
-from .models import CreditScore, LoanOffer
+from django.db.models import Avg, Max, Count, Sum
+from .models import CreditScore, LoanOffer, TrainingJob
+from .estimators import DEFAULT_ESTIMATOR, ESTIMATOR_BACKENDS
 from users.models import UserConsent
 from .services import MLCreditScoringService
-from .serializers import CreditScoreSerializer, LoanOfferSerializer
+from .registry import model_registry
+from .score_cache import score_cache
+from .serializers import CreditScoreSerializer, LoanOfferSerializer, TrainingJobSerializer
+from .training import TrainingJobService, TrainingJobConflict
 import logging
 
 logger = logging.getLogger(__name__)
@@ -37,6 +41,10 @@ class ModelTrainingSerializer(serializers.Serializer):
         default=1000
     )
     retrain_existing = serializers.BooleanField(default=True)
+    estimator = serializers.ChoiceField(
+        choices=list(ESTIMATOR_BACKENDS),
+        default=DEFAULT_ESTIMATOR
+    )
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -60,9 +68,8 @@ def calculate_credit_score(request):
         model_preference = serializer.validated_data['model_preference']
         
         # Check cache first (unless force refresh)
-        cache_key = f'credit_score_{user.id}'
         if not force_refresh:
-            cached_result = cache.get(cache_key)
+            cached_result = score_cache.get(user.id)
             if cached_result:
                 logger.info(f"Returning cached credit score for user {user.id}")
                 return Response(cached_result)
@@ -107,7 +114,7 @@ def calculate_credit_score(request):
         credit_score = CreditScore.objects.create(
             user=user,
             score=score,
-            model_version='ML_v1' if model_preference == 'ml' else 'RB_v1',
+            model_version=ml_service.model_version if model_type == 'Machine Learning' else 'RB_v1',
             calculation_method=model_type
         )
         
@@ -136,7 +143,7 @@ def calculate_credit_score(request):
             response_data['message'] = 'No loan offer available based on your credit score'
         
         # Cache the result for 24 hours
-        cache.set(cache_key, response_data, 86400)
+        score_cache.set(user.id, response_data)
         
         logger.info(f"Credit score calculated for user {user.id}: {score}")
         return Response(response_data)
@@ -202,6 +209,7 @@ def train_ml_model(request):
         
         training_samples = serializer.validated_data['training_samples']
         retrain_existing = serializer.validated_data['retrain_existing']
+        estimator = serializer.validated_data['estimator']
         
         ml_service = MLCreditScoringService()
         
@@ -212,23 +220,26 @@ def train_ml_model(request):
                 'message': 'Model already exists. Use retrain_existing=True to force retraining.'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Train with custom sample size
-        train_accuracy, test_accuracy = ml_service.train_model(
-            training_data=None,  # Using synthetic data
-            n_samples=training_samples
-        )
-        
-        # Clear all cached credit scores since model has been updated
-        clear_credit_score_cache()
+        # Train with custom sample size in the background; poll the job for progress
+        try:
+            job = TrainingJobService.submit(
+                training_samples,
+                requested_by=request.user,
+                estimator=estimator
+            )
+        except TrainingJobConflict as e:
+            return Response({
+                'success': False,
+                'message': 'A training job is already running',
+                'active_job': TrainingJobSerializer(e.job).data if e.job else None
+            }, status=status.HTTP_409_CONFLICT)
         
         return Response({
             'success': True,
-            'message': 'ML model trained successfully',
+            'message': 'ML model training started',
             'training_samples': training_samples,
-            'train_accuracy': round(train_accuracy, 3),
-            'test_accuracy': round(test_accuracy, 3),
-            'model_updated': timezone.now().isoformat()
-        })
+            'job': TrainingJobSerializer(job).data
+        }, status=status.HTTP_202_ACCEPTED)
         
     except Exception as e:
         logger.error(f"Error training ML model: {str(e)}")
@@ -463,29 +474,22 @@ def ml_model_status(request):
     Get ML model status and performance metrics
     """
     try:
-        ml_service = MLCreditScoringService()
-        
-        model_info = {
-            'model_loaded': ml_service.model is not None,
-            'model_type': type(ml_service.model).__name__ if ml_service.model else 'None',
-            'scaler_loaded': ml_service.scaler is not None,
-            'last_training_date': 'N/A',  # You might want to store this in your model
-        }
-        
-        # Add file existence info
-        import os
-        model_exists = os.path.exists(ml_service.model_path)
-        scaler_exists = os.path.exists(ml_service.scaler_path)
-        
+        model_info = model_registry.status()
+        last_trained = TrainingJob.objects.filter(status='SUCCEEDED').order_by('-finished_at').first()
         model_info.update({
-            'model_file_exists': model_exists,
-            'scaler_file_exists': scaler_exists,
-            'model_path': ml_service.model_path if model_exists else 'Not found',
+            'last_training_date': last_trained.finished_at.isoformat() if last_trained else 'N/A',
+            'model_path': model_info['artifact_path'] or 'Not found',
+            'available_versions': [manifest['version'] for manifest in model_registry.store.versions()],
         })
         
+        active_job = TrainingJobService.active_job()
+        last_job = TrainingJobService.last_job()
+        
         return Response({
             'success': True,
-            'model_status': model_info
+            'model_status': model_info,
+            'active_job': TrainingJobSerializer(active_job).data if active_job else None,
+            'last_job': TrainingJobSerializer(last_job).data if last_job else None
         })
         
     except Exception as e:
@@ -495,6 +499,25 @@ def ml_model_status(request):
             'message': 'Error getting model status'
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def training_job_status(request, job_id):
+    """
+    Get progress and results of a model training job (admin endpoint)
+    """
+    try:
+        job = TrainingJob.objects.get(id=job_id)
+    except TrainingJob.DoesNotExist:
+        return Response({
+            'success': False,
+            'message': 'Training job not found'
+        }, status=status.HTTP_404_NOT_FOUND)
+    
+    return Response({
+        'success': True,
+        'job': TrainingJobSerializer(job).data
+    })
+
 @api_view(['POST'])
 @permission_classes([IsAdminUser])
 def clear_credit_cache(request):
@@ -502,15 +525,15 @@ def clear_credit_cache(request):
     Clear credit score cache (admin endpoint)
     """
     try:
-        # Get cache keys pattern (adjust based on your cache implementation)
-        from django.core.cache import cache
-        cache.clear()  # This clears entire cache - use more targeted approach in production
+        # Only credit score entries are dropped; sessions and throttles are untouched
+        generation = score_cache.invalidate_all()
         
         logger.info("Credit score cache cleared by admin")
         
         return Response({
             'success': True,
-            'message': 'Credit score cache cleared successfully'
+            'message': 'Credit score cache cleared successfully',
+            'cache_generation': generation
         })
         
     except Exception as e:
@@ -536,11 +559,11 @@ def health_check(request):
             cursor.execute("SELECT 1")
         
         # Model availability check
-        ml_service = MLCreditScoringService()
+        model_entry = model_registry.get()
         
         health_status = {
             'database': 'healthy',
-            'ml_model_loaded': ml_service.model is not None,
+            'ml_model_loaded': model_entry is not None,
             'total_users': 'N/A',  # Add your user model import if needed
             'service': 'operational',
             'timestamp': timezone.now().isoformat()
@@ -583,7 +606,7 @@ def system_status(request):
         cache_working = cache.get(cache_test_key) == 'test_value'
         
         # ML Service status
-        ml_service = MLCreditScoringService()
+        model_info = model_registry.status()
         
         system_status = {
             'database': {
@@ -594,12 +617,16 @@ def system_status(request):
             },
             'cache': {
                 'status': 'working' if cache_working else 'failing',
-                'backend': str(cache.__class__.__name__)
+                'backend': str(cache.__class__.__name__),
+                'local_tier': cache.local_stats() if hasattr(cache, 'local_stats') else None,
+                'credit_scores': score_cache.stats()
             },
             'ml_service': {
-                'model_loaded': ml_service.model is not None,
-                'model_type': type(ml_service.model).__name__ if ml_service.model else 'None',
-                'scaler_loaded': ml_service.scaler is not None
+                'model_loaded': model_info['model_loaded'],
+                'model_type': model_info['model_type'],
+                'scaler_loaded': model_info['scaler_loaded'],
+                'model_version': model_info['model_version'],
+                'loaded_at': model_info['loaded_at']
             },
             'system': {
                 'current_time': timezone.now().isoformat(),
@@ -626,22 +653,23 @@ def generate_loan_offer(user, credit_score):
     Generate sophisticated loan offer based on ML credit score and user's financial profile
     """
     try:
-        # Get user's financial history for personalized offers
-        from mpesa.models import MpesaTransaction
-        six_months_ago = timezone.now() - timedelta(days=180)
+        # Get user's financial history for personalized offers from the daily rollups
+        from mpesa.models import MpesaDailyRollup
+        from mpesa.services import TransactionRollupService
+        TransactionRollupService.refresh_stale([user.id])
         
-        income_data = MpesaTransaction.objects.filter(
+        income_data = MpesaDailyRollup.objects.filter(
             user=user,
-            transaction_date__gte=six_months_ago,
-            transaction_type__in=['B2C', 'C2C'],
-            amount__gt=0
+            day__gte=TransactionRollupService.window_start(180),
+            transaction_type__in=['B2C', 'C2C']
         ).aggregate(
-            avg_income=Avg('amount'),
-            total_income=Sum('amount')
+            income_count=Sum('credit_count'),
+            total_income=Sum('credit_sum')
         )
         
-        avg_monthly_income = (income_data['avg_income'] or 0) * 4.33  # Weekly to monthly approx
         total_income = income_data['total_income'] or 0
+        avg_income = total_income / income_data['income_count'] if income_data['income_count'] else 0
+        avg_monthly_income = float(avg_income) * 4.33  # Weekly to monthly approx
         
         # Dynamic offer calculation based on score and income
         if credit_score.score >= 80:
@@ -751,10 +779,3 @@ def calculate_score_trend(scores_queryset):
             return 'declining'
     
     return 'stable'
-
-def clear_credit_score_cache():
-    """Clear all cached credit score results"""
-    from django.core.cache import cache
-    # In a real implementation, you might want to be more specific
-    # about which cache keys to clear
-    logger.info("Clearing credit score cache due to model update")
\ No newline at end of file
@@ -0,0 +1,20 @@
+# Entry points for spawned worker processes. A spawned process imports this module
+# before init_worker() has set Django up, so models and services are imported inside the tasks.
+
+import django
+
+def init_worker():
+    """Configure Django in a spawned worker process"""
+    django.setup()
+
+def score_chunk(user_ids):
+    """Score one chunk of users and return how many scores were written"""
+    from .services import MLCreditScoringService
+    
+    return len(MLCreditScoringService().score_users(user_ids))
+
+def run_training_job(job_id):
+    """Run one queued model training job"""
+    from .training import TrainingJobService
+    
+    TrainingJobService.run(job_id)
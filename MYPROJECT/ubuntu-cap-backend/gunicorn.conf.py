@@ -0,0 +1,66 @@
+"""
+Gunicorn settings for the UbuntuCap backend
+
+    gunicorn -c gunicorn.conf.py ubuntu_core.wsgi:application
+
+The app is preloaded in the master, which also imports every view and
+the ML stack (numpy, pandas, scikit-learn; the app itself imports them
+lazily) and loads the promoted credit model before forking. Workers
+then share those pages copy-on-write instead of each importing the
+libraries and loading the model again.
+gc.freeze() keeps the garbage collector in the workers from touching
+(and so copying) the preloaded objects.
+
+Settings come from the environment:
+    PORT / GUNICORN_BIND     address to listen on (default 0.0.0.0:$PORT, port 8000)
+    WEB_CONCURRENCY          worker processes (default 2)
+    GUNICORN_THREADS         threads per worker; above 1 uses gthread workers (default 1)
+    GUNICORN_MAX_REQUESTS    requests before a worker is recycled, 0 to disable (default 1000)
+    GUNICORN_TIMEOUT         seconds before a silent worker is killed (default 30)
+    GUNICORN_PRELOAD         set to 0 to load the app in each worker instead
+"""
+import gc
+import os
+import time
+
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+worker_class = 'gthread' if threads > 1 else 'sync'
+
+# Recycle workers now and then to bound slow leaks; jitter avoids restarting them all at once
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = max_requests // 10
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') != '0'
+
+accesslog = '-'
+errorlog = '-'
+
+
+def when_ready(server):
+    """Runs in the master after the app is preloaded and before workers are forked"""
+    if not preload_app:
+        return
+
+    started = time.monotonic()
+    from django.db import connections
+    from django.urls import get_resolver
+    from credit_scoring.registry import model_registry
+    from credit_scoring.services import import_ml_stack
+
+    # Import every view module and the lazily imported ML stack now rather than on each worker's first request
+    get_resolver().url_patterns
+    import_ml_stack()
+    entry = model_registry.get()
+
+    # Workers must open their own database connections
+    connections.close_all()
+
+    gc.collect()
+    gc.freeze()
+    server.log.info(
+        f"Preloaded app in {time.monotonic() - started:.2f}s "
+        f"(model version {entry.version if entry else 'none'})"
+    )
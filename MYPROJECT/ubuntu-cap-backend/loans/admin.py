@@ -1,12 +1,12 @@
 from django.contrib import admin
-from .models import Loan, Repayment, LoanApplication
+from .models import Loan, Repayment, LoanApplication, OverdueSweepRun, DisbursementBatch
 
 @admin.register(Loan)
 class LoanAdmin(admin.ModelAdmin):
-    list_display = ['id', 'user', 'principal_amount', 'interest_rate', 'status', 'created_at', 'due_date']
+    list_display = ['id', 'user', 'principal_amount', 'interest_rate', 'total_repaid', 'status', 'created_at', 'due_date']
     list_filter = ['status', 'created_at']
     search_fields = ['user__phone_number', 'id']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['total_repaid', 'created_at', 'updated_at']
     list_per_page = 20
 
 @admin.register(Repayment)
@@ -21,4 +21,16 @@ class LoanApplicationAdmin(admin.ModelAdmin):
     list_display = ['id', 'user', 'requested_amount', 'status', 'created_at']
     list_filter = ['status', 'created_at']
     search_fields = ['user__phone_number', 'id']
-    readonly_fields = ['created_at', 'updated_at']
\ No newline at end of file
+    readonly_fields = ['created_at', 'updated_at']
+
+@admin.register(OverdueSweepRun)
+class OverdueSweepRunAdmin(admin.ModelAdmin):
+    list_display = ['started_at', 'triggered_by', 'loans_marked', 'duration_ms']
+    list_filter = ['triggered_by', 'started_at']
+    readonly_fields = ['started_at', 'finished_at', 'cutoff']
+
+@admin.register(DisbursementBatch)
+class DisbursementBatchAdmin(admin.ModelAdmin):
+    list_display = ['started_at', 'triggered_by', 'payout_client', 'loans_claimed', 'loans_disbursed', 'loans_failed', 'loans_unknown', 'duration_ms']
+    list_filter = ['triggered_by', 'payout_client', 'started_at']
+    readonly_fields = ['started_at', 'finished_at', 'failures']
@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from loans.models import Loan
+from loans.services import DISBURSEMENT_BATCH_SIZE, DisbursementService
+from mpesa.payouts import get_payout_client
+
+
+class Command(BaseCommand):
+    help = 'Pay out all approved loans in batches through the payout client'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=DISBURSEMENT_BATCH_SIZE,
+            help=f'Loans claimed and paid out per batch (default: {DISBURSEMENT_BATCH_SIZE})'
+        )
+        parser.add_argument(
+            '--client',
+            help='Payout client to use instead of settings.PAYOUT_CLIENT (e.g. fake)'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        try:
+            client = get_payout_client(options['client'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        stuck = Loan.objects.filter(status='DISBURSING').count()
+        if stuck:
+            self.stdout.write(self.style.WARNING(
+                f'{stuck} loans are DISBURSING with an unknown or unfinished payout; '
+                f'check their payouts with the provider before returning them to APPROVED'
+            ))
+
+        started = time.monotonic()
+        total = {'claimed': 0, 'disbursed': 0, 'failed': 0, 'unknown': 0}
+        for number, batch in enumerate(DisbursementService.run(batch_size=options['batch_size'], client=client), 1):
+            total['claimed'] += batch.loans_claimed
+            total['disbursed'] += batch.loans_disbursed
+            total['failed'] += batch.loans_failed
+            total['unknown'] += batch.loans_unknown
+            self.stdout.write(
+                f'Batch {number}: disbursed {batch.loans_disbursed} of {batch.loans_claimed} loans '
+                f'(KES {batch.amount_disbursed}) in {batch.duration_ms}ms, '
+                f'{batch.loans_per_second} loans/sec, {batch.loans_failed} failed, {batch.loans_unknown} unknown'
+            )
+            if options['verbosity'] > 1:
+                for failure in batch.failures:
+                    self.stdout.write(f"  {failure['loan_id']} ({failure['outcome']}): {failure['error']}")
+
+        elapsed = time.monotonic() - started
+        rate = total['claimed'] / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {total['disbursed']} of {total['claimed']} loans disbursed through {client.name} "
+            f"in {elapsed:.1f}s ({rate:.1f} loans/sec), {total['failed']} failed"
+        ))
+        if total['unknown']:
+            self.stdout.write(self.style.ERROR(
+                f"{total['unknown']} payouts have an unknown outcome; those loans stay DISBURSING for reconciliation"
+            ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from loans.services import LoanService
+
+
+class Command(BaseCommand):
+    help = 'Mark disbursed and active loans past their due date as overdue (schedule e.g. hourly)'
+
+    def handle(self, *args, **options):
+        loan_ids, run = LoanService.check_overdue_loans(triggered_by='COMMAND')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Marked {len(loan_ids)} loans overdue in {run.duration_ms}ms'
+        ))
+        if options['verbosity'] > 1:
+            for loan_id in loan_ids:
+                self.stdout.write(f'  {loan_id}')
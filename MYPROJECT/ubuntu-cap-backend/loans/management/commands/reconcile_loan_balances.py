@@ -0,0 +1,52 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+
+from loans.models import Loan
+from users.services import DashboardService
+
+
+class Command(BaseCommand):
+    help = 'Check Loan.total_repaid against the sum of completed repayments'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix', action='store_true',
+            help='Overwrite mismatched totals with the aggregated value'
+        )
+
+    def handle(self, *args, **options):
+        loans = Loan.objects.annotate(
+            repaid_sum=Coalesce(
+                Sum('repayments__amount', filter=Q(repayments__status='COMPLETED')),
+                Value(Decimal('0.00')),
+                output_field=DecimalField(max_digits=10, decimal_places=2)
+            )
+        ).exclude(repaid_sum=F('total_repaid'))
+
+        mismatched = 0
+        for loan in loans.only('id', 'total_repaid').iterator():
+            mismatched += 1
+            self.stdout.write(self.style.WARNING(
+                f'Loan {loan.id}: total_repaid={loan.total_repaid}, repayments sum={loan.repaid_sum}'
+            ))
+            if options['fix']:
+                self._fix(loan.id)
+
+        if not mismatched:
+            self.stdout.write(self.style.SUCCESS('All loan balances match their repayments'))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f'Fixed {mismatched} loan balances'))
+        else:
+            self.stdout.write(f'{mismatched} loan balances differ; rerun with --fix to correct them')
+
+    def _fix(self, loan_id):
+        """Recompute the total under the loan's row lock so concurrent repayments are not lost"""
+        with transaction.atomic():
+            loan = Loan.objects.select_for_update().get(id=loan_id)
+            total = loan.repayments.filter(status='COMPLETED').aggregate(total=Sum('amount'))['total']
+            Loan.objects.filter(id=loan.id).update(total_repaid=total or Decimal('0.00'))
+        DashboardService.invalidate(loan.user_id)
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:21
+
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credit_scoring', '0001_initial'),
+        ('loans', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OverdueSweepRun',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('triggered_by', models.CharField(choices=[('COMMAND', 'Management Command'), ('API', 'Admin API')], default='COMMAND', max_length=20)),
+                ('cutoff', models.DateTimeField()),
+                ('loans_marked', models.IntegerField(default=0)),
+                ('duration_ms', models.IntegerField(default=0)),
+                ('started_at', models.DateTimeField()),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-started_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['status', 'due_date'], name='loans_loan_status_196efd_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:21
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_total_repaid(apps, schema_editor):
+    Loan = apps.get_model('loans', 'Loan')
+    Repayment = apps.get_model('loans', 'Repayment')
+    completed = Repayment.objects.filter(
+        loan=OuterRef('pk'), status='COMPLETED'
+    ).order_by().values('loan').annotate(total=Sum('amount')).values('total')
+    Loan.objects.update(total_repaid=Coalesce(
+        Subquery(completed),
+        Value(Decimal('0.00')),
+        output_field=DecimalField(max_digits=10, decimal_places=2)
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0002_overdue_sweep'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loan',
+            name='total_repaid',
+            field=models.DecimalField(decimal_places=2, default=0.0, max_digits=10),
+        ),
+        migrations.RunPython(backfill_total_repaid, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credit_scoring', '0004_model_artifact_versions'),
+        ('loans', '0003_loan_total_repaid'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='loans_loan_user_id_34c08c_idx'),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:05
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def merge_duplicate_repayments(apps, schema_editor):
+    """
+    Remove repeat postings of one M-Pesa payment so the unique constraints can be added
+
+    Repayments sharing a transaction ID or receipt number on the same loan
+    for the same amount are one payment posted twice: the completed (else
+    earliest) one is kept, and the loan's total_repaid and PAID status are
+    recomputed. Any other shared ID cannot be merged safely, so the
+    migration stops and lists them without changing anything.
+    """
+    Loan = apps.get_model('loans', 'Loan')
+    Repayment = apps.get_model('loans', 'Repayment')
+
+    affected_loan_ids = set()
+    conflicts = []
+    for field in ('mpesa_transaction_id', 'mpesa_receipt_number'):
+        duplicated = Repayment.objects.filter(**{f'{field}__gt': ''}).values(field).annotate(
+            postings=Count('id')
+        ).filter(postings__gt=1).values_list(field, flat=True)
+        for value in list(duplicated):
+            rows = list(Repayment.objects.filter(**{field: value}).order_by('created_at', 'id'))
+            if len({(row.loan_id, row.amount) for row in rows}) > 1:
+                conflicts.append(f"  {field}={value}: " + ', '.join(
+                    f"{row.id} (loan {row.loan_id}, {row.amount}, {row.status})" for row in rows
+                ))
+                continue
+            keep = next((row for row in rows if row.status == 'COMPLETED'), rows[0])
+            Repayment.objects.filter(id__in=[row.id for row in rows if row.id != keep.id]).delete()
+            affected_loan_ids.add(keep.loan_id)
+
+    if conflicts:
+        raise RuntimeError(
+            "Repayments share an M-Pesa ID across different loans or amounts. Remove the wrong "
+            "postings, run `manage.py reconcile_loan_balances --fix` and migrate again:\n" + '\n'.join(conflicts)
+        )
+
+    if affected_loan_ids:
+        completed = Repayment.objects.filter(
+            loan=OuterRef('pk'), status='COMPLETED'
+        ).order_by().values('loan').annotate(total=Sum('amount')).values('total')
+        loans = Loan.objects.filter(id__in=affected_loan_ids)
+        loans.update(total_repaid=Coalesce(
+            Subquery(completed),
+            Value(Decimal('0.00')),
+            output_field=DecimalField(max_digits=10, decimal_places=2)
+        ))
+        # Loans only paid off by the double counting are outstanding again
+        loans.filter(status='PAID', total_repaid__lt=F('total_amount_due')).update(status='ACTIVE', repaid_at=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0004_loan_user_created_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_repayments, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='repayment',
+            constraint=models.UniqueConstraint(condition=models.Q(('mpesa_transaction_id__gt', '')), fields=('mpesa_transaction_id',), name='unique_repayment_mpesa_transaction_id'),
+        ),
+        migrations.AddConstraint(
+            model_name='repayment',
+            constraint=models.UniqueConstraint(condition=models.Q(('mpesa_receipt_number__gt', '')), fields=('mpesa_receipt_number',), name='unique_repayment_mpesa_receipt_number'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:09
+
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credit_scoring', '0004_model_artifact_versions'),
+        ('loans', '0005_unique_repayment_mpesa_ids'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DisbursementBatch',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('triggered_by', models.CharField(choices=[('COMMAND', 'Management Command'), ('API', 'Admin API')], default='COMMAND', max_length=20)),
+                ('payout_client', models.CharField(max_length=20)),
+                ('loans_claimed', models.IntegerField(default=0)),
+                ('loans_disbursed', models.IntegerField(default=0)),
+                ('loans_failed', models.IntegerField(default=0)),
+                ('amount_disbursed', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+                ('failures', models.JSONField(default=list)),
+                ('duration_ms', models.IntegerField(default=0)),
+                ('started_at', models.DateTimeField()),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-started_at'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='loan',
+            name='status',
+            field=models.CharField(choices=[('PENDING', 'Pending'), ('APPROVED', 'Approved'), ('DISBURSING', 'Disbursing'), ('DISBURSED', 'Disbursed'), ('ACTIVE', 'Active'), ('OVERDUE', 'Overdue'), ('PAID', 'Paid'), ('DEFAULTED', 'Defaulted'), ('REJECTED', 'Rejected')], default='PENDING', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='loans_loan_status_89088c_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0006_disbursement_batch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='disbursementbatch',
+            name='loans_unknown',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='loan',
+            name='disbursement_batch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='loans', to='loans.disbursementbatch'),
+        ),
+    ]
@@ -8,6 +8,7 @@ class Loan(models.Model):
     LOAN_STATUS = [
         ('PENDING', 'Pending'),
         ('APPROVED', 'Approved'),
+        ('DISBURSING', 'Disbursing'),  # Claimed by a disbursement batch, payout in flight
         ('DISBURSED', 'Disbursed'),
         ('ACTIVE', 'Active'),
         ('OVERDUE', 'Overdue'),
@@ -19,12 +20,17 @@ class Loan(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     loan_offer = models.ForeignKey(LoanOffer, on_delete=models.CASCADE, null=True, blank=True)
+    # The batch that claimed the loan for disbursement
+    disbursement_batch = models.ForeignKey(
+        'DisbursementBatch', on_delete=models.SET_NULL, null=True, blank=True, related_name='loans'
+    )
     
     # Loan details - ALL WITH DEFAULTS
     principal_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     interest_rate = models.DecimalField(max_digits=5, decimal_places=2, default=0.00)
     total_amount_due = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     amount_disbursed = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    total_repaid = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)  # Running sum of completed repayments
     
     # Loan terms
     term_days = models.IntegerField(default=30)
@@ -42,6 +48,13 @@ class Loan(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'due_date']),
+            # A user's loans newest first, for keyset pagination
+            models.Index(fields=['user', '-created_at', '-id']),
+            # Approved loans oldest first, for disbursement batches
+            models.Index(fields=['status', 'created_at', 'id']),
+        ]
     
     def __str__(self):
         return f"Loan {self.id} - {self.user.phone_number} - {self.status}"
@@ -60,14 +73,28 @@ class Loan(models.Model):
     
     @property
     def days_remaining(self):
-        if self.due_date and self.status in ['DISBURSED', 'ACTIVE', 'OVERDUE']:
-            remaining = self.due_date - timezone.now()
-            return max(0, remaining.days)
-        return None
+        return Loan.days_remaining_at(self.due_date, self.status, timezone.now())
+    
+    @property
+    def outstanding_balance(self):
+        return self.total_amount_due - self.total_repaid
     
     @property
     def is_overdue(self):
-        if self.due_date and timezone.now() > self.due_date and self.status in ['DISBURSED', 'ACTIVE']:
+        return Loan.is_overdue_at(self.due_date, self.status, timezone.now())
+    
+    @staticmethod
+    def days_remaining_at(due_date, status, now):
+        """days_remaining for raw field values, as of now (for rows fetched with values())"""
+        if due_date and status in ['DISBURSED', 'ACTIVE', 'OVERDUE']:
+            remaining = due_date - now
+            return max(0, remaining.days)
+        return None
+    
+    @staticmethod
+    def is_overdue_at(due_date, status, now):
+        """is_overdue for raw field values, as of now (for rows fetched with values())"""
+        if due_date and now > due_date and status in ['DISBURSED', 'ACTIVE']:
             return True
         return False
 
@@ -100,6 +127,19 @@ class Repayment(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        constraints = [
+            # An M-Pesa payment is posted at most once; blank and NULL IDs are not compared
+            models.UniqueConstraint(
+                fields=['mpesa_transaction_id'],
+                condition=models.Q(mpesa_transaction_id__gt=''),
+                name='unique_repayment_mpesa_transaction_id'
+            ),
+            models.UniqueConstraint(
+                fields=['mpesa_receipt_number'],
+                condition=models.Q(mpesa_receipt_number__gt=''),
+                name='unique_repayment_mpesa_receipt_number'
+            ),
+        ]
     
     def __str__(self):
         return f"Repayment {self.id} - {self.loan.id} - {self.amount}"
@@ -134,4 +174,63 @@ class LoanApplication(models.Model):
         ordering = ['-created_at']
     
     def __str__(self):
-        return f"Application {self.id} - {self.user.phone_number} - {self.status}"
\ No newline at end of file
+        return f"Application {self.id} - {self.user.phone_number} - {self.status}"
+
+class OverdueSweepRun(models.Model):
+    """
+    One run of the overdue loan sweep, kept for timing and audit
+    """
+    TRIGGERS = [
+        ('COMMAND', 'Management Command'),
+        ('API', 'Admin API'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    triggered_by = models.CharField(max_length=20, choices=TRIGGERS, default='COMMAND')
+    cutoff = models.DateTimeField()  # Loans due before this moment were marked overdue
+    loans_marked = models.IntegerField(default=0)
+    duration_ms = models.IntegerField(default=0)
+    
+    # Timestamps
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-started_at']
+    
+    def __str__(self):
+        return f"Overdue sweep {self.started_at} - {self.loans_marked} loans"
+
+class DisbursementBatch(models.Model):
+    """
+    One batch of approved loans paid out together, kept for throughput and audit
+    """
+    TRIGGERS = [
+        ('COMMAND', 'Management Command'),
+        ('API', 'Admin API'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    triggered_by = models.CharField(max_length=20, choices=TRIGGERS, default='COMMAND')
+    payout_client = models.CharField(max_length=20)
+    loans_claimed = models.IntegerField(default=0)
+    loans_disbursed = models.IntegerField(default=0)
+    loans_failed = models.IntegerField(default=0)  # Rejected by the provider, returned to APPROVED
+    loans_unknown = models.IntegerField(default=0)  # No usable answer, left DISBURSING for reconciliation
+    amount_disbursed = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    failures = models.JSONField(default=list)  # [{'loan_id': ..., 'outcome': ..., 'error': ...}] for rejected and unknown payouts
+    duration_ms = models.IntegerField(default=0)
+    
+    # Timestamps
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-started_at']
+    
+    @property
+    def loans_per_second(self):
+        return round(self.loans_claimed * 1000 / self.duration_ms, 1) if self.duration_ms else None
+    
+    def __str__(self):
+        return f"Disbursement batch {self.started_at} - {self.loans_disbursed}/{self.loans_claimed} loans"
@@ -38,16 +38,17 @@ class LoanSerializer(serializers.ModelSerializer):
     user_name = serializers.SerializerMethodField()
     days_remaining = serializers.ReadOnlyField()
     is_overdue = serializers.ReadOnlyField()
+    outstanding_balance = serializers.ReadOnlyField()
     
     class Meta:
         model = Loan
         fields = [
             'id', 'user', 'user_phone', 'user_name', 'principal_amount', 
             'interest_rate', 'total_amount_due', 'amount_disbursed', 
-            'term_days', 'disbursed_at', 'due_date', 'repaid_at', 'status',
-            'days_remaining', 'is_overdue', 'created_at'
+            'total_repaid', 'outstanding_balance', 'term_days', 'disbursed_at',
+            'due_date', 'repaid_at', 'status', 'days_remaining', 'is_overdue', 'created_at'
         ]
-        read_only_fields = ['user', 'status', 'created_at']
+        read_only_fields = ['user', 'status', 'total_repaid', 'created_at']
     
     def get_user_name(self, obj):
         return obj.user.full_name
@@ -1,12 +1,25 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
 from django.utils import timezone
+from collections import defaultdict
 from datetime import timedelta
-from .models import Loan, Repayment, LoanApplication
+from decimal import Decimal, InvalidOperation
+import time
+import uuid
+from .models import Loan, Repayment, LoanApplication, OverdueSweepRun, DisbursementBatch
 from users.models import User
-from credit_scoring.models import CreditScore
+from users.services import DashboardService
+from credit_scoring.models import CreditScore, LoanOffer
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Loans marked overdue per UPDATE by the overdue sweep
+OVERDUE_UPDATE_BATCH_SIZE = 500
+
+# Approved loans claimed and paid out per disbursement batch
+DISBURSEMENT_BATCH_SIZE = 100
+
 class LoanService:
     """
     Service class for loan operations
@@ -38,6 +51,8 @@ class LoanService:
     def disburse_loan(loan_id):
         """
         Disburse a loan (send money to user via M-Pesa)
+        
+        Pays the loan out as a batch of one, see DisbursementService.
         """
         try:
             loan = Loan.objects.get(id=loan_id)
@@ -45,88 +60,403 @@ class LoanService:
             if loan.status != 'APPROVED':
                 raise ValueError("Loan must be approved before disbursement")
             
-            # TODO: Integrate with M-Pesa B2C API here
-            # For now, we'll simulate successful disbursement
-            
-            loan.amount_disbursed = loan.principal_amount
-            loan.status = 'DISBURSED'
-            loan.disbursed_at = timezone.now()
-            loan.save()
-            
-            # Update loan offer status if exists
-            if loan.loan_offer:
-                loan.loan_offer.status = 'ACCEPTED'
-                loan.loan_offer.save()
+            batch, _ = DisbursementService.disburse_batch(loan_ids=[loan.id], triggered_by='API')
+            if batch is None:
+                # Claimed by another disbursement run since it was read
+                raise ValueError("Loan must be approved before disbursement")
+            if batch.loans_unknown:
+                raise ValueError("Payout outcome unknown; the loan stays DISBURSING until it is reconciled")
+            if batch.loans_failed:
+                raise ValueError(f"Payout failed: {batch.failures[0]['error']}")
             
+            loan.refresh_from_db()
             logger.info(f"Loan disbursed: {loan.id}")
             return loan
             
         except Loan.DoesNotExist:
             raise ValueError("Loan not found")
+        except ValueError:
+            raise
         except Exception as e:
             logger.error(f"Error disbursing loan {loan_id}: {str(e)}")
             raise
     
     @staticmethod
-    def process_repayment(loan_id, amount, mpesa_transaction_id=None):
+    def process_repayment(loan_id, amount, mpesa_transaction_id=None, mpesa_receipt_number=None):
         """
         Process a loan repayment
+        
+        Posting the same M-Pesa transaction ID or receipt number again
+        returns the repayment already posted for it.
         """
         try:
-            loan = Loan.objects.get(id=loan_id)
-            
-            # Create repayment record
-            repayment = Repayment.objects.create(
-                loan=loan,
-                amount=amount,
-                status='COMPLETED',
-                mpesa_transaction_id=mpesa_transaction_id,
-                paid_at=timezone.now()
-            )
-            
-            # Update loan status if fully repaid
-            total_repaid = sum(rep.amount for rep in loan.repayments.filter(status='COMPLETED'))
-            
-            if total_repaid >= loan.total_amount_due:
-                loan.status = 'PAID'
-                loan.repaid_at = timezone.now()
-                loan.save()
-                logger.info(f"Loan fully repaid: {loan.id}")
-            else:
-                loan.status = 'ACTIVE'
-                loan.save()
-                logger.info(f"Partial repayment received for loan: {loan.id}")
-            
+            (repayment, created), = LoanService.post_repayments([{
+                'loan_id': loan_id,
+                'amount': amount,
+                'mpesa_transaction_id': mpesa_transaction_id,
+                'mpesa_receipt_number': mpesa_receipt_number,
+            }])
             return repayment
             
         except Loan.DoesNotExist:
             raise ValueError("Loan not found")
+        except ValueError:
+            raise
         except Exception as e:
             logger.error(f"Error processing repayment for loan {loan_id}: {str(e)}")
             raise
     
     @staticmethod
-    def check_overdue_loans():
+    def post_repayments(entries, user=None):
         """
-        Check and update status of overdue loans
+        Post a batch of repayments in one transaction, each payment at most once
+        
+        entries are dicts with loan_id and amount, and optionally
+        mpesa_transaction_id and mpesa_receipt_number. Every entry is
+        validated before anything is written. Each loan is locked once, in
+        id order so concurrent batches cannot deadlock, and gets its new
+        repayments inserted together and its running total and status
+        updated once. An entry whose M-Pesa transaction ID or receipt
+        number is already posted (before or earlier in the batch) is not
+        posted again; the existing repayment stands in for it. A unique
+        constraint backs this up against concurrent callers.
+        
+        With user, only that user's loans can be repaid. Raises ValueError
+        for an invalid entry and Loan.DoesNotExist for an unknown loan.
+        Returns a (repayment, created) pair per entry, in entry order.
         """
+        entries = [LoanService._repayment_entry(entry) for entry in entries]
+        if not entries:
+            return []
+        
         try:
-            active_loans = Loan.objects.filter(status__in=['DISBURSED', 'ACTIVE'])
-            overdue_count = 0
+            return LoanService._post_repayments(entries, user)
+        except IntegrityError:
+            # A concurrent caller posted one of these payments first; posting
+            # again now finds its repayment instead of inserting a duplicate
+            logger.warning("Repayment batch raced a duplicate M-Pesa payment; retrying")
+            return LoanService._post_repayments(entries, user)
+    
+    @staticmethod
+    def _repayment_entry(entry):
+        """Validated copy of one post_repayments entry"""
+        try:
+            amount = Decimal(str(entry.get('amount')))
+        except (InvalidOperation, TypeError):
+            raise ValueError("Invalid repayment amount")
+        if not amount.is_finite() or amount <= 0:
+            raise ValueError("Repayment amount must be greater than 0")
+        
+        try:
+            loan_id = uuid.UUID(str(entry.get('loan_id')))
+        except ValueError:
+            raise ValueError("Invalid loan ID")
+        
+        return {
+            'loan_id': loan_id,
+            'amount': amount,
+            'mpesa_transaction_id': str(entry.get('mpesa_transaction_id') or '').strip() or None,
+            'mpesa_receipt_number': str(entry.get('mpesa_receipt_number') or '').strip() or None,
+        }
+    
+    @staticmethod
+    def _post_repayments(entries, user):
+        loan_ids = sorted({entry['loan_id'] for entry in entries})
+        transaction_ids = {entry['mpesa_transaction_id'] for entry in entries} - {None}
+        receipt_numbers = {entry['mpesa_receipt_number'] for entry in entries} - {None}
+        
+        with transaction.atomic():
+            # Lock the loans so concurrent repayments are applied one at a time
+            loans = Loan.objects.select_for_update().filter(id__in=loan_ids).order_by('id')
+            if user is not None:
+                loans = loans.filter(user=user)
+            loans = {loan.id: loan for loan in loans}
+            if len(loans) != len(loan_ids):
+                raise Loan.DoesNotExist("Loan not found")
+            
+            # Payments already posted, keyed by transaction ID and by receipt number
+            posted = {}
+            if transaction_ids or receipt_numbers:
+                for repayment in Repayment.objects.filter(
+                    Q(mpesa_transaction_id__in=transaction_ids) | Q(mpesa_receipt_number__in=receipt_numbers)
+                ):
+                    posted[('transaction', repayment.mpesa_transaction_id)] = repayment
+                    posted[('receipt', repayment.mpesa_receipt_number)] = repayment
             
-            for loan in active_loans:
-                if loan.is_overdue:
-                    loan.status = 'OVERDUE'
-                    loan.save()
-                    overdue_count += 1
+            results = []
+            new_repayments = []
+            paid_at = timezone.now()
+            for entry in entries:
+                keys = [
+                    key for key in [
+                        ('transaction', entry['mpesa_transaction_id']),
+                        ('receipt', entry['mpesa_receipt_number'])
+                    ] if key[1] is not None
+                ]
+                existing = next((posted[key] for key in keys if key in posted), None)
+                if existing is not None:
+                    logger.info(f"Repayment {existing.id} already posted for M-Pesa payment {keys[0][1]}")
+                    results.append((existing, False))
+                    continue
+                
+                repayment = Repayment(
+                    loan=loans[entry['loan_id']],
+                    amount=entry['amount'],
+                    status='COMPLETED',
+                    mpesa_transaction_id=entry['mpesa_transaction_id'],
+                    mpesa_receipt_number=entry['mpesa_receipt_number'],
+                    paid_at=paid_at
+                )
+                for key in keys:
+                    posted[key] = repayment
+                new_repayments.append(repayment)
+                results.append((repayment, True))
             
-            logger.info(f"Updated {overdue_count} loans to overdue status")
-            return overdue_count
+            Repayment.objects.bulk_create(new_repayments)
+            
+            repaid = {}
+            for repayment in new_repayments:
+                repaid[repayment.loan_id] = repaid.get(repayment.loan_id, Decimal('0.00')) + repayment.amount
+            for loan_id, amount in repaid.items():
+                LoanService._apply_repaid_amount(loans[loan_id], amount, paid_at)
+        
+        DashboardService.invalidate(*{loans[loan_id].user_id for loan_id in repaid})
+        return results
+    
+    @staticmethod
+    def _apply_repaid_amount(loan, amount, paid_at):
+        """Add amount to a locked loan's running total and update its status"""
+        Loan.objects.filter(id=loan.id).update(total_repaid=F('total_repaid') + amount)
+        loan.refresh_from_db(fields=['total_repaid'])
+        
+        # Update loan status if fully repaid
+        if loan.total_repaid >= loan.total_amount_due:
+            loan.status = 'PAID'
+            loan.repaid_at = paid_at
+            loan.save(update_fields=['status', 'repaid_at', 'updated_at'])
+            logger.info(f"Loan fully repaid: {loan.id}")
+        else:
+            loan.status = 'ACTIVE'
+            loan.save(update_fields=['status', 'updated_at'])
+            logger.info(f"Partial repayment received for loan: {loan.id}")
+    
+    @staticmethod
+    def apply_mpesa_payment(payment_request):
+        """
+        Post a completed STK Push payment as a repayment on the user's outstanding loan
+        """
+        loans = Loan.objects.filter(
+            user=payment_request.user,
+            status__in=['DISBURSED', 'ACTIVE', 'OVERDUE']
+        )
+        
+        # The account reference is either the loan ID or the user ID
+        try:
+            loan = loans.filter(id=uuid.UUID(payment_request.account_reference)).first()
+        except ValueError:
+            loan = None
+        loan = loan or loans.order_by('due_date', 'created_at').first()
+        
+        if loan is None:
+            logger.warning(f"No outstanding loan for M-Pesa payment {payment_request.checkout_request_id}")
+            return None
+        
+        return LoanService.process_repayment(
+            loan.id,
+            payment_request.amount,
+            mpesa_transaction_id=payment_request.checkout_request_id
+        )
+    
+    @staticmethod
+    def check_overdue_loans(triggered_by='API'):
+        """
+        Mark every disbursed or active loan past its due date as overdue
+        
+        Runs as set-based UPDATEs (no per-loan save()), records an
+        OverdueSweepRun and returns the IDs of the loans it marked and the run.
+        """
+        try:
+            started = time.monotonic()
+            run = OverdueSweepRun(triggered_by=triggered_by, started_at=timezone.now())
+            run.cutoff = run.started_at
+            
+            overdue = Loan.objects.filter(
+                status__in=['DISBURSED', 'ACTIVE'],
+                due_date__lt=run.cutoff
+            )
+            with transaction.atomic():
+                found = list(overdue.select_for_update().values_list('id', 'user_id'))
+                # Update only the rows read, so the IDs returned are exactly the ones updated.
+                # Where rows cannot be locked (SQLite) one may have been repaid since it was read,
+                # so the eligibility filter stays and a short chunk is checked for what it marked.
+                rows = []
+                for start in range(0, len(found), OVERDUE_UPDATE_BATCH_SIZE):
+                    chunk = found[start:start + OVERDUE_UPDATE_BATCH_SIZE]
+                    chunk_ids = [loan_id for loan_id, _ in chunk]
+                    updated = overdue.filter(id__in=chunk_ids).update(status='OVERDUE', updated_at=run.cutoff)
+                    if updated != len(chunk):
+                        marked = set(Loan.objects.filter(
+                            id__in=chunk_ids, status='OVERDUE', updated_at=run.cutoff
+                        ).values_list('id', flat=True))
+                        chunk = [row for row in chunk if row[0] in marked]
+                    rows.extend(chunk)
+            
+            loan_ids = [loan_id for loan_id, _ in rows]
+            DashboardService.invalidate(*{user_id for _, user_id in rows})
+            
+            run.loans_marked = len(loan_ids)
+            run.finished_at = timezone.now()
+            run.duration_ms = int((time.monotonic() - started) * 1000)
+            run.save()
+            
+            logger.info(f"Updated {run.loans_marked} loans to overdue status in {run.duration_ms}ms")
+            return loan_ids, run
             
         except Exception as e:
             logger.error(f"Error checking overdue loans: {str(e)}")
             raise
 
+class DisbursementService:
+    """
+    Pays out approved loans in batches through a payout client
+    
+    A batch claims up to batch_size APPROVED loans by moving them to
+    DISBURSING and tagging them with the batch in one conditional UPDATE,
+    so two runs never claim the same loan even where rows cannot be
+    locked. It sends their payouts outside any transaction, then in one
+    transaction marks the accepted loans DISBURSED (and their offers
+    ACCEPTED) and returns the loans the provider rejected to APPROVED.
+    Loans whose payout outcome is unknown (timeouts, unreadable replies)
+    stay in DISBURSING, as do the loans of a run interrupted between the
+    two steps: check their payouts with the provider before setting them
+    back to APPROVED, or they may be paid twice.
+    """
+    
+    @staticmethod
+    def run(loan_ids=None, batch_size=DISBURSEMENT_BATCH_SIZE, client=None, triggered_by='COMMAND'):
+        """
+        Disburse every approved loan (or those in loan_ids), oldest first,
+        yielding each DisbursementBatch as it finishes
+        
+        A run tries each loan once, so rejected payouts wait for the next run.
+        """
+        from mpesa.payouts import get_payout_client
+        
+        if batch_size < 1:
+            raise ValueError("batch_size must be positive")
+        client = client or get_payout_client()
+        after = None
+        while True:
+            batch, after = DisbursementService.disburse_batch(
+                loan_ids=loan_ids, after=after, batch_size=batch_size, client=client, triggered_by=triggered_by
+            )
+            if batch is None:
+                return
+            yield batch
+    
+    @staticmethod
+    def disburse_batch(loan_ids=None, after=None, batch_size=DISBURSEMENT_BATCH_SIZE, client=None, triggered_by='API'):
+        """
+        Claim, pay out and settle one batch of approved loans
+        
+        after is the (created_at, id) of the last loan considered by the
+        previous batch. Returns the saved DisbursementBatch and the key to
+        pass as after next, or (None, after) when no approved loans are left.
+        """
+        from mpesa.payouts import Payout, get_payout_client
+        
+        client = client or get_payout_client()
+        started = time.monotonic()
+        batch = DisbursementBatch(
+            triggered_by=triggered_by, payout_client=client.name, started_at=timezone.now()
+        )
+        
+        while True:
+            approved = Loan.objects.filter(status='APPROVED')
+            if loan_ids is not None:
+                approved = approved.filter(id__in=loan_ids)
+            if after is not None:
+                created_at, loan_id = after
+                approved = approved.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=loan_id))
+            
+            with transaction.atomic():
+                candidates = list(
+                    approved.select_for_update().order_by('created_at', 'id').values_list('id', 'created_at')[:batch_size]
+                )
+                if not candidates:
+                    return None, after
+                after = (candidates[-1][1], candidates[-1][0])
+                
+                batch.save()
+                # Loans another run claimed since they were read are still not APPROVED
+                claimed = Loan.objects.filter(
+                    id__in=[loan_id for loan_id, _ in candidates], status='APPROVED'
+                ).update(status='DISBURSING', disbursement_batch=batch, updated_at=batch.started_at)
+                if claimed:
+                    break
+                batch.delete()
+        
+        loans = list(
+            Loan.objects.filter(disbursement_batch=batch, status='DISBURSING')
+            .order_by('created_at', 'id')
+            .values('id', 'user_id', 'user__phone_number', 'loan_offer_id', 'principal_amount', 'term_days')
+        )
+        results = client.pay([
+            Payout(loan['id'], loan['user__phone_number'], loan['principal_amount']) for loan in loans
+        ])
+        outcomes = [(loan, results[str(loan['id'])]) for loan in loans]
+        disbursed = [loan for loan, result in outcomes if result.accepted]
+        rejected = [loan for loan, result in outcomes if result.rejected]
+        unknown = [loan for loan, result in outcomes if not (result.accepted or result.rejected)]
+        
+        now = timezone.now()
+        with transaction.atomic():
+            # Due dates depend on the term, so disbursed loans are updated per term length
+            by_term = defaultdict(list)
+            for loan in disbursed:
+                by_term[loan['term_days']].append(loan['id'])
+            for term_days, ids in by_term.items():
+                Loan.objects.filter(id__in=ids, status='DISBURSING').update(
+                    status='DISBURSED',
+                    amount_disbursed=F('principal_amount'),
+                    disbursed_at=now,
+                    due_date=now + timedelta(days=term_days),
+                    updated_at=now
+                )
+            offer_ids = [loan['loan_offer_id'] for loan in disbursed if loan['loan_offer_id']]
+            if offer_ids:
+                LoanOffer.objects.filter(id__in=offer_ids).update(status='ACCEPTED')
+            if rejected:
+                # No money moved, so these can be tried again by a later run
+                Loan.objects.filter(id__in=[loan['id'] for loan in rejected], status='DISBURSING').update(
+                    status='APPROVED', disbursement_batch=None, updated_at=now
+                )
+            
+            batch.loans_claimed = len(loans)
+            batch.loans_disbursed = len(disbursed)
+            batch.loans_failed = len(rejected)
+            batch.loans_unknown = len(unknown)
+            batch.amount_disbursed = sum((loan['principal_amount'] for loan in disbursed), Decimal('0.00'))
+            batch.failures = [
+                {'loan_id': str(loan['id']), 'outcome': result.status, 'error': result.error}
+                for loan, result in outcomes if not result.accepted
+            ]
+            batch.finished_at = now
+            batch.duration_ms = int((time.monotonic() - started) * 1000)
+            batch.save()
+        
+        DashboardService.invalidate(*{loan['user_id'] for loan in disbursed})
+        logger.info(
+            f"Disbursed {batch.loans_disbursed} of {batch.loans_claimed} loans through {client.name} "
+            f"in {batch.duration_ms}ms ({batch.loans_failed} rejected, {batch.loans_unknown} unknown)"
+        )
+        if unknown:
+            logger.error(
+                f"Payout outcome unknown for {len(unknown)} loans in batch {batch.id}; "
+                f"left DISBURSING for reconciliation"
+            )
+        return batch, after
+
 class LoanApplicationService:
     """
     Service class for loan application operations
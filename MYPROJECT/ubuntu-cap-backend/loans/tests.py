@@ -1,3 +1,433 @@
+import io
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import QuerySet
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from credit_scoring.models import CreditScore, LoanOffer
+from mpesa.payouts import FakePayoutClient
+from users.models import User
+from .models import DisbursementBatch, Loan, OverdueSweepRun, Repayment
+from .services import DisbursementService, LoanService
+
+
+class OverdueSweepTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(phone_number='254700000010', password='test-pass-123')
+
+    def create_loan(self, status, due_in_days):
+        return Loan.objects.create(
+            user=self.user,
+            principal_amount=Decimal('1000.00'),
+            interest_rate=Decimal('10.00'),
+            status=status,
+            due_date=timezone.now() + timedelta(days=due_in_days)
+        )
+
+    def test_sweep_marks_only_past_due_loans(self):
+        overdue = [self.create_loan('DISBURSED', -3), self.create_loan('ACTIVE', -1)]
+        current = self.create_loan('ACTIVE', 5)
+        paid = self.create_loan('PAID', -10)
+
+        loan_ids, run = LoanService.check_overdue_loans(triggered_by='COMMAND')
+
+        self.assertCountEqual(loan_ids, [loan.id for loan in overdue])
+        self.assertEqual(
+            set(Loan.objects.filter(status='OVERDUE').values_list('id', flat=True)),
+            {loan.id for loan in overdue}
+        )
+        current.refresh_from_db()
+        paid.refresh_from_db()
+        self.assertEqual((current.status, paid.status), ('ACTIVE', 'PAID'))
+
+        self.assertEqual(OverdueSweepRun.objects.get(), run)
+        self.assertEqual(run.loans_marked, 2)
+        self.assertEqual(run.triggered_by, 'COMMAND')
+        self.assertIsNotNone(run.finished_at)
+
+        # A second sweep finds nothing left to mark
+        self.assertEqual(LoanService.check_overdue_loans()[0], [])
+
+    def test_sweep_returns_only_the_loans_it_updated(self):
+        repaid = self.create_loan('ACTIVE', -2)
+        late = self.create_loan('ACTIVE', -1)
+        real_update = QuerySet.update
+
+        def update_after_a_repayment(queryset, **kwargs):
+            # A repayment commits between the sweep's SELECT and its UPDATE
+            real_update(Loan.objects.filter(id=repaid.id), status='PAID')
+            return real_update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', autospec=True, side_effect=update_after_a_repayment):
+            loan_ids, run = LoanService.check_overdue_loans()
+
+        self.assertEqual(loan_ids, [late.id])
+        self.assertEqual(run.loans_marked, 1)
+        self.assertEqual(Loan.objects.get(id=repaid.id).status, 'PAID')
+
+
+class RepaymentBalanceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(phone_number='254700000011', password='test-pass-123')
+        self.loan = Loan.objects.create(
+            user=self.user,
+            principal_amount=Decimal('1000.00'),
+            interest_rate=Decimal('10.00'),
+            status='DISBURSED'
+        )
+
+    def test_repayments_keep_running_total(self):
+        LoanService.process_repayment(self.loan.id, '400.00')
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.total_repaid, Decimal('400.00'))
+        self.assertEqual(self.loan.outstanding_balance, Decimal('700.00'))
+        self.assertEqual(self.loan.status, 'ACTIVE')
+
+        LoanService.process_repayment(self.loan.id, Decimal('700.00'))
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.outstanding_balance, Decimal('0.00'))
+        self.assertEqual(self.loan.status, 'PAID')
+
+        with self.assertRaises(ValueError):
+            LoanService.process_repayment(self.loan.id, 'abc')
+
+    def test_reconcile_fixes_drifted_totals(self):
+        LoanService.process_repayment(self.loan.id, '250.00')
+        Loan.objects.filter(id=self.loan.id).update(total_repaid=Decimal('10.00'))
+
+        out = io.StringIO()
+        call_command('reconcile_loan_balances', stdout=out)
+        self.assertIn('1 loan balances differ', out.getvalue())
+
+        call_command('reconcile_loan_balances', '--fix', stdout=io.StringIO())
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.total_repaid, Decimal('250.00'))
+
+
+class UserLoanListTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(phone_number='254700000012', password='test-pass-123')
+        other = User.objects.create_user(phone_number='254700000013', password='test-pass-123')
+        created = timezone.now() - timedelta(days=30)
+        self.loans = []
+        for i in range(25):
+            loan = Loan.objects.create(
+                user=self.user,
+                principal_amount=Decimal('1000.00'),
+                interest_rate=Decimal('10.00'),
+                status='ACTIVE' if i % 2 else 'DISBURSED',
+                due_date=timezone.now() + timedelta(days=i - 5)
+            )
+            # Pairs of loans share a timestamp, so the id has to break ties
+            Loan.objects.filter(id=loan.id).update(created_at=created + timedelta(hours=i // 2))
+            self.loans.append(loan)
+        Loan.objects.create(user=other, principal_amount=Decimal('500.00'), interest_rate=Decimal('10.00'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def fetch_all(self, page_size):
+        pages, cursor = [], None
+        while True:
+            params = {'page_size': page_size, **({'cursor': cursor} if cursor else {})}
+            response = self.client.get('/api/loans/my-loans/', params)
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.data['loans'])
+            cursor = response.data['next_cursor']
+            self.assertEqual(response.data['has_more'], cursor is not None)
+            if cursor is None:
+                return pages
+
+    def test_pages_cover_every_loan_once_newest_first(self):
+        pages = self.fetch_all(10)
+
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        ids = [loan['id'] for page in pages for loan in page]
+        expected = Loan.objects.filter(user=self.user).order_by('-created_at', '-id').values_list('id', flat=True)
+        self.assertEqual(ids, [str(loan_id) for loan_id in expected])
+
+    def test_derived_fields_and_repayment_totals(self):
+        loan = self.loans[0]
+        LoanService.process_repayment(loan.id, '400.00')
+        loan.refresh_from_db()
+
+        listed = {item['id']: item for page in self.fetch_all(100) for item in page}
+
+        item = listed[str(loan.id)]
+        self.assertEqual(item['total_repaid'], '400.00')
+        self.assertEqual(item['outstanding_balance'], '700.00')
+        self.assertIsNotNone(item['last_repayment_at'])
+        for other in Loan.objects.filter(user=self.user):
+            self.assertEqual(listed[str(other.id)]['days_remaining'], other.days_remaining)
+            self.assertEqual(listed[str(other.id)]['is_overdue'], other.is_overdue)
+
+    def test_deep_pages_use_the_same_queries(self):
+        first = self.client.get('/api/loans/my-loans/', {'page_size': 5})
+        with self.assertNumQueries(1):
+            self.client.get('/api/loans/my-loans/', {'page_size': 5, 'cursor': first.data['next_cursor']})
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'EXPLAIN QUERY PLAN SELECT id FROM loans_loan WHERE user_id = %s '
+                'ORDER BY created_at DESC, id DESC LIMIT 5', [self.user.id.hex]
+            )
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        self.assertIn('loans_loan_user_id_34c08c_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_bad_cursor_or_page_size_is_rejected(self):
+        self.assertEqual(self.client.get('/api/loans/my-loans/', {'cursor': 'not-a-cursor'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/loans/my-loans/', {'page_size': 'ten'}).status_code, 400)
+
+
+class RepaymentPostingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(phone_number='254700000014', password='test-pass-123')
+        self.loans = [
+            Loan.objects.create(
+                user=self.user,
+                principal_amount=Decimal('1000.00'),
+                interest_rate=Decimal('10.00'),
+                status='DISBURSED'
+            )
+            for _ in range(2)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def total_repaid(self, loan):
+        loan.refresh_from_db()
+        return loan.total_repaid
+
+    def test_same_mpesa_payment_is_posted_once(self):
+        first = LoanService.process_repayment(self.loans[0].id, '300.00', mpesa_transaction_id='ws_CO_100')
+        again = LoanService.process_repayment(self.loans[0].id, '300.00', mpesa_transaction_id='ws_CO_100')
+        by_receipt = LoanService.process_repayment(self.loans[0].id, '200.00', mpesa_receipt_number='QK1234')
+        by_receipt_again = LoanService.process_repayment(
+            self.loans[0].id, '200.00', mpesa_transaction_id='ws_CO_101', mpesa_receipt_number='QK1234'
+        )
+
+        self.assertEqual(again.id, first.id)
+        self.assertEqual(by_receipt_again.id, by_receipt.id)
+        self.assertEqual(Repayment.objects.count(), 2)
+        self.assertEqual(self.total_repaid(self.loans[0]), Decimal('500.00'))
+
+    def test_batch_locks_each_loan_once_and_skips_duplicates(self):
+        results = LoanService.post_repayments([
+            {'loan_id': self.loans[0].id, 'amount': '400.00', 'mpesa_transaction_id': 'ws_CO_200'},
+            {'loan_id': self.loans[1].id, 'amount': '1100.00', 'mpesa_receipt_number': 'QK2000'},
+            {'loan_id': self.loans[0].id, 'amount': '400.00', 'mpesa_transaction_id': 'ws_CO_200'},
+            {'loan_id': self.loans[0].id, 'amount': '50.00'},
+        ])
+
+        self.assertEqual([created for _, created in results], [True, True, False, True])
+        self.assertIs(results[2][0], results[0][0])
+        self.assertEqual(self.total_repaid(self.loans[0]), Decimal('450.00'))
+        self.assertEqual(self.total_repaid(self.loans[1]), Decimal('1100.00'))
+        self.assertEqual(self.loans[0].status, 'ACTIVE')
+        self.assertEqual(self.loans[1].status, 'PAID')
+
+    def test_invalid_entry_posts_nothing(self):
+        with self.assertRaises(ValueError):
+            LoanService.post_repayments([
+                {'loan_id': self.loans[0].id, 'amount': '100.00'},
+                {'loan_id': self.loans[1].id, 'amount': '-5'},
+            ])
+        self.assertFalse(Repayment.objects.exists())
+
+    def test_payment_posted_concurrently_is_found_on_retry(self):
+        posted = LoanService.process_repayment(self.loans[0].id, '300.00', mpesa_transaction_id='ws_CO_300')
+        real_filter = Repayment.objects.filter
+        lookups = []
+
+        def miss_first_lookup(*args, **kwargs):
+            # The first lookup runs before the other caller's repayment is visible
+            lookups.append(args)
+            return Repayment.objects.none() if len(lookups) == 1 else real_filter(*args, **kwargs)
+
+        with mock.patch.object(Repayment.objects, 'filter', side_effect=miss_first_lookup):
+            repayment = LoanService.process_repayment(self.loans[0].id, '300.00', mpesa_transaction_id='ws_CO_300')
+
+        self.assertEqual(repayment.id, posted.id)
+        self.assertEqual(len(lookups), 2)
+        self.assertEqual(self.total_repaid(self.loans[0]), Decimal('300.00'))
+
+    def test_endpoint_reports_duplicates_and_checks_ownership(self):
+        payload = {'loan_id': str(self.loans[0].id), 'amount': '100.00', 'mpesa_transaction_id': 'ws_CO_400'}
+        first = self.client.post('/api/loans/repayments/process/', payload, format='json')
+        again = self.client.post('/api/loans/repayments/process/', payload, format='json')
+
+        self.assertEqual(first.status_code, 200)
+        self.assertFalse(first.data['duplicate'])
+        self.assertTrue(again.data['duplicate'])
+        self.assertEqual(again.data['repayment_id'], first.data['repayment_id'])
+
+        batch = self.client.post('/api/loans/repayments/process/', {'repayments': [
+            payload, {'loan_id': str(self.loans[1].id), 'amount': '20.00'}
+        ]}, format='json')
+        self.assertEqual([item['duplicate'] for item in batch.data['repayments']], [True, False])
+
+        other = User.objects.create_user(phone_number='254700000015', password='test-pass-123')
+        other_loan = Loan.objects.create(user=other, principal_amount=Decimal('500.00'), interest_rate=Decimal('10.00'))
+        response = self.client.post(
+            '/api/loans/repayments/process/', {'loan_id': str(other_loan.id), 'amount': '10.00'}, format='json'
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.total_repaid(other_loan), Decimal('0.00'))
+
+
+class DisbursementTests(TestCase):
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(phone_number=f'2547000001{i:02d}', password='test-pass-123')
+            for i in range(7)
+        ]
+        self.loans = []
+        for i, user in enumerate(self.users):
+            offer = LoanOffer.objects.create(
+                user=user,
+                credit_score=CreditScore.objects.create(user=user, score=70),
+                amount_offered=Decimal('1000.00') + i,
+                interest_rate=Decimal('10.00'),
+                expires_at=timezone.now() + timedelta(days=7)
+            )
+            loan = LoanService.create_loan_from_offer(user, offer)
+            if i == 6:
+                Loan.objects.filter(id=loan.id).update(term_days=14)
+            self.loans.append(loan)
+        self.pending = Loan.objects.create(user=self.users[0], principal_amount=Decimal('500.00'), status='PENDING')
+
+    def test_run_pays_out_every_approved_loan_in_batches(self):
+        client = FakePayoutClient(fail_numbers={'254700000103'})
+
+        batches = list(DisbursementService.run(batch_size=3, client=client))
+
+        self.assertEqual([batch.loans_claimed for batch in batches], [3, 3, 1])
+        self.assertEqual(sum(batch.loans_disbursed for batch in batches), 6)
+        self.assertEqual(
+            batches[1].failures,
+            [{'loan_id': str(self.loans[3].id), 'outcome': 'REJECTED', 'error': 'Payout rejected'}]
+        )
+        self.assertEqual(DisbursementBatch.objects.count(), 3)
+        # Payouts go out max_recipients at a time, each loan once per run
+        self.assertEqual([len(request) for request in client.sent], [3, 3, 1])
+
+        for i, loan in enumerate(self.loans):
+            loan.refresh_from_db()
+            loan.loan_offer.refresh_from_db()
+            if i == 3:
+                self.assertEqual(loan.status, 'APPROVED')
+                self.assertEqual(loan.loan_offer.status, 'PENDING')
+                continue
+            self.assertEqual(loan.status, 'DISBURSED')
+            self.assertEqual(loan.amount_disbursed, loan.principal_amount)
+            self.assertEqual(loan.due_date - loan.disbursed_at, timedelta(days=loan.term_days))
+            self.assertEqual(loan.loan_offer.status, 'ACCEPTED')
+        self.assertEqual(self.loans[6].term_days, 14)
+        self.pending.refresh_from_db()
+        self.assertEqual(self.pending.status, 'PENDING')
+
+        # The failed loan is picked up again by the next run
+        batches = list(DisbursementService.run(batch_size=3, client=FakePayoutClient()))
+        self.assertEqual([batch.loans_disbursed for batch in batches], [1])
+
+    def test_batches_settle_with_a_fixed_number_of_queries(self):
+        with self.assertNumQueries(12):
+            batch, after = DisbursementService.disburse_batch(batch_size=2, client=FakePayoutClient())
+        with self.assertNumQueries(12):
+            batch, _ = DisbursementService.disburse_batch(after=after, batch_size=4, client=FakePayoutClient())
+        self.assertEqual(batch.loans_disbursed, 4)
+
+    def test_payouts_with_unknown_outcome_are_never_retried(self):
+        class TimingOutClient(FakePayoutClient):
+            def _send(self, payouts):
+                if any(payout.phone_number == '254700000101' for payout in payouts):
+                    raise TimeoutError('Read timed out')
+                return super()._send(payouts)
+
+        client = TimingOutClient()
+        client.max_recipients = 1
+        batch, _ = DisbursementService.disburse_batch(batch_size=3, client=client)
+
+        self.assertEqual((batch.loans_disbursed, batch.loans_failed, batch.loans_unknown), (2, 0, 1))
+        self.assertEqual(batch.failures[0]['outcome'], 'UNKNOWN')
+        loan = Loan.objects.get(id=self.loans[1].id)
+        self.assertEqual(loan.status, 'DISBURSING')
+        self.assertEqual(loan.disbursement_batch_id, batch.id)
+
+        # Later runs pay everything else but leave the unknown payout alone
+        client = FakePayoutClient()
+        batches = list(DisbursementService.run(client=client))
+        self.assertEqual(sum(batch.loans_disbursed for batch in batches), 4)
+        self.assertNotIn(str(self.loans[1].id), [payout.reference for request in client.sent for payout in request])
+        self.assertEqual(Loan.objects.get(id=self.loans[1].id).status, 'DISBURSING')
+
+        with mock.patch('mpesa.payouts.get_payout_client', return_value=TimingOutClient()):
+            Loan.objects.filter(id=self.loans[1].id).update(status='APPROVED')
+            with self.assertRaisesMessage(ValueError, 'Payout outcome unknown'):
+                LoanService.disburse_loan(self.loans[1].id)
+        self.assertEqual(Loan.objects.get(id=self.loans[1].id).status, 'DISBURSING')
+
+    def test_loans_claimed_by_another_run_are_not_paid(self):
+        real_save = DisbursementBatch.save
+
+        def save_after_another_run_claims(batch, *args, **kwargs):
+            real_save(batch, *args, **kwargs)
+            # Another worker claims a loan between this run's SELECT and its claim
+            Loan.objects.filter(id=self.loans[0].id).update(status='DISBURSING')
+
+        client = FakePayoutClient()
+        with mock.patch.object(DisbursementBatch, 'save', save_after_another_run_claims):
+            batch, _ = DisbursementService.disburse_batch(batch_size=3, client=client)
+
+        self.assertEqual(batch.loans_claimed, 2)
+        self.assertEqual(
+            [payout.reference for payout in client.sent[0]], [str(self.loans[1].id), str(self.loans[2].id)]
+        )
+        self.assertIsNone(Loan.objects.get(id=self.loans[0].id).disbursement_batch_id)
+
+    def test_single_disbursement_goes_through_the_payout_client(self):
+        with mock.patch('mpesa.payouts.get_payout_client', return_value=FakePayoutClient(fail_numbers={'254700000100'})):
+            with self.assertRaisesMessage(ValueError, 'Payout failed: Payout rejected'):
+                LoanService.disburse_loan(self.loans[0].id)
+            loan = LoanService.disburse_loan(self.loans[1].id)
+
+        self.assertEqual(loan.status, 'DISBURSED')
+        self.assertEqual(Loan.objects.get(id=self.loans[0].id).status, 'APPROVED')
+        with self.assertRaisesMessage(ValueError, 'Loan must be approved'):
+            LoanService.disburse_loan(self.loans[1].id)
+
+    def test_batch_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        response = client.post('/api/loans/admin/disburse/batch/', {}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+        staff = User.objects.create_user(phone_number='254700000199', password='test-pass-123', is_staff=True)
+        client.force_authenticate(staff)
+        response = client.post('/api/loans/admin/disburse/batch/', {
+            'loan_ids': [str(self.loans[2].id), str(self.pending.id)]
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['loans_claimed'], 1)
+        self.assertEqual(response.data['loans_disbursed'], 1)
+        self.assertEqual(response.data['payout_client'], 'fake')
+
+        for payload in [{'loan_ids': ['not-a-uuid']}, {'loan_ids': str(self.loans[0].id)}, {'batch_size': 0}]:
+            response = client.post('/api/loans/admin/disburse/batch/', payload, format='json')
+            self.assertEqual(response.status_code, 400)
+
+    def test_command_reports_each_batch(self):
+        out = io.StringIO()
+        call_command('disburse_approved_loans', '--batch-size', '4', '--client', 'fake', stdout=out)
 
-# Create your tests here.
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith('Batch 1: disbursed 4 of 4 loans'))
+        self.assertTrue(lines[1].startswith('Batch 2: disbursed 3 of 3 loans'))
+        self.assertIn('Done: 7 of 7 loans disbursed through fake', lines[2])
+        self.assertFalse(Loan.objects.filter(status='APPROVED').exists())
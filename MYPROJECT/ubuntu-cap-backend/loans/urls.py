@@ -14,5 +14,6 @@ urlpatterns = [
     
     # Admin endpoints
     path('admin/disburse/', views.disburse_loan, name='disburse-loan'),
+    path('admin/disburse/batch/', views.disburse_loans, name='disburse-loans'),
     path('admin/check-overdue/', views.check_overdue_loans, name='check-overdue-loans'),
 ]
\ No newline at end of file
@@ -2,10 +2,12 @@ from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from django.db.models import F, OuterRef, Subquery
 from django.utils import timezone
 from .models import Loan, Repayment, LoanApplication
-from .services import LoanService, LoanApplicationService
+from .services import LoanService, LoanApplicationService, DisbursementService, DISBURSEMENT_BATCH_SIZE
 from users.models import User
+from ubuntu_core.pagination import InvalidCursor, keyset_page, page_size_from
 import logging
 
 logger = logging.getLogger(__name__)
@@ -56,28 +58,59 @@ def submit_loan_application(request):
 @permission_classes([IsAuthenticated])
 def get_user_loans(request):
     """
-    Get all loans for the authenticated user
+    Get the authenticated user's loans, newest first, one page at a time
+    
+    Query parameters: page_size (default 20, at most 100) and cursor, the
+    next_cursor returned with the previous page.
     """
-    user = request.user
-    loans = Loan.objects.filter(user=user).order_by('-created_at')
-    
-    loans_data = []
-    for loan in loans:
-        loans_data.append({
-            'id': str(loan.id),
-            'principal_amount': str(loan.principal_amount),
-            'interest_rate': str(loan.interest_rate),
-            'total_amount_due': str(loan.total_amount_due),
-            'status': loan.status,
-            'disbursed_at': loan.disbursed_at,
-            'due_date': loan.due_date,
-            'days_remaining': loan.days_remaining,
-            'is_overdue': loan.is_overdue
-        })
+    
+    try:
+        page_size = page_size_from(request.query_params.get('page_size'))
+    except ValueError:
+        return Response({
+            'success': False,
+            'message': 'page_size must be a number'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    last_repayment = Repayment.objects.filter(loan=OuterRef('pk'), status='COMPLETED').order_by('-paid_at')
+    loans = Loan.objects.filter(user=request.user).annotate(
+        outstanding_balance=F('total_amount_due') - F('total_repaid'),
+        last_repayment_at=Subquery(last_repayment.values('paid_at')[:1])
+    ).values(
+        'id', 'principal_amount', 'interest_rate', 'total_amount_due', 'total_repaid',
+        'outstanding_balance', 'last_repayment_at', 'status', 'disbursed_at', 'due_date', 'created_at'
+    )
+    
+    try:
+        page, next_cursor = keyset_page(loans, 'created_at', request.query_params.get('cursor'), page_size)
+    except InvalidCursor as e:
+        return Response({
+            'success': False,
+            'message': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    # One clock reading for the whole page
+    now = timezone.now()
+    loans_data = [{
+        'id': str(loan['id']),
+        'principal_amount': str(loan['principal_amount']),
+        'interest_rate': str(loan['interest_rate']),
+        'total_amount_due': str(loan['total_amount_due']),
+        'total_repaid': str(loan['total_repaid']),
+        'outstanding_balance': f"{loan['outstanding_balance']:.2f}",
+        'last_repayment_at': loan['last_repayment_at'],
+        'status': loan['status'],
+        'disbursed_at': loan['disbursed_at'],
+        'due_date': loan['due_date'],
+        'days_remaining': Loan.days_remaining_at(loan['due_date'], loan['status'], now),
+        'is_overdue': Loan.is_overdue_at(loan['due_date'], loan['status'], now)
+    } for loan in page]
     
     return Response({
         'success': True,
-        'loans': loans_data
+        'loans': loans_data,
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None
     })
 
 @api_view(['GET'])
@@ -90,9 +123,6 @@ def get_loan_details(request, loan_id):
         loan = Loan.objects.get(id=loan_id, user=request.user)
         repayments = loan.repayments.filter(status='COMPLETED')
         
-        total_repaid = sum(rep.amount for rep in repayments)
-        balance = loan.total_amount_due - total_repaid
-        
         repayment_history = []
         for repayment in repayments:
             repayment_history.append({
@@ -116,8 +146,8 @@ def get_loan_details(request, loan_id):
                 'is_overdue': loan.is_overdue
             },
             'repayment_summary': {
-                'total_repaid': str(total_repaid),
-                'remaining_balance': str(balance),
+                'total_repaid': str(loan.total_repaid),
+                'remaining_balance': str(loan.outstanding_balance),
                 'is_fully_repaid': loan.status == 'PAID'
             },
             'repayment_history': repayment_history
@@ -133,35 +163,34 @@ def get_loan_details(request, loan_id):
 @permission_classes([IsAuthenticated])
 def process_repayment(request):
     """
-    Process a loan repayment
+    Process a loan repayment, or a batch of them
+    
+    Either loan_id, amount and optionally mpesa_transaction_id and
+    mpesa_receipt_number, or repayments: a list of such objects, posted
+    together or not at all. An M-Pesa payment that was already posted is
+    reported as a duplicate instead of being applied twice.
     """
-    loan_id = request.data.get('loan_id')
-    amount = request.data.get('amount')
-    mpesa_transaction_id = request.data.get('mpesa_transaction_id')
+    batch = request.data.get('repayments')
+    entries = batch if isinstance(batch, list) else [request.data]
     
     try:
-        # Verify the loan belongs to the user
-        loan = Loan.objects.get(id=loan_id, user=request.user)
-        
-        repayment = LoanService.process_repayment(loan_id, amount, mpesa_transaction_id)
-        
-        return Response({
-            'success': True,
-            'message': 'Repayment processed successfully',
-            'repayment_id': str(repayment.id),
-            'amount_paid': str(repayment.amount),
-            'loan_status': repayment.loan.status
-        })
+        # Only the user's own loans are found, so this is also the ownership check
+        results = LoanService.post_repayments([{
+            'loan_id': entry.get('loan_id'),
+            'amount': entry.get('amount'),
+            'mpesa_transaction_id': entry.get('mpesa_transaction_id'),
+            'mpesa_receipt_number': entry.get('mpesa_receipt_number'),
+        } for entry in entries], user=request.user)
         
     except Loan.DoesNotExist:
         return Response({
             'success': False,
             'message': 'Loan not found'
         }, status=status.HTTP_404_NOT_FOUND)
-    except ValueError as e:
+    except (ValueError, AttributeError) as e:
         return Response({
             'success': False,
-            'message': str(e)
+            'message': str(e) if isinstance(e, ValueError) else 'Each repayment must be an object'
         }, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         logger.error(f"Error processing repayment: {str(e)}")
@@ -169,6 +198,26 @@ def process_repayment(request):
             'success': False,
             'message': 'Internal server error'
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    repayments_data = [{
+        'repayment_id': str(repayment.id),
+        'amount_paid': str(repayment.amount),
+        'loan_status': repayment.loan.status,
+        'duplicate': not created
+    } for repayment, created in results]
+    
+    if isinstance(batch, list):
+        return Response({
+            'success': True,
+            'message': f"{sum(created for _, created in results)} of {len(results)} repayments processed",
+            'repayments': repayments_data
+        })
+    
+    return Response({
+        'success': True,
+        'message': 'Repayment already processed' if repayments_data[0]['duplicate'] else 'Repayment processed successfully',
+        **repayments_data[0]
+    })
 
 # Admin endpoints (keep separate permissions if needed)
 @api_view(['POST'])
@@ -209,6 +258,82 @@ def disburse_loan(request):
             'message': 'Internal server error'
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def disburse_loans(request):
+    """
+    Disburse one batch of approved loans (Admin function)
+    
+    Takes the oldest approved loans, or only those listed in loan_ids,
+    up to batch_size of them (at most DISBURSEMENT_BATCH_SIZE).
+    """
+    import uuid
+    
+    if not request.user.is_staff:
+        return Response({
+            'success': False,
+            'message': 'Permission denied'
+        }, status=status.HTTP_403_FORBIDDEN)
+    
+    loan_ids = request.data.get('loan_ids')
+    try:
+        batch_size = int(request.data.get('batch_size', DISBURSEMENT_BATCH_SIZE))
+        if not 1 <= batch_size <= DISBURSEMENT_BATCH_SIZE:
+            raise ValueError
+    except (TypeError, ValueError):
+        return Response({
+            'success': False,
+            'message': f'batch_size must be between 1 and {DISBURSEMENT_BATCH_SIZE}'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    if loan_ids is not None:
+        try:
+            if not isinstance(loan_ids, list) or len(loan_ids) > batch_size:
+                raise ValueError
+            loan_ids = [uuid.UUID(str(loan_id)) for loan_id in loan_ids]
+        except ValueError:
+            return Response({
+                'success': False,
+                'message': f'loan_ids must be a list of at most {batch_size} loan IDs'
+            }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        batch, _ = DisbursementService.disburse_batch(loan_ids=loan_ids, batch_size=batch_size, triggered_by='API')
+        
+        if batch is None:
+            return Response({
+                'success': True,
+                'message': 'No approved loans to disburse',
+                'loans_claimed': 0
+            })
+        
+        return Response({
+            'success': True,
+            'message': f'Disbursed {batch.loans_disbursed} of {batch.loans_claimed} loans',
+            'batch_id': str(batch.id),
+            'payout_client': batch.payout_client,
+            'loans_claimed': batch.loans_claimed,
+            'loans_disbursed': batch.loans_disbursed,
+            'loans_failed': batch.loans_failed,
+            'loans_unknown': batch.loans_unknown,
+            'amount_disbursed': str(batch.amount_disbursed),
+            'duration_ms': batch.duration_ms,
+            'loans_per_second': batch.loans_per_second,
+            'failures': batch.failures
+        })
+        
+    except ValueError as e:
+        return Response({
+            'success': False,
+            'message': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        logger.error(f"Error disbursing loan batch: {str(e)}")
+        return Response({
+            'success': False,
+            'message': 'Internal server error'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def check_overdue_loans(request):
@@ -223,11 +348,12 @@ def check_overdue_loans(request):
         }, status=status.HTTP_403_FORBIDDEN)
     
     try:
-        overdue_count = LoanService.check_overdue_loans()
+        overdue_ids, _ = LoanService.check_overdue_loans(triggered_by='API')
         
         return Response({
             'success': True,
-            'message': f'Updated {overdue_count} loans to overdue status'
+            'message': f'Updated {len(overdue_ids)} loans to overdue status',
+            'loan_ids': [str(loan_id) for loan_id in overdue_ids]
         })
         
     except Exception as e:
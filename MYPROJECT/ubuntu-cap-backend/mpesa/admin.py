@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import MpesaTransaction, MpesaProfile, MpesaPaymentRequest, MpesaWebhookLog
+from .models import MpesaTransaction, MpesaProfile, MpesaDailyRollup, MpesaPaymentRequest, MpesaWebhookLog
 
 @admin.register(MpesaTransaction)
 class MpesaTransactionAdmin(admin.ModelAdmin):
@@ -16,6 +16,13 @@ class MpesaProfileAdmin(admin.ModelAdmin):
     search_fields = ['user__phone_number']
     readonly_fields = ['created_at', 'updated_at']
 
+@admin.register(MpesaDailyRollup)
+class MpesaDailyRollupAdmin(admin.ModelAdmin):
+    list_display = ['user', 'day', 'transaction_count', 'income_total', 'expense_total']
+    list_filter = ['day']
+    search_fields = ['user__phone_number']
+    readonly_fields = ['updated_at']
+
 @admin.register(MpesaPaymentRequest)
 class MpesaPaymentRequestAdmin(admin.ModelAdmin):
     list_display = ['user', 'phone_number', 'amount', 'status', 'created_at', 'callback_received_at']
@@ -25,8 +32,9 @@ class MpesaPaymentRequestAdmin(admin.ModelAdmin):
 
 @admin.register(MpesaWebhookLog)
 class MpesaWebhookLogAdmin(admin.ModelAdmin):
-    list_display = ['webhook_type', 'created_at', 'processed', 'response_status']
+    list_display = ['webhook_type', 'checkout_request_id', 'created_at', 'processed', 'attempts', 'response_status']
     list_filter = ['webhook_type', 'processed', 'created_at']
+    search_fields = ['checkout_request_id']
     readonly_fields = ['created_at', 'processed_at']
     
     def has_add_permission(self, request):
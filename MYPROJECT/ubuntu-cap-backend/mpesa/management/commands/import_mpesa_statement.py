@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from users.models import User
+from mpesa.services import IMPORT_BATCH_SIZE, StatementImportError, StatementImportService
+
+
+class Command(BaseCommand):
+    help = 'Import an M-Pesa statement export (CSV, JSON or JSON Lines) for a user'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Statement file to import')
+        parser.add_argument(
+            '--phone', required=True,
+            help='Phone number of the user the statement belongs to'
+        )
+        parser.add_argument(
+            '--format', choices=StatementImportService.FORMATS,
+            help='Statement format (default: guessed from the file extension)'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=IMPORT_BATCH_SIZE,
+            help=f'Rows written per batch (default: {IMPORT_BATCH_SIZE})'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+
+        try:
+            user = User.objects.get(phone_number=options['phone'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user with phone number {options['phone']}")
+
+        path = options['path']
+        file_format = options['format'] or StatementImportService.detect_format(path)
+        importer = StatementImportService(user, batch_size=options['batch_size'])
+
+        try:
+            with open(path, 'rb') as statement:
+                stats = importer.import_file(statement, file_format)
+        except OSError as e:
+            raise CommandError(f'Could not open {path}: {e}')
+        except StatementImportError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {stats['rows_imported']} of {stats['rows_read']} rows in "
+            f"{stats['elapsed_seconds']}s ({stats['rows_per_second']} rows/sec)"
+        ))
+        self.stdout.write(
+            f"Duplicates: {stats['duplicates']}, invalid: {stats['invalid_rows']}, "
+            f"skipped: {stats['skipped_rows']}"
+        )
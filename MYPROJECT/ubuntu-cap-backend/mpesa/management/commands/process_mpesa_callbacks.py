@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mpesa.services import CallbackQueueService
+
+
+class Command(BaseCommand):
+    help = 'Process queued M-Pesa webhook callbacks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Callbacks claimed per poll (default: 100)'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=2.0,
+            help='Seconds to wait when the queue is empty (default: 2)'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Drain the queue and exit instead of polling'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1 or options['interval'] < 0:
+            raise CommandError('--batch-size must be positive and --interval non-negative')
+
+        total = {'processed': 0, 'failed': 0}
+        try:
+            while True:
+                stats = CallbackQueueService.process_pending(batch_size=batch_size)
+                for key in total:
+                    total[key] += stats[key]
+                if stats['processed'] or stats['failed']:
+                    self.stdout.write(
+                        f"Processed {stats['processed']} callbacks, {stats['failed']} failed"
+                    )
+                    # Keep draining while there is work left
+                    if stats['processed'] + stats['failed'] >= batch_size:
+                        continue
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {total['processed']} callbacks processed, {total['failed']} failed"
+        ))
@@ -0,0 +1,60 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from mpesa.models import MpesaWebhookLog
+from mpesa.services import CallbackQueueService
+
+
+class Command(BaseCommand):
+    help = 'Replay unprocessed M-Pesa webhook logs, including ones that ran out of retries'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            help='Only replay webhooks received on or after this date (YYYY-MM-DD)'
+        )
+        parser.add_argument(
+            '--type', dest='webhook_type',
+            help='Only replay webhooks of this type (e.g. STK_PUSH)'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report how many webhooks would be replayed without processing them'
+        )
+
+    def handle(self, *args, **options):
+        logs = CallbackQueueService.pending(include_exhausted=True)
+        if options['since']:
+            try:
+                since = datetime.strptime(options['since'], '%Y-%m-%d')
+            except ValueError:
+                raise CommandError('--since must be a date in YYYY-MM-DD format')
+            logs = logs.filter(created_at__gte=timezone.make_aware(since))
+        if options['webhook_type']:
+            logs = logs.filter(webhook_type=options['webhook_type'])
+
+        count = logs.count()
+        if options['dry_run']:
+            self.stdout.write(f'{count} unprocessed webhooks would be replayed')
+            return
+
+        # Give rows that ran out of retries a fresh set of attempts, due now
+        log_ids = list(logs.values_list('id', flat=True))
+        logs.update(attempts=0, next_attempt_at=None)
+
+        processed = failed = 0
+        for log_id in log_ids:
+            # Rows currently held by a worker are left to that worker
+            if not CallbackQueueService.claim(log_id):
+                continue
+            webhook_log = MpesaWebhookLog.objects.get(id=log_id)
+            if CallbackQueueService.process(webhook_log):
+                processed += 1
+            else:
+                failed += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Replayed {processed} of {count} webhooks ({failed} failed)'
+        ))
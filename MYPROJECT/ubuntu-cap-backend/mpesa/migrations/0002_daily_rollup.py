@@ -0,0 +1,42 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mpesa', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mpesaprofile',
+            name='rollup_watermark',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='MpesaDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('transaction_count', models.IntegerField(default=0)),
+                ('income_total', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('expense_total', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('fuliza_borrowed', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('fuliza_repaid', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('counterparties', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'M-Pesa Daily Rollup',
+                'verbose_name_plural': 'M-Pesa Daily Rollups',
+                'ordering': ['-day'],
+                'unique_together': {('user', 'day')},
+            },
+        ),
+    ]
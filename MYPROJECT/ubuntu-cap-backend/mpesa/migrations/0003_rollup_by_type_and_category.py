@@ -0,0 +1,73 @@
+from django.db import migrations, models
+
+
+def reset_rollups(apps, schema_editor):
+    """Rollups are derived data: drop them so the next refresh rebuilds them per type and category"""
+    apps.get_model('mpesa', 'MpesaDailyRollup').objects.all().delete()
+    apps.get_model('mpesa', 'MpesaProfile').objects.update(rollup_watermark=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mpesa', '0002_daily_rollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(reset_rollups, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='mpesadailyrollup',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='mpesadailyrollup',
+            name='transaction_type',
+            field=models.CharField(choices=[('C2B', 'Customer to Business'), ('B2C', 'Business to Customer'), ('C2C', 'Customer to Customer'), ('B2B', 'Business to Business')], default='C2B', max_length=10),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='mpesadailyrollup',
+            name='transaction_category',
+            field=models.CharField(choices=[('DEPOSIT', 'Deposit'), ('WITHDRAWAL', 'Withdrawal'), ('PAYMENT', 'Payment'), ('TRANSFER', 'Transfer'), ('AIRTIME', 'Airtime Purchase'), ('FULIZA', 'Fuliza Credit')], default='PAYMENT', max_length=20),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='mpesadailyrollup',
+            name='amount_sum',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=15),
+        ),
+        migrations.AddField(
+            model_name='mpesadailyrollup',
+            name='amount_sq_sum',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='mpesadailyrollup',
+            name='credit_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='mpesadailyrollup',
+            name='credit_sum',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=15),
+        ),
+        migrations.AddField(
+            model_name='mpesadailyrollup',
+            name='debit_sum',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=15),
+        ),
+        migrations.AddField(
+            model_name='mpesadailyrollup',
+            name='evening_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='mpesadailyrollup',
+            name='weekend_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterUniqueTogether(
+            name='mpesadailyrollup',
+            unique_together={('user', 'day', 'transaction_type', 'transaction_category')},
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.8 on 2026-10-18 09:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mpesa', '0003_rollup_by_type_and_category'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mpesawebhooklog',
+            name='attempts',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='mpesawebhooklog',
+            name='checkout_request_id',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='mpesawebhooklog',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='mpesawebhooklog',
+            index=models.Index(fields=['processed', 'created_at'], name='mpesa_mpesa_process_ebb441_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mpesawebhooklog',
+            index=models.Index(fields=['checkout_request_id'], name='mpesa_mpesa_checkou_d92e04_idx'),
+        ),
+    ]
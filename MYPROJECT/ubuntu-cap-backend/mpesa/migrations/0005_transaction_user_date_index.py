@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mpesa', '0004_webhook_queue'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='mpesatransaction',
+            index=models.Index(fields=['user', '-transaction_date', '-id'], name='mpesa_mpesa_user_id_5e82f0_idx'),
+        ),
+    ]
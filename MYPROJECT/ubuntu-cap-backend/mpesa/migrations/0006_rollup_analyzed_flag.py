@@ -0,0 +1,25 @@
+from django.db import migrations
+
+
+def reset_rollups(apps, schema_editor):
+    """
+    Rollups are derived data: drop them and clear the analyzed flags, so the
+    next refresh rebuilds them, including any rows the watermark skipped
+    """
+    apps.get_model('mpesa', 'MpesaDailyRollup').objects.all().delete()
+    apps.get_model('mpesa', 'MpesaTransaction').objects.filter(analyzed=True).update(analyzed=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mpesa', '0005_transaction_user_date_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(reset_rollups, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='mpesaprofile',
+            name='rollup_watermark',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mpesa', '0006_rollup_analyzed_flag'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mpesawebhooklog',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -41,7 +41,7 @@ class MpesaTransaction(models.Model):
     balance = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     
     # Analysis flags
-    analyzed = models.BooleanField(default=False)
+    analyzed = models.BooleanField(default=False)  # Folded into the daily rollups
     is_recurring = models.BooleanField(default=False)
     is_business = models.BooleanField(default=False)
     
@@ -58,6 +58,8 @@ class MpesaTransaction(models.Model):
             models.Index(fields=['mpesa_receipt_number']),
             models.Index(fields=['phone_number', 'transaction_date']),
             models.Index(fields=['user', 'analyzed']),
+            # A user's history newest first, for keyset pagination
+            models.Index(fields=['user', '-transaction_date', '-id']),
         ]
         verbose_name = 'M-Pesa Transaction'
         verbose_name_plural = 'M-Pesa Transactions'
@@ -98,6 +100,46 @@ class MpesaProfile(models.Model):
     def __str__(self):
         return f"M-Pesa Profile - {self.user.phone_number}"
 
+class MpesaDailyRollup(models.Model):
+    """
+    Per-user daily totals of M-Pesa transactions by type and category, maintained incrementally
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_rollups')
+    day = models.DateField()  # Local calendar day of the transactions
+    transaction_type = models.CharField(max_length=10, choices=MpesaTransaction.TRANSACTION_TYPES)
+    transaction_category = models.CharField(max_length=20, choices=MpesaTransaction.TRANSACTION_CATEGORIES)
+    
+    # Amount statistics
+    transaction_count = models.IntegerField(default=0)
+    amount_sum = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    amount_sq_sum = models.FloatField(default=0)  # Sum of squared amounts, for standard deviation
+    credit_count = models.IntegerField(default=0)  # Transactions with a positive amount
+    credit_sum = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    debit_sum = models.DecimalField(max_digits=15, decimal_places=2, default=0)  # Sum of negative amounts
+    
+    # Time-of-day patterns (local time)
+    evening_count = models.IntegerField(default=0)  # Transactions from 6PM
+    weekend_count = models.IntegerField(default=0)
+    
+    # Profile analysis totals
+    income_total = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    expense_total = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    fuliza_borrowed = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    fuliza_repaid = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    counterparties = models.JSONField(default=list)  # Distinct counterparties seen in this bucket
+    
+    # Timestamps
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-day']
+        unique_together = ['user', 'day', 'transaction_type', 'transaction_category']
+        verbose_name = 'M-Pesa Daily Rollup'
+        verbose_name_plural = 'M-Pesa Daily Rollups'
+    
+    def __str__(self):
+        return f"Rollup - {self.user.phone_number} - {self.day} - {self.transaction_type}/{self.transaction_category}"
+
 class MpesaPaymentRequest(models.Model):
     """
     Track STK Push payment requests for loan repayments
@@ -170,12 +212,22 @@ class MpesaWebhookLog(models.Model):
     processed = models.BooleanField(default=False)
     processing_error = models.TextField(blank=True, null=True)
     
+    # Callback queue
+    checkout_request_id = models.CharField(max_length=100, blank=True, null=True)
+    attempts = models.IntegerField(default=0)
+    claimed_at = models.DateTimeField(null=True, blank=True)  # Set while a worker is processing the row
+    next_attempt_at = models.DateTimeField(null=True, blank=True)  # A failed row is not retried before this time
+    
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     processed_at = models.DateTimeField(null=True, blank=True)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['processed', 'created_at']),
+            models.Index(fields=['checkout_request_id']),
+        ]
         verbose_name = 'M-Pesa Webhook Log'
         verbose_name_plural = 'M-Pesa Webhook Logs'
     
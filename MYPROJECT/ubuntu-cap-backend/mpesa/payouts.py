@@ -0,0 +1,277 @@
+"""
+Clients that send B2C payouts (loan disbursements) to M-Pesa
+
+Every client takes a list of Payout and returns a PayoutResult per
+payout reference. Requests to the provider go through a RateLimiter, so
+a large batch is spread out instead of tripping the provider's
+throttling. The client used is chosen by settings.PAYOUT_CLIENT; the
+'fake' client accepts every payout without calling anyone, for tests and
+local development.
+"""
+import base64
+import logging
+import threading
+import time
+from decimal import Decimal
+
+import requests
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Payout API requests sent per second when PAYOUT_REQUESTS_PER_SECOND is not set
+DEFAULT_REQUESTS_PER_SECOND = 5
+
+# Seconds to wait for the provider to answer one request
+PAYOUT_TIMEOUT = 30
+
+
+class Payout:
+    """
+    One payment to send; reference identifies it in the results
+    """
+
+    def __init__(self, reference, phone_number, amount, remarks='Loan disbursement'):
+        self.reference = str(reference)
+        self.phone_number = phone_number
+        self.amount = amount
+        self.remarks = remarks
+
+
+class PayoutResult:
+    """
+    The provider's answer for one payout
+
+    ACCEPTED means the provider took the payout for processing and
+    transaction_id is its reference for it. REJECTED means it explicitly
+    refused it, so no money moved and it is safe to retry. UNKNOWN means
+    there was no usable answer (timeout, connection error, unreadable
+    reply): the payout may or may not have been queued and must be
+    reconciled with the provider, never simply retried.
+    """
+
+    ACCEPTED = 'ACCEPTED'
+    REJECTED = 'REJECTED'
+    UNKNOWN = 'UNKNOWN'
+
+    def __init__(self, status, transaction_id=None, error=None):
+        self.status = status
+        self.transaction_id = transaction_id
+        self.error = error
+
+    @property
+    def accepted(self):
+        return self.status == PayoutResult.ACCEPTED
+
+    @property
+    def rejected(self):
+        return self.status == PayoutResult.REJECTED
+
+
+class PayoutNotSent(Exception):
+    """Raised by a client when a request failed before it reached the provider"""
+
+
+class RateLimiter:
+    """
+    Spaces calls to wait() at least 1/rate seconds apart, across threads
+
+    A rate of 0 or None does not limit.
+    """
+
+    def __init__(self, rate, clock=time.monotonic, sleep=time.sleep):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.clock = clock
+        self.sleep = sleep
+        self._next = None
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = self.clock()
+            if self._next is not None and self._next > now:
+                self.sleep(self._next - now)
+                now = self._next
+            self._next = now + self.interval
+
+
+class PayoutClient:
+    """
+    Sends payouts in requests of at most max_recipients, one request per
+    rate limiter slot
+
+    Subclasses implement _send(payouts), returning {reference: PayoutResult}.
+    A request that raises PayoutNotSent marks its payouts REJECTED; any
+    other exception marks them UNKNOWN, since the provider may have acted
+    on the request. The remaining requests are still sent.
+    """
+
+    name = None
+    max_recipients = 1
+
+    def __init__(self, rate=None, limiter=None):
+        if rate is None:
+            rate = getattr(settings, 'PAYOUT_REQUESTS_PER_SECOND', DEFAULT_REQUESTS_PER_SECOND)
+        self.limiter = limiter or RateLimiter(rate)
+        self.requests_sent = 0
+
+    def pay(self, payouts):
+        results = {}
+        for start in range(0, len(payouts), self.max_recipients):
+            chunk = payouts[start:start + self.max_recipients]
+            self.limiter.wait()
+            self.requests_sent += 1
+            try:
+                results.update(self._send(chunk))
+            except PayoutNotSent as e:
+                logger.error(f"{len(chunk)} payouts not sent through {self.name}: {str(e)}")
+                for payout in chunk:
+                    results[payout.reference] = PayoutResult(PayoutResult.REJECTED, error=str(e))
+            except Exception as e:
+                logger.error(f"Error sending {len(chunk)} payouts through {self.name}, outcome unknown: {str(e)}")
+                for payout in chunk:
+                    results[payout.reference] = PayoutResult(PayoutResult.UNKNOWN, error=str(e))
+
+        for payout in payouts:
+            results.setdefault(payout.reference, PayoutResult(PayoutResult.UNKNOWN, error='No response from provider'))
+        return results
+
+    def _send(self, payouts):
+        raise NotImplementedError
+
+
+class FakePayoutClient(PayoutClient):
+    """
+    Accepts every payout without calling a provider
+
+    Phone numbers in fail_numbers are rejected instead. Each request's
+    payouts are kept in sent.
+    """
+
+    name = 'fake'
+    max_recipients = 10
+
+    def __init__(self, rate=0, limiter=None, fail_numbers=()):
+        super().__init__(rate=rate, limiter=limiter)
+        self.fail_numbers = set(fail_numbers)
+        self.sent = []
+
+    def _send(self, payouts):
+        self.sent.append(payouts)
+        results = {}
+        for payout in payouts:
+            if payout.phone_number in self.fail_numbers:
+                results[payout.reference] = PayoutResult(PayoutResult.REJECTED, error='Payout rejected')
+            else:
+                results[payout.reference] = PayoutResult(
+                    PayoutResult.ACCEPTED, transaction_id=f'FAKE-{payout.reference[:8]}'
+                )
+        return results
+
+
+class DarajaPayoutClient(PayoutClient):
+    """
+    Safaricom Daraja B2C API, one payout per request
+
+    Reads MPESA_B2C_* settings. The final outcome of each payout is posted
+    later to MPESA_B2C_RESULT_URL; accepted here means Daraja queued it.
+    Only a readable error reply with a 4xx status counts as a rejection;
+    server errors and unreadable replies leave the outcome unknown. M-Pesa
+    only pays whole shillings, so an amount with cents is rejected without
+    being sent rather than silently truncated.
+    """
+
+    name = 'daraja'
+    max_recipients = 1
+
+    def __init__(self, rate=None, limiter=None):
+        super().__init__(rate=rate, limiter=limiter)
+        self.base_url = getattr(settings, 'MPESA_B2C_BASE_URL', 'https://sandbox.safaricom.co.ke')
+        self.session = requests.Session()
+        self._token = None
+        self._token_expires = 0
+
+    def _send(self, payouts):
+        payout, = payouts
+        amount = Decimal(str(payout.amount))
+        if amount != amount.to_integral_value():
+            raise PayoutNotSent(f'M-Pesa only pays whole shillings, not {payout.amount}')
+        try:
+            token = self._access_token()
+        except Exception as e:
+            raise PayoutNotSent(f'Could not get an access token: {str(e)}')
+
+        response = self.session.post(
+            f'{self.base_url}/mpesa/b2c/v1/paymentrequest',
+            headers={'Authorization': f'Bearer {token}'},
+            json={
+                'InitiatorName': settings.MPESA_B2C_INITIATOR_NAME,
+                'SecurityCredential': settings.MPESA_B2C_SECURITY_CREDENTIAL,
+                'CommandID': 'BusinessPayment',
+                'Amount': int(amount),
+                'PartyA': settings.MPESA_B2C_SHORTCODE,
+                'PartyB': _msisdn(payout.phone_number),
+                'Remarks': payout.remarks,
+                'QueueTimeOutURL': settings.MPESA_B2C_TIMEOUT_URL,
+                'ResultURL': settings.MPESA_B2C_RESULT_URL,
+                'Occasion': payout.reference,
+            },
+            timeout=PAYOUT_TIMEOUT,
+        )
+        try:
+            data = response.json()
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            return {payout.reference: PayoutResult(
+                PayoutResult.UNKNOWN, error=f'Unreadable reply (HTTP {response.status_code})'
+            )}
+
+        error = data.get('errorMessage') or data.get('ResponseDescription') or f'HTTP {response.status_code}'
+        if response.ok and str(data.get('ResponseCode')) == '0':
+            result = PayoutResult(PayoutResult.ACCEPTED, transaction_id=data.get('ConversationID'))
+        elif 400 <= response.status_code < 500 or (response.ok and 'ResponseCode' in data):
+            result = PayoutResult(PayoutResult.REJECTED, error=error)
+        else:
+            result = PayoutResult(PayoutResult.UNKNOWN, error=error)
+        return {payout.reference: result}
+
+    def _access_token(self):
+        """OAuth token for the API, reused until shortly before it expires"""
+        if self._token is None or time.monotonic() >= self._token_expires:
+            credentials = f'{settings.MPESA_B2C_CONSUMER_KEY}:{settings.MPESA_B2C_CONSUMER_SECRET}'
+            response = self.session.get(
+                f'{self.base_url}/oauth/v1/generate?grant_type=client_credentials',
+                headers={'Authorization': f'Basic {base64.b64encode(credentials.encode()).decode()}'},
+                timeout=PAYOUT_TIMEOUT,
+            )
+            response.raise_for_status()
+            data = response.json()
+            self._token = data['access_token']
+            self._token_expires = time.monotonic() + int(data.get('expires_in', 3599)) - 60
+        return self._token
+
+
+PAYOUT_CLIENTS = {
+    client.name: client
+    for client in [FakePayoutClient, DarajaPayoutClient]
+}
+
+
+def get_payout_client(name=None):
+    """A new instance of the named payout client, settings.PAYOUT_CLIENT by default"""
+    name = name or getattr(settings, 'PAYOUT_CLIENT', 'fake')
+    try:
+        return PAYOUT_CLIENTS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown payout client '{name}'. Choose from: {', '.join(PAYOUT_CLIENTS)}")
+
+
+def _msisdn(phone_number):
+    """Phone number in the 2547XXXXXXXX form M-Pesa expects"""
+    phone_number = phone_number.lstrip('+')
+    if phone_number.startswith('0'):
+        phone_number = '254' + phone_number[1:]
+    return phone_number
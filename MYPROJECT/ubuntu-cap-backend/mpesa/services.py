@@ -1,15 +1,58 @@
 import requests
+import csv
+import io
 import json
 import logging
+import os
+import re
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
 from django.utils import timezone
-from datetime import datetime, timedelta
-from .models import MpesaTransaction, MpesaProfile, MpesaPaymentRequest
+from datetime import datetime, time, timedelta
+from time import perf_counter
+from .models import MpesaTransaction, MpesaProfile, MpesaPaymentRequest, MpesaDailyRollup, MpesaWebhookLog
+from users.models import User
+from credit_scoring.score_cache import score_cache
 import africastalking
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
 
 logger = logging.getLogger(__name__)
 
+# Days of history covered by the M-Pesa profile analysis
+PROFILE_WINDOW_DAYS = 90
+
+# Days of history kept in the daily rollups (the credit scoring window)
+ROLLUP_RETENTION_DAYS = 180
+
+# Transactions marked as folded into the rollups per UPDATE
+ROLLUP_MARK_BATCH_SIZE = 500
+
+# Running totals kept on each MpesaDailyRollup row
+ROLLUP_COUNT_FIELDS = ['transaction_count', 'credit_count', 'evening_count', 'weekend_count']
+ROLLUP_AMOUNT_FIELDS = [
+    'amount_sum', 'credit_sum', 'debit_sum',
+    'income_total', 'expense_total', 'fuliza_borrowed', 'fuliza_repaid',
+]
+
+# Transactions written per bulk_create when importing statements
+IMPORT_BATCH_SIZE = 1000
+
+# Characters read from a statement file at a time
+IMPORT_CHUNK_SIZE = 64 * 1024
+
+# Insignificant whitespace between JSON values
+JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+# Callback processing attempts before a webhook is left for manual replay
+WEBHOOK_MAX_ATTEMPTS = 5
+
+# A claimed webhook is handed to another worker if not finished within this time
+WEBHOOK_CLAIM_TIMEOUT = timedelta(minutes=5)
+
+# Wait before retrying a failed webhook, doubled after each further failure
+WEBHOOK_RETRY_DELAY = timedelta(minutes=1)
+
 class MpesaService:
     """
     Service for handling M-Pesa API interactions
@@ -74,13 +117,13 @@ class MpesaService:
                     phone_number=user.phone_number,
                     counterparty=counterparty,
                     transaction_date=transaction_date,
-                    description=f"Simulated transaction {i}",
-                    analyzed=True
+                    description=f"Simulated transaction {i}"
                 )
                 transactions.append(transaction)
             
-            # Bulk create transactions
+            # Bulk create transactions and fold them into the daily rollups
             MpesaTransaction.objects.bulk_create(transactions)
+            TransactionRollupService.refresh(user)
             
             logger.info(f"Simulated {len(transactions)} M-Pesa transactions for {user.phone_number}")
             return len(transactions)
@@ -89,77 +132,244 @@ class MpesaService:
             logger.error(f"Error simulating M-Pesa data: {str(e)}")
             return 0
     
-    def analyze_transactions(self, user):
+    def analyze_transactions(self, user, full_refresh=False):
         """
         Analyze M-Pesa transactions to generate financial profile
         """
-        try:
-            transactions = MpesaTransaction.objects.filter(
-                user=user,
-                transaction_date__gte=timezone.now() - timedelta(days=90)  # Last 3 months
-            )
-            
-            if not transactions.exists():
-                return None
+        return TransactionRollupService.analyze_profile(user, full_refresh=full_refresh)
+
+class TransactionRollupService:
+    """
+    Maintains per-user daily rollups of M-Pesa transactions
+    
+    Rollups are bucketed by (day, transaction type, category). Each refresh
+    folds in only the in-window transactions not yet marked analyzed, marks
+    exactly those rows, and drops days older than the retention window, so
+    reads and re-analysis cost O(window days) and O(new transactions)
+    rather than O(history). A per-row flag rather than a created_at
+    watermark means rows committed late (e.g. by an import running
+    alongside a refresh) are still folded by the next refresh.
+    """
+    
+    @staticmethod
+    def window_start(days=ROLLUP_RETENTION_DAYS):
+        """First local day inside a window of the given length"""
+        return timezone.localdate() - timedelta(days=days)
+    
+    @staticmethod
+    def pending(window_start):
+        """Transactions inside the window that are not in the rollups yet"""
+        return MpesaTransaction.objects.filter(
+            analyzed=False,
+            transaction_date__gte=timezone.make_aware(datetime.combine(window_start, time.min))
+        )
+    
+    @staticmethod
+    def refresh(user, full_refresh=False):
+        """
+        Fold new transactions into the user's daily rollups and return the profile
+        """
+        window_start = TransactionRollupService.window_start()
+        
+        with transaction.atomic():
+            # Lock the profile so concurrent refreshes cannot fold the same rows twice
+            MpesaProfile.objects.get_or_create(user=user)
+            profile = MpesaProfile.objects.select_for_update().get(user=user)
             
-            # Calculate financial metrics
-            total_income = Decimal('0')
-            total_expenses = Decimal('0')
-            transaction_counts = {}
-            unique_contacts = set()
-            fuliza_data = {'borrowed': Decimal('0'), 'repaid': Decimal('0')}
+            new_transactions = TransactionRollupService.pending(window_start).filter(user=user)
+            if full_refresh:
+                MpesaDailyRollup.objects.filter(user=user).delete()
+                new_transactions = MpesaTransaction.objects.filter(
+                    user=user,
+                    transaction_date__gte=timezone.make_aware(datetime.combine(window_start, time.min))
+                )
             
-            for transaction in transactions:
+            buckets = {}
+            folded_ids = []
+            rows = new_transactions.order_by().values_list(
+                'id', 'transaction_type', 'transaction_category', 'amount', 'counterparty',
+                'description', 'transaction_date'
+            )
+            for transaction_id, transaction_type, category, amount, counterparty, description, transaction_date in rows.iterator(chunk_size=2000):
+                folded_ids.append(transaction_id)
+                local_date = timezone.localtime(transaction_date)
+                key = (local_date.date(), transaction_type, category)
+                bucket = buckets.get(key)
+                if bucket is None:
+                    bucket = buckets[key] = TransactionRollupService._empty_bucket()
+                
+                bucket['transaction_count'] += 1
+                bucket['amount_sum'] += amount
+                bucket['amount_sq_sum'] += float(amount) ** 2
+                if amount > 0:
+                    bucket['credit_count'] += 1
+                    bucket['credit_sum'] += amount
+                elif amount < 0:
+                    bucket['debit_sum'] += amount
+                
+                # Time-based patterns
+                if local_date.hour >= 18:
+                    bucket['evening_count'] += 1
+                if local_date.weekday() >= 5:  # Saturday and Sunday
+                    bucket['weekend_count'] += 1
+                
                 # Categorize as income or expense
-                if transaction.transaction_type in ['C2B'] and transaction.amount > 1000:
-                    total_income += transaction.amount
+                if transaction_type == 'C2B' and amount > 1000:
+                    bucket['income_total'] += amount
                 else:
-                    total_expenses += transaction.amount
+                    bucket['expense_total'] += amount
                 
-                # Track unique contacts
-                if transaction.counterparty:
-                    unique_contacts.add(transaction.counterparty)
+                # Track unique contacts (including missing ones, which count once in scoring)
+                bucket['counterparties'].add(counterparty)
                 
                 # Analyze Fuliza usage (simplified)
-                if 'FULIZA' in transaction.description.upper():
-                    if transaction.amount > 0:
-                        fuliza_data['borrowed'] += transaction.amount
+                if 'FULIZA' in (description or '').upper():
+                    if amount > 0:
+                        bucket['fuliza_borrowed'] += amount
                     else:
-                        fuliza_data['repaid'] += abs(transaction.amount)
+                        bucket['fuliza_repaid'] += abs(amount)
+            
+            TransactionRollupService._merge_buckets(user, buckets)
+            
+            # Mark exactly the rows folded above; rows committed since the scan stay pending
+            for start in range(0, len(folded_ids), ROLLUP_MARK_BATCH_SIZE):
+                MpesaTransaction.objects.filter(
+                    id__in=folded_ids[start:start + ROLLUP_MARK_BATCH_SIZE]
+                ).update(analyzed=True)
+            
+            # Expire days that dropped out of the window
+            MpesaDailyRollup.objects.filter(user=user, day__lt=window_start).delete()
+        
+        if buckets:
+            # New transactions change the user's score inputs
+            score_cache.invalidate(user.id)
+            logger.debug(f"Folded {len(buckets)} rollup buckets for {user.phone_number}")
+        return profile
+    
+    @staticmethod
+    def refresh_stale(user_ids):
+        """
+        Refresh the rollups of those users that have in-window transactions not folded in yet
+        
+        Transactions older than the window are never folded, so importing
+        old history does not make a user stale.
+        """
+        stale_user_ids = TransactionRollupService.pending(
+            TransactionRollupService.window_start()
+        ).filter(user_id__in=user_ids).order_by().values_list('user_id', flat=True).distinct()
+        
+        for user in User.objects.filter(id__in=list(stale_user_ids)):
+            TransactionRollupService.refresh(user)
+    
+    @staticmethod
+    def _empty_bucket():
+        bucket = {field: 0 for field in ROLLUP_COUNT_FIELDS}
+        bucket.update({field: Decimal('0') for field in ROLLUP_AMOUNT_FIELDS})
+        bucket['amount_sq_sum'] = 0.0
+        bucket['counterparties'] = set()
+        return bucket
+    
+    @staticmethod
+    def _merge_buckets(user, buckets):
+        """Add bucket totals to the stored rollup rows"""
+        if not buckets:
+            return
+        
+        existing = {
+            (rollup.day, rollup.transaction_type, rollup.transaction_category): rollup
+            for rollup in MpesaDailyRollup.objects.filter(
+                user=user,
+                day__in={day for day, _, _ in buckets}
+            )
+        }
+        to_create = []
+        to_update = []
+        for key, bucket in buckets.items():
+            rollup = existing.get(key)
+            if rollup is None:
+                day, transaction_type, category = key
+                rollup = MpesaDailyRollup(
+                    user=user,
+                    day=day,
+                    transaction_type=transaction_type,
+                    transaction_category=category
+                )
+                to_create.append(rollup)
+            else:
+                to_update.append(rollup)
+            
+            for field in ROLLUP_COUNT_FIELDS + ROLLUP_AMOUNT_FIELDS + ['amount_sq_sum']:
+                setattr(rollup, field, getattr(rollup, field) + bucket[field])
+            counterparties = set(rollup.counterparties) | bucket['counterparties']
+            rollup.counterparties = sorted(counterparties, key=lambda name: (name is None, name or ''))
+        
+        MpesaDailyRollup.objects.bulk_create(to_create)
+        MpesaDailyRollup.objects.bulk_update(
+            to_update,
+            ROLLUP_COUNT_FIELDS + ROLLUP_AMOUNT_FIELDS + ['amount_sq_sum', 'counterparties']
+        )
+    
+    @staticmethod
+    def analyze_profile(user, full_refresh=False):
+        """
+        Refresh the rollups and rebuild the user's M-Pesa profile from them
+        """
+        try:
+            profile = TransactionRollupService.refresh(user, full_refresh=full_refresh)
+            
+            rollups = MpesaDailyRollup.objects.filter(
+                user=user,
+                day__gte=TransactionRollupService.window_start(PROFILE_WINDOW_DAYS)
+            )
+            totals = rollups.aggregate(
+                transaction_count=Sum('transaction_count'),
+                income_total=Sum('income_total'),
+                expense_total=Sum('expense_total'),
+                fuliza_borrowed=Sum('fuliza_borrowed'),
+                fuliza_repaid=Sum('fuliza_repaid'),
+                active_days=Count('day', distinct=True)
+            )
+            
+            transaction_count = totals['transaction_count'] or 0
+            if not transaction_count:
+                return None
+            
+            total_income = totals['income_total']
+            total_expenses = totals['expense_total']
             
             # Calculate metrics
             weekly_income = total_income / 13  # Approximate weeks in 3 months
             weekly_expenses = total_expenses / 13
             
-            # Transaction consistency (simple standard deviation approximation)
-            transaction_days = transactions.dates('transaction_date', 'day')
-            active_days = len(transaction_days)
-            total_days = 90
-            consistency_score = Decimal(str(active_days / total_days))
+            # Transaction consistency (share of days in the window with activity)
+            active_days = totals['active_days']
+            consistency_score = Decimal(str(active_days / PROFILE_WINDOW_DAYS))
             
             # Fuliza repayment ratio
             fuliza_ratio = None
-            if fuliza_data['borrowed'] > 0:
-                fuliza_ratio = fuliza_data['repaid'] / fuliza_data['borrowed']
+            if totals['fuliza_borrowed'] > 0:
+                fuliza_ratio = totals['fuliza_repaid'] / totals['fuliza_borrowed']
             
             # Network diversity
+            unique_contacts = set()
+            for counterparties in rollups.values_list('counterparties', flat=True):
+                unique_contacts.update(name for name in counterparties if name)
             network_diversity = len(unique_contacts)
             
             # Savings habit (simple heuristic)
             has_savings = weekly_income > weekly_expenses * Decimal('1.1')  # Income > Expenses by 10%
             
-            # Create or update M-Pesa profile
-            profile, created = MpesaProfile.objects.get_or_create(user=user)
+            # Update M-Pesa profile
             profile.average_weekly_income = weekly_income
             profile.average_weekly_expenses = weekly_expenses
             profile.transaction_consistency = consistency_score
             profile.has_savings_habit = has_savings
             profile.network_diversity = network_diversity
             profile.fuliza_repayment_ratio = fuliza_ratio
-            profile.total_transactions = transactions.count()
+            profile.total_transactions = transaction_count
             profile.total_volume = total_income + total_expenses
             profile.active_days = active_days
-            profile.avg_transaction_amount = (total_income + total_expenses) / transactions.count()
+            profile.avg_transaction_amount = (total_income + total_expenses) / transaction_count
             profile.last_analysis = timezone.now()
             profile.save()
             
@@ -170,6 +380,308 @@ class MpesaService:
             logger.error(f"Error analyzing M-Pesa transactions: {str(e)}")
             return None
 
+class StatementImportError(Exception):
+    """Raised when a statement file cannot be read at all"""
+
+class StatementImportService:
+    """
+    Streams M-Pesa statement exports into MpesaTransaction rows
+    
+    Accepts the CSV statement export (Receipt No., Completion Time, Details,
+    Transaction Status, Paid In, Withdrawn, Balance) as well as JSON arrays
+    or JSON Lines of the raw transaction shape kept in transaction_data.
+    Rows are parsed one at a time and written in batches, deduplicated on
+    mpesa_receipt_number, so memory stays bounded by the batch size no
+    matter how large the file is.
+    """
+    
+    FORMATS = ['csv', 'json']
+    
+    FIELD_ALIASES = {
+        'receipt': ['receipt no.', 'receipt no', 'receipt_number', 'mpesa_receipt_number',
+                    'mpesareceiptnumber', 'transid'],
+        'date': ['completion time', 'transaction_date', 'transactiondate', 'transtime'],
+        'details': ['details', 'description'],
+        'status': ['transaction status', 'status'],
+        'amount': ['amount', 'transamount'],
+        'paid_in': ['paid in'],
+        'withdrawn': ['withdrawn'],
+        'balance': ['balance', 'orgaccountbalance'],
+        'type': ['transaction_type', 'type'],
+        'category': ['transaction_category', 'category'],
+        'counterparty': ['counterparty'],
+        'phone_number': ['phone_number', 'msisdn'],
+    }
+    
+    DATE_FORMATS = ['%Y-%m-%d %H:%M:%S', '%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%Y%m%d%H%M%S']
+    
+    # (keyword in the details text, transaction type, category), first match wins
+    DETAIL_RULES = [
+        ('FULIZA', None, 'FULIZA'),
+        ('OVERDRAFT', None, 'FULIZA'),
+        ('AIRTIME', 'C2B', 'AIRTIME'),
+        ('WITHDRAW', 'C2B', 'WITHDRAWAL'),
+        ('DEPOSIT', 'B2C', 'DEPOSIT'),
+        ('BUSINESS PAYMENT', 'B2C', 'DEPOSIT'),
+        ('SALARY', 'B2C', 'DEPOSIT'),
+        ('PAY BILL', 'C2B', 'PAYMENT'),
+        ('MERCHANT', 'C2B', 'PAYMENT'),
+        ('BUY GOODS', 'C2B', 'PAYMENT'),
+        ('TRANSFER', 'C2C', 'TRANSFER'),
+        ('RECEIVED', 'C2C', 'TRANSFER'),
+        ('SEND MONEY', 'C2C', 'TRANSFER'),
+    ]
+    
+    def __init__(self, user, batch_size=IMPORT_BATCH_SIZE):
+        self.user = user
+        self.batch_size = batch_size
+        self.transaction_types = {choice for choice, _ in MpesaTransaction.TRANSACTION_TYPES}
+        self.categories = {choice for choice, _ in MpesaTransaction.TRANSACTION_CATEGORIES}
+    
+    @classmethod
+    def detect_format(cls, filename, default='csv'):
+        """Guess the statement format from a file name"""
+        extension = os.path.splitext(filename or '')[1].lower().lstrip('.')
+        if extension in ('json', 'jsonl', 'ndjson'):
+            return 'json'
+        if extension == 'csv':
+            return 'csv'
+        return default
+    
+    def import_file(self, fileobj, file_format='csv'):
+        """
+        Import a binary statement file and return import statistics
+        """
+        if file_format not in self.FORMATS:
+            raise StatementImportError(f"Unsupported statement format: {file_format}")
+        
+        stats = {
+            'rows_read': 0,
+            'rows_imported': 0,
+            'duplicates': 0,
+            'invalid_rows': 0,
+            'skipped_rows': 0,
+        }
+        started = perf_counter()
+        
+        text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+        try:
+            records = self._iter_csv(text) if file_format == 'csv' else self._iter_json(text)
+            batch = {}
+            for record in records:
+                stats['rows_read'] += 1
+                try:
+                    mpesa_transaction = self._build_transaction(record)
+                except (ValueError, InvalidOperation):
+                    stats['invalid_rows'] += 1
+                    continue
+                if mpesa_transaction is None:
+                    stats['skipped_rows'] += 1
+                    continue
+                
+                receipt = mpesa_transaction.mpesa_receipt_number
+                if receipt in batch:
+                    stats['duplicates'] += 1
+                    continue
+                batch[receipt] = mpesa_transaction
+                
+                if len(batch) >= self.batch_size:
+                    self._write_batch(batch, stats)
+                    batch = {}
+            self._write_batch(batch, stats)
+        except (csv.Error, UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise StatementImportError(f"Could not read statement file: {str(e)}")
+        finally:
+            # Leave the caller's file open
+            text.detach()
+        
+        if stats['rows_imported']:
+            TransactionRollupService.refresh(self.user)
+        
+        elapsed = perf_counter() - started
+        stats['elapsed_seconds'] = round(elapsed, 3)
+        stats['rows_per_second'] = round(stats['rows_read'] / elapsed) if elapsed > 0 else 0
+        
+        logger.info(
+            f"Imported {stats['rows_imported']} of {stats['rows_read']} statement rows for "
+            f"{self.user.phone_number} ({stats['duplicates']} duplicates, {stats['rows_per_second']} rows/sec)"
+        )
+        return stats
+    
+    def _write_batch(self, batch, stats):
+        """Insert a batch, skipping receipts that are already stored"""
+        if not batch:
+            return
+        existing = set(MpesaTransaction.objects.filter(
+            mpesa_receipt_number__in=list(batch)
+        ).values_list('mpesa_receipt_number', flat=True))
+        new_transactions = [row for receipt, row in batch.items() if receipt not in existing]
+        
+        # ignore_conflicts covers receipts inserted by a concurrent import; those
+        # rows are dropped silently, so count what was stored under our own IDs
+        MpesaTransaction.objects.bulk_create(new_transactions, ignore_conflicts=True)
+        imported = MpesaTransaction.objects.filter(id__in=[row.id for row in new_transactions]).count()
+        stats['rows_imported'] += imported
+        stats['duplicates'] += len(existing) + len(new_transactions) - imported
+    
+    def _iter_csv(self, text):
+        for row in csv.DictReader(text):
+            yield row
+    
+    def _iter_json(self, text):
+        """Yield objects from a JSON array or from JSON Lines without loading the whole file"""
+        decoder = json.JSONDecoder()
+        buffer = text.read(IMPORT_CHUNK_SIZE).lstrip()
+        
+        if not buffer.startswith('['):
+            # JSON Lines: one object per line
+            for line in self._iter_lines(buffer, text):
+                if line.strip():
+                    yield json.loads(line)
+            return
+        
+        # Parse from an offset into the buffer; the consumed prefix is only dropped on refill
+        pos = 1
+        eof = False
+        while True:
+            pos = JSON_WHITESPACE.match(buffer, pos).end()
+            if buffer.startswith(',', pos):
+                pos = JSON_WHITESPACE.match(buffer, pos + 1).end()
+            if buffer.startswith(']', pos):
+                return
+            try:
+                record, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                chunk = text.read(IMPORT_CHUNK_SIZE)
+                eof = not chunk
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+            yield record
+    
+    def _iter_lines(self, head, text):
+        """Lines of a text stream whose first chunk has already been read"""
+        lines = head.splitlines(keepends=True)
+        # The first chunk usually ends part-way through a line
+        pending = ''
+        if lines and not lines[-1].endswith(('\n', '\r')):
+            pending = lines.pop()
+        yield from lines
+        for line in text:
+            yield pending + line
+            pending = ''
+        if pending:
+            yield pending
+    
+    def _field(self, record, name):
+        for alias in self.FIELD_ALIASES[name]:
+            if alias in record:
+                value = record[alias]
+                if isinstance(value, str):
+                    value = value.strip()
+                if value not in (None, ''):
+                    return value
+        return None
+    
+    def _build_transaction(self, record):
+        """
+        Map one statement row to an unsaved MpesaTransaction, or None if it should be skipped
+        """
+        if not isinstance(record, dict):
+            raise ValueError("Statement row is not an object")
+        normalized = {str(key).strip().lower(): value for key, value in record.items() if key is not None}
+        
+        receipt = self._field(normalized, 'receipt')
+        status = self._field(normalized, 'status')
+        if not receipt or (status and str(status).upper() != 'COMPLETED'):
+            return None
+        
+        amount = self._field(normalized, 'amount')
+        if amount is not None:
+            amount = self._parse_amount(amount)
+        else:
+            paid_in = self._field(normalized, 'paid_in')
+            withdrawn = self._field(normalized, 'withdrawn')
+            if paid_in is None and withdrawn is None:
+                raise ValueError("Statement row has no amount")
+            amount = self._parse_amount(paid_in or 0) - abs(self._parse_amount(withdrawn or 0))
+        if abs(amount) >= Decimal('100000000'):
+            raise ValueError("Amount out of range")
+        
+        balance = self._field(normalized, 'balance')
+        details = self._field(normalized, 'details')
+        transaction_type, category = self._classify(normalized, details, amount)
+        
+        return MpesaTransaction(
+            user=self.user,
+            transaction_type=transaction_type,
+            transaction_category=category,
+            amount=amount,
+            phone_number=self._field(normalized, 'phone_number') or self.user.phone_number,
+            counterparty=self._counterparty(normalized, details),
+            mpesa_receipt_number=str(receipt)[:50],
+            transaction_date=self._parse_date(self._field(normalized, 'date')),
+            description=details,
+            balance=self._parse_amount(balance) if balance is not None else None,
+            transaction_data=record,
+        )
+    
+    def _classify(self, record, details, amount):
+        transaction_type = str(self._field(record, 'type') or '').upper()
+        category = str(self._field(record, 'category') or '').upper()
+        if transaction_type in self.transaction_types and category in self.categories:
+            return transaction_type, category
+        
+        text = (details or '').upper()
+        for keyword, rule_type, rule_category in self.DETAIL_RULES:
+            if keyword in text:
+                if rule_type is None:
+                    rule_type = 'B2C' if amount > 0 else 'C2B'
+                break
+        else:
+            rule_type, rule_category = ('C2C', 'TRANSFER') if amount > 0 else ('C2B', 'PAYMENT')
+        
+        return (
+            transaction_type if transaction_type in self.transaction_types else rule_type,
+            category if category in self.categories else rule_category,
+        )
+    
+    def _counterparty(self, record, details):
+        counterparty = self._field(record, 'counterparty')
+        if counterparty is None and details:
+            # "Pay Bill to 888880 - KPLC PREPAID" / "Funds received from 0712... - JANE"
+            for separator in (' - ', ' to ', ' from '):
+                if separator in details:
+                    counterparty = details.rsplit(separator, 1)[1]
+                    break
+        return str(counterparty).strip()[:100] if counterparty else None
+    
+    def _parse_amount(self, value):
+        if isinstance(value, (int, float, Decimal)):
+            return Decimal(str(value))
+        return Decimal(str(value).replace(',', '').strip())
+    
+    def _parse_date(self, value):
+        if value is None:
+            raise ValueError("Statement row has no date")
+        value = str(value)
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            for date_format in self.DATE_FORMATS:
+                try:
+                    parsed = datetime.strptime(value, date_format)
+                    break
+                except ValueError:
+                    continue
+            else:
+                raise ValueError(f"Unrecognised date: {value}")
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
+
 class STKPushService:
     """
     Service for handling M-Pesa STK Push payments
@@ -209,6 +721,9 @@ class STKPushService:
     def handle_stk_callback(self, callback_data):
         """
         Handle STK Push callback from Africa's Talking
+        
+        Callbacks are idempotent per checkoutRequestID: only the first one to
+        move a payment request out of PENDING changes it or posts a repayment.
         """
         try:
             # Extract relevant data from callback
@@ -216,23 +731,32 @@ class STKPushService:
             result_code = callback_data.get('status')
             result_description = callback_data.get('description')
             
-            # Find the payment request
-            payment_request = MpesaPaymentRequest.objects.get(
-                checkout_request_id=checkout_request_id
-            )
-            
-            # Update payment request status
-            if result_code == 'Success':
-                payment_request.status = 'COMPLETED'
-                payment_request.response_code = '0'
-            else:
-                payment_request.status = 'FAILED'
-                payment_request.response_code = result_code
-            
-            payment_request.response_description = result_description
-            payment_request.callback_data = callback_data
-            payment_request.callback_received_at = timezone.now()
-            payment_request.save()
+            with transaction.atomic():
+                # Find the payment request, locking it against concurrent duplicates
+                payment_request = MpesaPaymentRequest.objects.select_for_update().get(
+                    checkout_request_id=checkout_request_id
+                )
+                
+                if payment_request.status != 'PENDING':
+                    logger.info(f"Ignoring repeated STK callback for {checkout_request_id}")
+                    return payment_request
+                
+                # Update payment request status
+                if result_code == 'Success':
+                    payment_request.status = 'COMPLETED'
+                    payment_request.response_code = '0'
+                else:
+                    payment_request.status = 'FAILED'
+                    payment_request.response_code = result_code
+                
+                payment_request.response_description = result_description
+                payment_request.callback_data = callback_data
+                payment_request.callback_received_at = timezone.now()
+                payment_request.save()
+                
+                if payment_request.status == 'COMPLETED':
+                    from loans.services import LoanService
+                    LoanService.apply_mpesa_payment(payment_request)
             
             logger.info(f"Processed STK callback for {checkout_request_id}: {result_code}")
             return payment_request
@@ -242,4 +766,103 @@ class STKPushService:
             return None
         except Exception as e:
             logger.error(f"Error handling STK callback: {str(e)}")
-            return None
\ No newline at end of file
+            raise
+
+class CallbackQueueService:
+    """
+    Database-backed queue of M-Pesa webhook callbacks
+    
+    The webhook views only insert an MpesaWebhookLog row and acknowledge.
+    Workers (the process_mpesa_callbacks command) claim unprocessed rows
+    with a conditional update, so several workers can share the table
+    without a separate broker. Failed rows are retried up to
+    WEBHOOK_MAX_ATTEMPTS times with exponential backoff, so a transient
+    failure (e.g. a locked database) does not use up every attempt at once.
+    """
+    
+    @staticmethod
+    def enqueue(payload, webhook_type='STK_PUSH', headers=None, ip_address=None):
+        """
+        Store a webhook payload for processing with a single insert
+        """
+        checkout_request_id = payload.get('checkoutRequestID') if hasattr(payload, 'get') else None
+        return MpesaWebhookLog.objects.create(
+            webhook_type=webhook_type,
+            payload=payload,
+            headers=headers,
+            ip_address=ip_address,
+            checkout_request_id=checkout_request_id,
+            response_sent={'status': 'queued'}
+        )
+    
+    @staticmethod
+    def pending(include_exhausted=False):
+        """
+        Unprocessed webhook logs, oldest first
+        
+        Without include_exhausted, only rows that have attempts left and
+        whose retry is due.
+        """
+        logs = MpesaWebhookLog.objects.filter(processed=False)
+        if not include_exhausted:
+            logs = logs.filter(attempts__lt=WEBHOOK_MAX_ATTEMPTS).filter(
+                Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=timezone.now())
+            )
+        return logs.order_by('created_at')
+    
+    @staticmethod
+    def claim(log_id):
+        """
+        Mark a log as being processed by this worker; False if another worker holds it
+        """
+        now = timezone.now()
+        return MpesaWebhookLog.objects.filter(id=log_id, processed=False).filter(
+            Q(claimed_at__isnull=True) | Q(claimed_at__lt=now - WEBHOOK_CLAIM_TIMEOUT)
+        ).filter(
+            Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now)
+        ).update(claimed_at=now, attempts=F('attempts') + 1) == 1
+    
+    @staticmethod
+    def process_pending(batch_size=100, include_exhausted=False):
+        """
+        Claim and process up to batch_size queued callbacks
+        """
+        stats = {'processed': 0, 'failed': 0}
+        log_ids = list(
+            CallbackQueueService.pending(include_exhausted).values_list('id', flat=True)[:batch_size]
+        )
+        for log_id in log_ids:
+            if not CallbackQueueService.claim(log_id):
+                continue
+            webhook_log = MpesaWebhookLog.objects.get(id=log_id)
+            if CallbackQueueService.process(webhook_log):
+                stats['processed'] += 1
+            else:
+                stats['failed'] += 1
+        return stats
+    
+    @staticmethod
+    def process(webhook_log):
+        """
+        Apply one claimed callback; returns False if it should be retried
+        """
+        try:
+            if webhook_log.webhook_type == 'STK_PUSH':
+                payment_request = STKPushService().handle_stk_callback(webhook_log.payload)
+                error = None if payment_request else 'Payment request not found'
+            else:
+                error = f"No handler for {webhook_log.webhook_type} webhooks"
+        except Exception as e:
+            webhook_log.processing_error = str(e)
+            webhook_log.claimed_at = None
+            webhook_log.next_attempt_at = timezone.now() + WEBHOOK_RETRY_DELAY * 2 ** (webhook_log.attempts - 1)
+            webhook_log.save(update_fields=['processing_error', 'claimed_at', 'next_attempt_at'])
+            if webhook_log.attempts >= WEBHOOK_MAX_ATTEMPTS:
+                logger.error(f"Giving up on webhook {webhook_log.id} after {webhook_log.attempts} attempts")
+            return False
+        
+        webhook_log.processed = True
+        webhook_log.processing_error = error
+        webhook_log.processed_at = timezone.now()
+        webhook_log.save(update_fields=['processed', 'processing_error', 'processed_at'])
+        return True
@@ -1,3 +1,496 @@
+import io
+import json
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from unittest import mock
+
+import requests
+from django.core.management import call_command
+from django.db import OperationalError, connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from loans.models import Loan
+from users.models import User
+from .models import MpesaTransaction, MpesaDailyRollup, MpesaPaymentRequest, MpesaWebhookLog
+from .payouts import DarajaPayoutClient, FakePayoutClient, Payout, PayoutResult, RateLimiter
+from .services import (
+    PROFILE_WINDOW_DAYS, WEBHOOK_RETRY_DELAY, CallbackQueueService, StatementImportService,
+    STKPushService, TransactionRollupService
+)
+
+PROFILE_FIELDS = [
+    'average_weekly_income', 'average_weekly_expenses', 'transaction_consistency',
+    'has_savings_habit', 'network_diversity', 'fuliza_repayment_ratio',
+    'total_transactions', 'total_volume', 'active_days', 'avg_transaction_amount',
+]
+
+
+def create_transactions(user, count, offset=0):
+    """Create a deterministic mix of income, expense and Fuliza transactions"""
+    now = timezone.now()
+    transactions = []
+    for i in range(offset, offset + count):
+        amount = Decimal(str(200 + (i * 173) % 4000))
+        description = f"Transaction {i}"
+        if i % 9 == 0:
+            description = f"Fuliza M-PESA {i}"
+            if i % 2:
+                amount = -amount
+        transactions.append(MpesaTransaction(
+            user=user,
+            transaction_type=['C2B', 'C2C', 'B2C'][i % 3],
+            transaction_category='PAYMENT',
+            amount=amount,
+            phone_number=user.phone_number,
+            counterparty=[f"CONTACT_{i % 11}", None][i % 7 == 0],
+            transaction_date=now - timedelta(days=(i * 7) % 120, hours=i % 24),
+            description=description if i % 13 else None,
+        ))
+    MpesaTransaction.objects.bulk_create(transactions)
+
+
+class TransactionRollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(phone_number='254700000002', password='test-pass-123')
+
+    def snapshot(self):
+        profile = self.user.mpesa_profile
+        profile.refresh_from_db()
+        return {field: getattr(profile, field) for field in PROFILE_FIELDS}
+
+    def test_incremental_profile_matches_full_recompute(self):
+        create_transactions(self.user, 60)
+        TransactionRollupService.analyze_profile(self.user)
+        create_transactions(self.user, 45, offset=60)
+        TransactionRollupService.analyze_profile(self.user)
+        create_transactions(self.user, 5, offset=105)
+        TransactionRollupService.analyze_profile(self.user)
+
+        incremental = self.snapshot()
+        incremental_rollups = list(MpesaDailyRollup.objects.filter(user=self.user).order_by(
+            'day', 'transaction_type', 'transaction_category'
+        ).values_list(
+            'day', 'transaction_type', 'transaction_count', 'amount_sum', 'amount_sq_sum', 'income_total', 'counterparties'
+        ))
+
+        TransactionRollupService.analyze_profile(self.user, full_refresh=True)
+
+        self.assertEqual(incremental, self.snapshot())
+        in_window = MpesaTransaction.objects.filter(
+            user=self.user,
+            transaction_date__gte=timezone.make_aware(
+                datetime.combine(TransactionRollupService.window_start(PROFILE_WINDOW_DAYS), time.min)
+            )
+        )
+        self.assertEqual(incremental['total_transactions'], in_window.count())
+        self.assertEqual(
+            incremental['network_diversity'],
+            in_window.exclude(counterparty=None).values('counterparty').distinct().count()
+        )
+        self.assertEqual(incremental_rollups, list(MpesaDailyRollup.objects.filter(user=self.user).order_by(
+            'day', 'transaction_type', 'transaction_category'
+        ).values_list(
+            'day', 'transaction_type', 'transaction_count', 'amount_sum', 'amount_sq_sum', 'income_total', 'counterparties'
+        )))
+
+    def test_refresh_only_folds_new_transactions(self):
+        create_transactions(self.user, 30)
+        profile = TransactionRollupService.analyze_profile(self.user)
+        self.assertFalse(MpesaTransaction.objects.filter(user=self.user, analyzed=False).exists())
+
+        with CaptureQueriesContext(connection) as queries:
+            TransactionRollupService.refresh(self.user)
+        self.assertFalse(any(query['sql'].startswith('UPDATE "mpesa_mpesatransaction"') for query in queries))
+        self.assertEqual(self.snapshot()['total_transactions'], profile.total_transactions)
+
+    def test_rows_committed_late_are_still_folded(self):
+        create_transactions(self.user, 30)
+        TransactionRollupService.analyze_profile(self.user)
+        # Committed after the refresh, but created before the newest folded row
+        create_transactions(self.user, 3, offset=30)
+        oldest = MpesaTransaction.objects.filter(user=self.user).order_by('created_at').first().created_at
+        MpesaTransaction.objects.filter(user=self.user, analyzed=False).update(created_at=oldest)
+
+        TransactionRollupService.refresh_stale([self.user.id])
+
+        self.assertEqual(
+            sum(MpesaDailyRollup.objects.filter(user=self.user).values_list('transaction_count', flat=True)),
+            33
+        )
+
+    def test_history_older_than_the_window_does_not_make_users_stale(self):
+        create_transactions(self.user, 10)
+        TransactionRollupService.analyze_profile(self.user)
+        old_day = (timezone.localdate() - timedelta(days=400)).isoformat()
+        StatementImportService(self.user).import_file(
+            io.BytesIO(STATEMENT_CSV.format(day=old_day).encode()), 'csv'
+        )
+
+        with mock.patch.object(TransactionRollupService, 'refresh') as refresh:
+            TransactionRollupService.refresh_stale([self.user.id])
+        refresh.assert_not_called()
+
+    def test_no_transactions_returns_none(self):
+        self.assertIsNone(TransactionRollupService.analyze_profile(self.user))
+
+
+STATEMENT_CSV = """Receipt No.,Completion Time,Details,Transaction Status,Paid In,Withdrawn,Balance
+QAB1,{day} 09:15:00,Pay Bill to 888880 - KPLC PREPAID,Completed,,"1,500.00",3500.00
+QAB2,{day} 10:00:00,Funds received from 0712345678 - JANE DOE,Completed,2000.00,,5500.00
+QAB3,{day} 11:30:00,Airtime Purchase,Failed,,100.00,5500.00
+QAB1,{day} 09:15:00,Pay Bill to 888880 - KPLC PREPAID,Completed,,"1,500.00",3500.00
+QAB4,{day} 12:00:00,Business Payment from 600000 - EMPLOYER CO,Completed,25000.00,,30500.00
+QAB5,not a date,Customer Transfer to 0798765432 - JOHN,Completed,,300.00,30200.00
+"""
+
+
+class StatementImportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(phone_number='254700000003', password='test-pass-123')
+        self.day = (timezone.localdate() - timedelta(days=3)).isoformat()
+
+    def import_csv(self, batch_size=2):
+        statement = io.BytesIO(STATEMENT_CSV.format(day=self.day).encode())
+        return StatementImportService(self.user, batch_size=batch_size).import_file(statement, 'csv')
+
+    def test_csv_import_dedupes_on_receipt_number(self):
+        stats = self.import_csv()
+
+        self.assertEqual(stats['rows_read'], 6)
+        self.assertEqual(stats['rows_imported'], 3)
+        self.assertEqual(stats['duplicates'], 1)
+        self.assertEqual(stats['skipped_rows'], 1)
+        self.assertEqual(stats['invalid_rows'], 1)
+
+        bill = MpesaTransaction.objects.get(mpesa_receipt_number='QAB1')
+        self.assertEqual(bill.amount, Decimal('-1500.00'))
+        self.assertEqual((bill.transaction_type, bill.transaction_category), ('C2B', 'PAYMENT'))
+        self.assertEqual(bill.counterparty, 'KPLC PREPAID')
+        salary = MpesaTransaction.objects.get(mpesa_receipt_number='QAB4')
+        self.assertEqual((salary.transaction_type, salary.transaction_category), ('B2C', 'DEPOSIT'))
+
+        # Imported rows are folded into the daily rollups
+        self.assertEqual(
+            sum(MpesaDailyRollup.objects.filter(user=self.user).values_list('transaction_count', flat=True)),
+            3
+        )
+
+        again = self.import_csv(batch_size=1000)
+        self.assertEqual(again['rows_imported'], 0)
+        self.assertEqual(again['duplicates'], 4)
+        self.assertEqual(MpesaTransaction.objects.filter(user=self.user).count(), 3)
+
+    def test_json_array_and_lines_import(self):
+        records = [
+            {
+                'mpesa_receipt_number': f'QJS{i}',
+                'transaction_date': f'{self.day}T08:{i:02d}:00+03:00',
+                'amount': 150 + i,
+                'transaction_type': 'C2C',
+                'transaction_category': 'TRANSFER',
+                'counterparty': f'FRIEND_{i % 3}',
+            }
+            for i in range(25)
+        ]
+        array_stats = StatementImportService(self.user, batch_size=7).import_file(
+            io.BytesIO(json.dumps(records, indent=2).encode()), 'json'
+        )
+        lines = '\n'.join(json.dumps(record) for record in records[20:] + [dict(records[0], mpesa_receipt_number='QJS99')])
+        lines_stats = StatementImportService(self.user).import_file(io.BytesIO(lines.encode()), 'json')
+
+        self.assertEqual(array_stats['rows_imported'], 25)
+        self.assertEqual(lines_stats['rows_imported'], 1)
+        self.assertEqual(lines_stats['duplicates'], 5)
+        transfer = MpesaTransaction.objects.get(mpesa_receipt_number='QJS3')
+        self.assertEqual(transfer.amount, Decimal('153'))
+        self.assertEqual(transfer.transaction_data['counterparty'], 'FRIEND_0')
+
+
+    def test_json_records_split_across_small_chunks(self):
+        records = [
+            {'mpesa_receipt_number': f'QCH{i}', 'transaction_date': f'{self.day}T09:{i:02d}:00+03:00', 'amount': i + 1}
+            for i in range(40)
+        ]
+        text = '[ ' + ' ,\n  '.join(json.dumps(record) for record in records) + ' \n]'
+        service = StatementImportService(self.user)
+        for chunk_size in (1, 7, 64):
+            with mock.patch('mpesa.services.IMPORT_CHUNK_SIZE', chunk_size):
+                parsed = list(service._iter_json(io.StringIO(text)))
+            self.assertEqual(parsed, records)
+
+    def test_rows_taken_by_a_concurrent_import_count_as_duplicates(self):
+        MpesaTransaction.objects.create(
+            user=self.user, mpesa_receipt_number='QAB2', transaction_type='C2C', amount=Decimal('2000.00'),
+            phone_number=self.user.phone_number, transaction_date=timezone.now()
+        )
+        real_filter = MpesaTransaction.objects.filter
+        lookups = []
+
+        def miss_first_lookup(*args, **kwargs):
+            # The other import commits QAB2 after this batch checked for existing receipts
+            lookups.append(kwargs)
+            if len(lookups) == 1:
+                return MpesaTransaction.objects.none()
+            return real_filter(*args, **kwargs)
+
+        with mock.patch.object(MpesaTransaction.objects, 'filter', side_effect=miss_first_lookup):
+            stats = self.import_csv(batch_size=1000)
+
+        self.assertEqual(stats['rows_imported'], 2)
+        self.assertEqual(stats['duplicates'], 2)
+        self.assertEqual(MpesaTransaction.objects.filter(user=self.user).count(), 3)
+
+class CallbackQueueTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(phone_number='254700000004', password='test-pass-123')
+        self.loan = Loan.objects.create(
+            user=self.user,
+            principal_amount=Decimal('1000.00'),
+            interest_rate=Decimal('10.00'),
+            status='DISBURSED'
+        )
+        self.payment_request = MpesaPaymentRequest.objects.create(
+            user=self.user,
+            phone_number=self.user.phone_number,
+            amount=Decimal('400.00'),
+            account_reference=str(self.user.id),
+            checkout_request_id='ws_CO_001',
+            merchant_request_id='MR_001'
+        )
+        self.client = APIClient()
+
+    def post_callback(self, checkout_request_id='ws_CO_001', result='Success'):
+        return self.client.post('/api/mpesa/stk-callback/', {
+            'checkoutRequestID': checkout_request_id,
+            'status': result,
+            'description': 'The service request is processed successfully.'
+        }, format='json')
+
+    def test_webhook_only_queues_the_callback(self):
+        response = self.post_callback()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['ResultCode'], 0)
+        webhook_log = MpesaWebhookLog.objects.get()
+        self.assertFalse(webhook_log.processed)
+        self.assertEqual(webhook_log.checkout_request_id, 'ws_CO_001')
+        self.payment_request.refresh_from_db()
+        self.assertEqual(self.payment_request.status, 'PENDING')
+
+    def test_worker_posts_repayment_once_per_checkout_request(self):
+        self.post_callback()
+        self.post_callback()  # provider retry
+        self.post_callback(checkout_request_id='ws_CO_unknown')
+
+        stats = CallbackQueueService.process_pending()
+
+        self.assertEqual(stats, {'processed': 3, 'failed': 0})
+        self.payment_request.refresh_from_db()
+        self.assertEqual(self.payment_request.status, 'COMPLETED')
+        self.assertEqual(self.loan.repayments.count(), 1)
+        self.assertEqual(self.loan.repayments.get().amount, Decimal('400.00'))
+        self.assertEqual(
+            MpesaWebhookLog.objects.get(checkout_request_id='ws_CO_unknown').processing_error,
+            'Payment request not found'
+        )
+        self.assertFalse(CallbackQueueService.pending().exists())
+
+    def test_failed_callbacks_back_off_before_retrying(self):
+        self.post_callback()
+
+        with mock.patch.object(STKPushService, 'handle_stk_callback', side_effect=OperationalError('database is locked')) as handle:
+            self.assertEqual(CallbackQueueService.process_pending(), {'processed': 0, 'failed': 1})
+            # Not due yet, so an immediate poll leaves it alone
+            self.assertEqual(CallbackQueueService.process_pending(), {'processed': 0, 'failed': 0})
+            self.assertEqual(handle.call_count, 1)
+
+            webhook_log = MpesaWebhookLog.objects.get()
+            first_delay = webhook_log.next_attempt_at - timezone.now()
+            self.assertAlmostEqual(first_delay.total_seconds(), WEBHOOK_RETRY_DELAY.total_seconds(), delta=5)
+
+            MpesaWebhookLog.objects.update(next_attempt_at=timezone.now())
+            self.assertEqual(CallbackQueueService.process_pending(), {'processed': 0, 'failed': 1})
+            webhook_log.refresh_from_db()
+            second_delay = webhook_log.next_attempt_at - timezone.now()
+            self.assertAlmostEqual(second_delay.total_seconds(), 2 * WEBHOOK_RETRY_DELAY.total_seconds(), delta=5)
+            self.assertEqual(webhook_log.attempts, 2)
+
+        MpesaWebhookLog.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(CallbackQueueService.process_pending(), {'processed': 1, 'failed': 0})
+        self.assertEqual(self.loan.repayments.count(), 1)
+
+    def test_replay_processes_rows_that_ran_out_of_attempts(self):
+        self.post_callback()
+        MpesaWebhookLog.objects.update(attempts=5, processing_error='Database is locked')
+        self.assertEqual(CallbackQueueService.process_pending(), {'processed': 0, 'failed': 0})
+
+        call_command('replay_mpesa_webhooks', stdout=io.StringIO())
+
+        webhook_log = MpesaWebhookLog.objects.get()
+        self.assertTrue(webhook_log.processed)
+        self.assertIsNone(webhook_log.processing_error)
+        self.assertEqual(self.loan.repayments.count(), 1)
+
+
+class TransactionHistoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(phone_number='254700000005', password='test-pass-123')
+        create_transactions(self.user, 120)
+        other = User.objects.create_user(phone_number='254700000006', password='test-pass-123')
+        create_transactions(other, 10)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def fetch_all(self, **params):
+        ids, cursor = [], None
+        while True:
+            query = {**params, **({'cursor': cursor} if cursor else {})}
+            response = self.client.get('/api/mpesa/transaction-history/', query)
+            self.assertEqual(response.status_code, 200, response.data)
+            ids += [transaction['id'] for transaction in response.data['transactions']]
+            cursor = response.data['next_cursor']
+            if cursor is None:
+                return ids
+
+    def expected(self, **filters):
+        transactions = MpesaTransaction.objects.filter(user=self.user, **filters).order_by('-transaction_date', '-id')
+        return [str(transaction_id) for transaction_id in transactions.values_list('id', flat=True)]
+
+    def test_pages_follow_filters(self):
+        today = timezone.localdate()
+        start, end = today - timedelta(days=60), today - timedelta(days=10)
+
+        self.assertEqual(self.fetch_all(page_size=7), self.expected())
+        self.assertEqual(self.fetch_all(page_size=7, type='c2b'), self.expected(transaction_type='C2B'))
+        self.assertEqual(
+            self.fetch_all(page_size=5, counterparty='CONTACT_3', category='PAYMENT'),
+            self.expected(counterparty='CONTACT_3', transaction_category='PAYMENT')
+        )
+        self.assertEqual(
+            self.fetch_all(start_date=start.isoformat(), end_date=end.isoformat()),
+            self.expected(
+                transaction_date__gte=timezone.make_aware(datetime.combine(start, time.min)),
+                transaction_date__lt=timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min))
+            )
+        )
+
+    def test_first_page_defaults_to_fifty_and_deep_pages_seek_the_index(self):
+        first = self.client.get('/api/mpesa/transaction-history/')
+        self.assertEqual(first.data['total_count'], 50)
+        self.assertTrue(first.data['has_more'])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/mpesa/transaction-history/', {'cursor': first.data['next_cursor']})
+        self.assertEqual(len(queries), 1)
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {queries[0]['sql']}")
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        self.assertIn('mpesa_mpesa_user_id_5e82f0_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+        self.assertNotIn('transaction_data', queries[0]['sql'])
+
+    def test_bad_parameters_are_rejected(self):
+        for params in [{'type': 'XYZ'}, {'start_date': 'yesterday'}, {'cursor': 'abc'}, {'page_size': 'all'}]:
+            with self.subTest(params=params):
+                response = self.client.get('/api/mpesa/transaction-history/', params)
+                self.assertEqual(response.status_code, 400)
+                self.assertFalse(response.data['success'])
+
+
+class PayoutClientTests(TestCase):
+    def setUp(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def test_requests_are_spaced_by_the_rate_limit(self):
+        limiter = RateLimiter(4, clock=self.clock, sleep=self.sleep)
+        client = FakePayoutClient(limiter=limiter)
+        payouts = [Payout(i, f'2547000000{i:02d}', Decimal('100.00')) for i in range(25)]
+
+        results = client.pay(payouts)
+
+        self.assertEqual([len(request) for request in client.sent], [10, 10, 5])
+        self.assertEqual(self.sleeps, [0.25, 0.25])
+        self.assertTrue(all(result.accepted for result in results.values()))
+
+        # Time already spent elsewhere counts towards the next slot
+        self.now += 0.1
+        limiter.wait()
+        self.assertAlmostEqual(self.sleeps[-1], 0.15)
+
+    def test_failed_request_fails_only_its_payouts(self):
+        client = FakePayoutClient(fail_numbers={'254700000003'})
+        client.max_recipients = 2
+        send = client._send
+        client._send = lambda payouts: send(payouts) if payouts[0].reference != '2' else 1 / 0
+
+        results = client.pay([Payout(i, f'25470000000{i}', Decimal('100.00')) for i in range(5)])
+
+        self.assertEqual(
+            {reference: result.accepted for reference, result in results.items()},
+            {'0': True, '1': True, '2': False, '3': False, '4': True}
+        )
+        self.assertEqual(results['2'].error, 'division by zero')
+        self.assertEqual(results['3'].error, 'division by zero')
+        # The request may have reached the provider, so its payouts are not marked rejected
+        self.assertEqual(results['2'].status, PayoutResult.UNKNOWN)
+        self.assertEqual(client.requests_sent, 3)
+
+    def test_daraja_only_rejects_on_an_explicit_refusal(self):
+        client = DarajaPayoutClient(rate=0)
+        client._token, client._token_expires = 'token', float('inf')
+        replies = [
+            (200, {'ResponseCode': '0', 'ConversationID': 'AG_1'}),
+            (400, {'errorCode': '400.002.02', 'errorMessage': 'Bad Request - Invalid PartyB'}),
+            (503, {'errorMessage': 'Service unavailable'}),
+            (200, ValueError('Expecting value')),
+        ]
+
+        def reply(status_code, body):
+            response = mock.Mock(status_code=status_code, ok=status_code < 400)
+            response.json.side_effect = body if isinstance(body, Exception) else None
+            response.json.return_value = body
+            return response
+
+        client.session.post = mock.Mock(side_effect=[reply(*r) for r in replies] + [requests.Timeout('timed out')])
+        results = client.pay([Payout(i, f'07000000{i:02d}', Decimal('100.00')) for i in range(5)])
+
+        self.assertEqual(
+            [results[str(i)].status for i in range(5)],
+            ['ACCEPTED', 'REJECTED', 'UNKNOWN', 'UNKNOWN', 'UNKNOWN']
+        )
+        self.assertEqual(results['0'].transaction_id, 'AG_1')
+
+        # Failing to authenticate means nothing was sent
+        client._token = None
+        client.session.get = mock.Mock(side_effect=requests.ConnectionError('refused'))
+        result = client.pay([Payout('x', '0700000000', Decimal('100.00'))])['x']
+        self.assertEqual(result.status, PayoutResult.REJECTED)
+
+    def test_daraja_does_not_truncate_cents(self):
+        client = DarajaPayoutClient(rate=0)
+        client._token, client._token_expires = 'token', float('inf')
+        client.session.post = mock.Mock(return_value=mock.Mock(
+            status_code=200, ok=True, json=mock.Mock(return_value={'ResponseCode': '0', 'ConversationID': 'AG_1'})
+        ))
+
+        results = client.pay([
+            Payout('whole', '0700000001', Decimal('1000.00')),
+            Payout('cents', '0700000002', Decimal('1000.50')),
+        ])
 
-# Create your tests here.
+        self.assertTrue(results['whole'].accepted)
+        self.assertEqual(results['cents'].status, PayoutResult.REJECTED)
+        self.assertIn('whole shillings', results['cents'].error)
+        client.session.post.assert_called_once()
+        self.assertEqual(client.session.post.call_args.kwargs['json']['Amount'], 1000)
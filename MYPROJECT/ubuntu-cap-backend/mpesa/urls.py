@@ -7,6 +7,7 @@ urlpatterns = [
     path('analyze-transactions/', views.analyze_transactions, name='analyze-transactions'),
     path('transaction-history/', views.get_transaction_history, name='transaction-history'),
     path('profile/', views.get_mpesa_profile, name='mpesa-profile'),
+    path('import-statement/', views.import_statement, name='import-statement'),
     
     # Payment processing
     path('initiate-repayment/', views.initiate_loan_repayment, name='initiate-repayment'),
@@ -2,10 +2,15 @@ from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from datetime import datetime, time, timedelta
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from .models import MpesaTransaction, MpesaProfile, MpesaPaymentRequest, MpesaWebhookLog
-from .services import MpesaService, STKPushService
+from .services import (
+    CallbackQueueService, MpesaService, STKPushService, StatementImportError, StatementImportService
+)
 from users.models import User
+from ubuntu_core.pagination import keyset_page, page_size_from
 import logging
 
 logger = logging.getLogger(__name__)
@@ -84,6 +89,48 @@ def analyze_transactions(request):
             'message': 'Internal server error'
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def import_statement(request):
+    """
+    Import an uploaded M-Pesa statement (CSV, JSON or JSON Lines) for the current user
+    """
+    statement = request.FILES.get('file')
+    if not statement:
+        return Response({
+            'success': False,
+            'message': 'A statement file is required'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    file_format = request.data.get('format') or StatementImportService.detect_format(statement.name)
+    if file_format not in StatementImportService.FORMATS:
+        return Response({
+            'success': False,
+            'message': f"Unsupported format. Use one of: {', '.join(StatementImportService.FORMATS)}"
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        # Large uploads are spooled to disk by Django, so the importer reads them in chunks
+        stats = StatementImportService(request.user).import_file(statement.file, file_format)
+        
+        return Response({
+            'success': True,
+            'message': f"Imported {stats['rows_imported']} transactions",
+            'stats': stats
+        })
+        
+    except StatementImportError as e:
+        return Response({
+            'success': False,
+            'message': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        logger.error(f"Error importing M-Pesa statement: {str(e)}")
+        return Response({
+            'success': False,
+            'message': 'Internal server error'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def initiate_loan_repayment(request):
@@ -152,89 +199,136 @@ def initiate_loan_repayment(request):
 @permission_classes([AllowAny])
 def stk_callback(request):
     """
-    Handle STK Push callback from Africa's Talking
+    Queue an STK Push callback from Africa's Talking and acknowledge it immediately
+    
+    The payload is stored in a single insert and applied to the payment
+    request by the callback worker (manage.py process_mpesa_callbacks).
     """
     try:
-        callback_data = request.data
-        
-        # Log the webhook call
-        webhook_log = MpesaWebhookLog.objects.create(
+        CallbackQueueService.enqueue(
+            request.data,
             webhook_type='STK_PUSH',
-            payload=callback_data,
             headers=dict(request.headers),
             ip_address=request.META.get('REMOTE_ADDR')
         )
         
-        # Process the callback
-        stk_service = STKPushService()
-        payment_request = stk_service.handle_stk_callback(callback_data)
-        
-        if payment_request:
-            webhook_log.processed = True
-            webhook_log.processed_at = timezone.now()
-            webhook_log.response_sent = {'status': 'processed'}
-            webhook_log.save()
-            
-            # TODO: Trigger loan repayment processing
-            if payment_request.status == 'COMPLETED':
-                logger.info(f"Loan repayment completed for user {payment_request.user.phone_number}")
-            
-            return Response({
-                "ResultCode": 0,
-                "ResultDesc": "Callback processed successfully"
-            })
-        else:
-            webhook_log.processed = True
-            webhook_log.processing_error = "Payment request not found"
-            webhook_log.response_status = 404
-            webhook_log.save()
-            
-            return Response({
-                "ResultCode": 1,
-                "ResultDesc": "Payment request not found"
-            }, status=404)
+        return Response({
+            "ResultCode": 0,
+            "ResultDesc": "Callback received"
+        })
             
     except Exception as e:
-        logger.error(f"Error processing STK callback: {str(e)}")
+        logger.error(f"Error queueing STK callback: {str(e)}")
         return Response({
             "ResultCode": 1,
             "ResultDesc": "Error processing callback"
         }, status=500)
 
+# Columns returned by the transaction history
+HISTORY_FIELDS = [
+    'id', 'amount', 'transaction_type', 'transaction_category', 'counterparty',
+    'description', 'transaction_date', 'mpesa_receipt_number'
+]
+
+# Transaction history page size when none is given (the size of the old fixed slice)
+HISTORY_PAGE_SIZE = 50
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_transaction_history(request):
     """
-    Get user's M-Pesa transaction history
+    Get user's M-Pesa transaction history, newest first, one page at a time
+    
+    Query parameters:
+        start_date, end_date  ISO dates or datetimes; a date covers that whole local day
+        type                  C2B, B2C, C2C or B2B
+        category              DEPOSIT, WITHDRAWAL, PAYMENT, TRANSFER, AIRTIME or FULIZA
+        counterparty          exact counterparty name
+        page_size             default 50, at most 100
+        cursor                next_cursor from the previous page
     """
+    params = request.query_params
     try:
-        transactions = MpesaTransaction.objects.filter(user=request.user).order_by('-transaction_date')[:50]
-        
-        transaction_data = []
-        for transaction in transactions:
-            transaction_data.append({
-                'id': str(transaction.id),
-                'amount': str(transaction.amount),
-                'type': transaction.transaction_type,
-                'category': transaction.transaction_category,
-                'counterparty': transaction.counterparty,
-                'description': transaction.description,
-                'transaction_date': transaction.transaction_date,
-                'receipt_number': transaction.mpesa_receipt_number
-            })
-        
+        page_size = page_size_from(params.get('page_size'), default=HISTORY_PAGE_SIZE)
+        transactions = _filter_transaction_history(
+            MpesaTransaction.objects.filter(user=request.user), params
+        )
+        page, next_cursor = keyset_page(
+            transactions.values(*HISTORY_FIELDS), 'transaction_date', params.get('cursor'), page_size
+        )
+    except ValueError as e:
+        # Includes InvalidCursor
         return Response({
-            'success': True,
-            'transactions': transaction_data,
-            'total_count': len(transaction_data)
-        })
-        
+            'success': False,
+            'message': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         logger.error(f"Error fetching transaction history: {str(e)}")
         return Response({
             'success': False,
             'message': 'Internal server error'
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    transaction_data = [{
+        'id': str(transaction['id']),
+        'amount': str(transaction['amount']),
+        'type': transaction['transaction_type'],
+        'category': transaction['transaction_category'],
+        'counterparty': transaction['counterparty'],
+        'description': transaction['description'],
+        'transaction_date': transaction['transaction_date'],
+        'receipt_number': transaction['mpesa_receipt_number']
+    } for transaction in page]
+    
+    return Response({
+        'success': True,
+        'transactions': transaction_data,
+        'total_count': len(transaction_data),
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None
+    })
+
+def _filter_transaction_history(transactions, params):
+    """Apply the history query parameters to transactions; raises ValueError for bad values"""
+    if params.get('start_date'):
+        transactions = transactions.filter(transaction_date__gte=_history_bound(params['start_date'], 'start_date'))
+    if params.get('end_date'):
+        end = params['end_date']
+        if parse_date(end):
+            # A date includes the whole day
+            transactions = transactions.filter(transaction_date__lt=_history_bound(end, 'end_date') + timedelta(days=1))
+        else:
+            transactions = transactions.filter(transaction_date__lte=_history_bound(end, 'end_date'))
+    
+    for param, field, choices in [
+        ('type', 'transaction_type', MpesaTransaction.TRANSACTION_TYPES),
+        ('category', 'transaction_category', MpesaTransaction.TRANSACTION_CATEGORIES),
+    ]:
+        value = params.get(param)
+        if value:
+            value = value.upper()
+            if value not in dict(choices):
+                raise ValueError(f"Unknown {param}: {params[param]}")
+            transactions = transactions.filter(**{field: value})
+    
+    if params.get('counterparty'):
+        transactions = transactions.filter(counterparty=params['counterparty'])
+    return transactions
+
+def _history_bound(value, param):
+    """An aware datetime from an ISO date (local midnight) or datetime"""
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            moment = day and datetime.combine(day, time.min)
+    except ValueError:
+        moment = None
+    if moment is None:
+        raise ValueError(f"{param} must be an ISO date or datetime")
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""
+Check how long booting Django and loading every URL route takes to import
+
+    python scripts/import_time.py --budget-ms 1500
+
+Runs a fresh interpreter with `python -X importtime` that sets Django up
+and resolves the URLconf (which imports every view), the same work a
+gunicorn worker or `manage.py migrate` does before serving anything. The
+time reported is the sum of all modules' own import time, best of
+--repeat runs. The script fails if that exceeds --budget-ms, or if any
+of the ML libraries that only scoring and training need got imported.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BOOT_CODE = (
+    'import django; django.setup(); '
+    'from django.urls import get_resolver; get_resolver().url_patterns'
+)
+
+# Loaded lazily on the first scoring or training call only
+LAZY_MODULES = ['numpy', 'pandas', 'sklearn', 'scipy', 'joblib', 'xgboost']
+
+
+def run_importtime():
+    """Return {module: (self_us, cumulative_us, depth)} for one interpreter start"""
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE='ubuntu_core.settings')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', BOOT_CODE],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise SystemExit(f'Django failed to boot:\n{result.stderr[-2000:]}')
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules[name.strip()] = (int(self_us), int(cumulative_us), depth)
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--budget-ms', type=float, default=1500, help='Allowed total import time (default: 1500)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs; the fastest is reported (default: 3)')
+    parser.add_argument('--top', type=int, default=15, help='Slowest top-level imports to list (default: 15)')
+    options = parser.parse_args()
+
+    runs = [run_importtime() for _ in range(max(options.repeat, 1))]
+    modules = min(runs, key=lambda run: sum(self_us for self_us, _, _ in run.values()))
+    total_ms = sum(self_us for self_us, _, _ in modules.values()) / 1000
+
+    print(f'{len(modules)} modules imported in {total_ms:.0f} ms (budget {options.budget_ms:.0f} ms)')
+    print(f"{'cumulative (ms)':>16}  top-level import")
+    top_level = sorted(
+        ((cumulative_us, name) for name, (_, cumulative_us, depth) in modules.items() if depth == 0),
+        reverse=True
+    )
+    for cumulative_us, name in top_level[:options.top]:
+        print(f'{cumulative_us / 1000:>16.1f}  {name}')
+
+    failures = []
+    eager = sorted(name for name in modules if name.split('.')[0] in LAZY_MODULES and '.' not in name)
+    if eager:
+        failures.append(f"ML libraries imported at boot: {', '.join(eager)}")
+    if total_ms > options.budget_ms:
+        failures.append(f'Import time {total_ms:.0f} ms is over the {options.budget_ms:.0f} ms budget')
+
+    for failure in failures:
+        print(f'FAIL: {failure}', file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
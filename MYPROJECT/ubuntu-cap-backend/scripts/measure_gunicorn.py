@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+"""
+Measure gunicorn startup time and memory per worker, with and without preloading
+
+    python scripts/measure_gunicorn.py --workers 4
+
+For each mode the script starts gunicorn with gunicorn.conf.py, times how
+long it takes until the app answers a request, sends enough requests for
+every worker to import the views and load the model, and then reads each
+process's memory from /proc/<pid>/smaps_rollup (Linux only). RSS counts
+shared pages in full for every process; PSS splits them between the
+processes sharing them, so total PSS is the real footprint.
+"""
+import argparse
+import http.client
+import os
+import signal
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def memory_kb(pid):
+    """Rss, Pss and private dirty kilobytes of one process"""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ('Rss:', 'Pss:', 'Private_Dirty:'):
+                values[parts[0][:-1]] = int(parts[1])
+    return values
+
+
+def child_pids(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(child) for child in f.read().split()]
+
+
+def request(port, path):
+    """Status code of one GET, or None if the server is not answering yet"""
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    try:
+        connection.request('GET', path, headers={'Host': 'localhost'})
+        return connection.getresponse().status
+    except OSError:
+        return None
+    finally:
+        connection.close()
+
+
+def measure(preload, options):
+    env = dict(
+        os.environ,
+        GUNICORN_PRELOAD='1' if preload else '0',
+        GUNICORN_BIND=f"127.0.0.1:{options.port}",
+        WEB_CONCURRENCY=str(options.workers),
+        GUNICORN_MAX_REQUESTS='0',
+    )
+    started = time.monotonic()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'ubuntu_core.wsgi:application'],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while request(options.port, options.path) is None:
+            if server.poll() is not None or time.monotonic() - started > options.timeout:
+                raise RuntimeError('gunicorn did not start; run it by hand to see the error')
+            time.sleep(0.05)
+        startup = time.monotonic() - started
+
+        # Every worker has to serve requests before its memory is representative
+        for _ in range(options.workers * options.requests):
+            request(options.port, options.path)
+        ready = time.monotonic() - started
+
+        master = memory_kb(server.pid)
+        workers = [memory_kb(pid) for pid in child_pids(server.pid)]
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+
+    return {
+        'mode': 'preload' if preload else 'no preload',
+        'startup': startup,
+        'ready': ready,
+        'master': master,
+        'workers': workers,
+    }
+
+
+def report(results):
+    print(f"{'mode':<12} {'first resp (s)':>14} {'all warm (s)':>12} {'worker RSS (MB)':>16} "
+          f"{'worker PSS (MB)':>16} {'worker private (MB)':>20} {'total PSS (MB)':>15}")
+    for result in results:
+        workers = result['workers']
+        count = len(workers) or 1
+        total_pss = result['master']['Pss'] + sum(worker['Pss'] for worker in workers)
+        print(
+            f"{result['mode']:<12} {result['startup']:>14.2f} {result['ready']:>12.2f} "
+            f"{sum(w['Rss'] for w in workers) / count / 1024:>16.1f} "
+            f"{sum(w['Pss'] for w in workers) / count / 1024:>16.1f} "
+            f"{sum(w['Private_Dirty'] for w in workers) / count / 1024:>20.1f} "
+            f"{total_pss / 1024:>15.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=2, help='Worker processes (default: 2)')
+    parser.add_argument('--port', type=int, default=8765, help='Local port to bind (default: 8765)')
+    parser.add_argument('--path', default='/api/credit/health/', help='URL requested to warm workers')
+    parser.add_argument('--requests', type=int, default=10, help='Warm-up requests per worker (default: 10)')
+    parser.add_argument('--timeout', type=float, default=60, help='Seconds to wait for startup (default: 60)')
+    parser.add_argument('--mode', choices=['both', 'preload', 'no-preload'], default='both')
+    options = parser.parse_args()
+
+    modes = {'both': [False, True], 'preload': [True], 'no-preload': [False]}[options.mode]
+    report([measure(preload, options) for preload in modes])
+
+
+if __name__ == '__main__':
+    main()
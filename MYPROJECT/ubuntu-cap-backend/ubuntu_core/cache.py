@@ -0,0 +1,199 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+_MISSING = object()
+
+
+class TieredCache(BaseCache):
+    """
+    Two-tier cache: a bounded per-process LRU (L1) in front of a shared cache (L2)
+
+    Every write goes to the shared cache, which is another entry in
+    settings.CACHES (database or Redis), so all gunicorn workers see the
+    same data. Reads are answered from L1 when possible. L1 entries live
+    at most L1_TIMEOUT seconds; data that must be exact across workers is
+    either written under version keys (a changed version means a new key,
+    so stale L1 entries are simply never asked for again) or listed in
+    SHARED_PREFIXES, which bypass L1 entirely (throttle counters, version
+    and generation counters, delete-invalidated entries).
+
+    OPTIONS:
+        SHARED_CACHE: alias of the L2 cache (default 'shared')
+        L1_MAX_ENTRIES: entries kept per process (default 1000)
+        L1_TIMEOUT: maximum seconds an entry is served from L1 (default 30)
+        SHARED_PREFIXES: key prefixes that always go to L2
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.shared_alias = options.get('SHARED_CACHE', 'shared')
+        self.l1_max_entries = int(options.get('L1_MAX_ENTRIES', 1000))
+        self.l1_timeout = float(options.get('L1_TIMEOUT', 30))
+        self.shared_prefixes = tuple(options.get('SHARED_PREFIXES', ()))
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self.l1_hits = 0
+        self.l1_misses = 0
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    def local_stats(self):
+        """L1 size and hit/miss counts for this process"""
+        lookups = self.l1_hits + self.l1_misses
+        return {
+            'entries': len(self._local),
+            'max_entries': self.l1_max_entries,
+            'hits': self.l1_hits,
+            'misses': self.l1_misses,
+            'hit_rate': round(self.l1_hits / lookups, 3) if lookups else None,
+        }
+
+    # Reads
+
+    def get(self, key, default=None, version=None):
+        if self._bypass(key):
+            return self.shared.get(key, default, version=version)
+
+        local_key = self.make_and_validate_key(key, version=version)
+        value = self._local_get(local_key)
+        if value is not _MISSING:
+            return value
+
+        value = self.shared.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            return default
+        self._local_set(local_key, value, DEFAULT_TIMEOUT)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        remote = []
+        for key in keys:
+            if self._bypass(key):
+                remote.append(key)
+                continue
+            value = self._local_get(self.make_and_validate_key(key, version=version))
+            if value is _MISSING:
+                remote.append(key)
+            else:
+                found[key] = value
+
+        if remote:
+            fetched = self.shared.get_many(remote, version=version)
+            for key, value in fetched.items():
+                if not self._bypass(key):
+                    self._local_set(self.make_and_validate_key(key, version=version), value, DEFAULT_TIMEOUT)
+            found.update(fetched)
+        return found
+
+    def has_key(self, key, version=None):
+        if not self._bypass(key):
+            if self._local_get(self.make_and_validate_key(key, version=version), count=False) is not _MISSING:
+                return True
+        return self.shared.has_key(key, version=version)
+
+    # Writes
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version=version)
+        if not self._bypass(key):
+            local_key = self.make_and_validate_key(key, version=version)
+            if added:
+                self._local_set(local_key, value, timeout)
+            else:
+                self._local_delete(local_key)
+        return added
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        if not self._bypass(key):
+            self._local_set(self.make_and_validate_key(key, version=version), value, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version=version)
+        for key, value in data.items():
+            if self._bypass(key):
+                continue
+            local_key = self.make_and_validate_key(key, version=version)
+            if key in failed:
+                self._local_delete(local_key)
+            else:
+                self._local_set(local_key, value, timeout)
+        return failed
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self._local_delete(self.make_and_validate_key(key, version=version))
+        return self.shared.incr(key, delta, version=version)
+
+    def decr(self, key, delta=1, version=None):
+        self._local_delete(self.make_and_validate_key(key, version=version))
+        return self.shared.decr(key, delta, version=version)
+
+    def delete(self, key, version=None):
+        self._local_delete(self.make_and_validate_key(key, version=version))
+        return self.shared.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        for key in keys:
+            self._local_delete(self.make_and_validate_key(key, version=version))
+        self.shared.delete_many(keys, version=version)
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+        self.shared.clear()
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
+
+    # L1 helpers
+
+    def _bypass(self, key):
+        return key.startswith(self.shared_prefixes)
+
+    def _local_get(self, local_key, count=True):
+        with self._lock:
+            entry = self._local.get(local_key)
+            if entry is not None:
+                expires_at, pickled = entry
+                if expires_at > time.monotonic():
+                    self._local.move_to_end(local_key)
+                    if count:
+                        self.l1_hits += 1
+                    return pickle.loads(pickled)
+                del self._local[local_key]
+            if count:
+                self.l1_misses += 1
+        return _MISSING
+
+    def _local_set(self, local_key, value, timeout):
+        lifetime = self.l1_timeout
+        if timeout is not DEFAULT_TIMEOUT and timeout is not None:
+            lifetime = min(lifetime, timeout)
+        if lifetime <= 0:
+            self._local_delete(local_key)
+            return
+
+        # Stored pickled, like LocMemCache, so callers cannot mutate cached values
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._local[local_key] = (time.monotonic() + lifetime, pickled)
+            self._local.move_to_end(local_key)
+            while len(self._local) > self.l1_max_entries:
+                self._local.popitem(last=False)
+
+    def _local_delete(self, local_key):
+        with self._lock:
+            self._local.pop(local_key, None)
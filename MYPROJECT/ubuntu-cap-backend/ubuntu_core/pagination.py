@@ -0,0 +1,85 @@
+"""
+Keyset (cursor) pagination for newest-first listings
+
+A page is the rows that come after the previous page's last row in
+(timestamp, id) order. They are found by seeking an index rather than
+counting past an OFFSET, so a deep page costs the same as the first one.
+The cursor handed to clients is an opaque token encoding that last row's
+timestamp and id.
+"""
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+DEFAULT_PAGE_SIZE = settings.REST_FRAMEWORK.get('PAGE_SIZE', 20)
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    """A cursor that this module did not issue, or one for another listing"""
+
+
+def page_size_from(value, default=DEFAULT_PAGE_SIZE):
+    """Page size from a query parameter, clamped to 1..MAX_PAGE_SIZE; raises ValueError if not a number"""
+    if value in (None, ''):
+        return default
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("page_size must be a number")
+    return min(max(size, 1), MAX_PAGE_SIZE)
+
+
+def encode_cursor(timestamp, pk):
+    payload = json.dumps([timestamp.isoformat(), str(pk)])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(timestamp, pk string) from a cursor; raises InvalidCursor"""
+    try:
+        timestamp, pk = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        parsed = parse_datetime(timestamp)
+    except (ValueError, TypeError, binascii.Error):
+        raise InvalidCursor("Invalid cursor")
+    if parsed is None:
+        raise InvalidCursor("Invalid cursor")
+    return parsed, pk
+
+
+def keyset_page(queryset, time_field, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    One page of queryset, newest first, and the cursor of the page after it
+
+    queryset can be a values() queryset but must select time_field and
+    'id', which together order the rows. An index starting with the
+    filtered columns followed by (time_field, id) makes each page a
+    single index seek. Returns (rows, next_cursor); next_cursor is None
+    on the last page. Raises InvalidCursor for a cursor that cannot be
+    decoded.
+    """
+    if cursor:
+        timestamp, pk = decode_cursor(cursor)
+        try:
+            pk = queryset.model._meta.pk.to_python(pk)
+        except ValidationError:
+            raise InvalidCursor("Invalid cursor")
+        queryset = queryset.filter(
+            Q(**{f'{time_field}__lt': timestamp}) | Q(**{time_field: timestamp, 'id__lt': pk})
+        )
+
+    # One extra row tells whether there is a next page
+    rows = list(queryset.order_by(f'-{time_field}', '-id')[:page_size + 1])
+    if len(rows) <= page_size:
+        return rows, None
+
+    rows = rows[:page_size]
+    last = rows[-1]
+    if isinstance(last, dict):
+        return rows, encode_cursor(last[time_field], last['id'])
+    return rows, encode_cursor(getattr(last, time_field), last.pk)
@@ -185,6 +185,39 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Cache: a small per-process LRU in front of a cache shared by all workers.
+# The shared tier is Redis when REDIS_URL is set (requires the redis package),
+# otherwise a database table (create it with `python manage.py createcachetable`).
+REDIS_URL = config('REDIS_URL', default='')
+
+if REDIS_URL:
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    }
+else:
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'ubuntu_cap_cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    }
+
+CACHES = {
+    'default': {
+        'BACKEND': 'ubuntu_core.cache.TieredCache',
+        'OPTIONS': {
+            'SHARED_CACHE': 'shared',
+            'L1_MAX_ENTRIES': 1000,
+            'L1_TIMEOUT': 30,
+            # Keys that must be exact across workers skip the local tier
+            'SHARED_PREFIXES': ['throttle_', 'credit_score:', 'dashboard_'],
+        },
+    },
+    'shared': SHARED_CACHE,
+}
+
 # Custom user model
 AUTH_USER_MODEL = 'users.User'
 
@@ -206,6 +239,21 @@ LOAN_OFFER_EXPIRY_DAYS = 7
 MAX_LOAN_AMOUNT = 50000.00
 MIN_LOAN_AMOUNT = 500.00
 
+# Run model training jobs in the calling process instead of the background pool
+TRAINING_JOB_INLINE = config('TRAINING_JOB_INLINE', default=False, cast=bool)
+
+# Loan disbursements: 'fake' accepts payouts without sending money, 'daraja' uses the M-Pesa B2C API
+PAYOUT_CLIENT = config('PAYOUT_CLIENT', default='fake')
+PAYOUT_REQUESTS_PER_SECOND = config('PAYOUT_REQUESTS_PER_SECOND', default=5, cast=float)
+MPESA_B2C_BASE_URL = config('MPESA_B2C_BASE_URL', default='https://sandbox.safaricom.co.ke')
+MPESA_B2C_CONSUMER_KEY = config('MPESA_B2C_CONSUMER_KEY', default='')
+MPESA_B2C_CONSUMER_SECRET = config('MPESA_B2C_CONSUMER_SECRET', default='')
+MPESA_B2C_SHORTCODE = config('MPESA_B2C_SHORTCODE', default='')
+MPESA_B2C_INITIATOR_NAME = config('MPESA_B2C_INITIATOR_NAME', default='')
+MPESA_B2C_SECURITY_CREDENTIAL = config('MPESA_B2C_SECURITY_CREDENTIAL', default='')
+MPESA_B2C_RESULT_URL = config('MPESA_B2C_RESULT_URL', default='')
+MPESA_B2C_TIMEOUT_URL = config('MPESA_B2C_TIMEOUT_URL', default='')
+
 # Security settings for production
 if not DEBUG:
     # Security settings
@@ -3,4 +3,8 @@ from django.apps import AppConfig
 class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'users'
-    verbose_name = 'Users Management'
\ No newline at end of file
+    verbose_name = 'Users Management'
+    
+    def ready(self):
+        from .signals import connect_signals
+        connect_signals()
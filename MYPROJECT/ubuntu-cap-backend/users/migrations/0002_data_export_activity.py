@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='useractivity',
+            name='activity_type',
+            field=models.CharField(choices=[('LOGIN', 'User Login'), ('LOGOUT', 'User Logout'), ('PROFILE_UPDATE', 'Profile Updated'), ('PASSWORD_CHANGE', 'Password Changed'), ('LOAN_APPLICATION', 'Loan Application Submitted'), ('LOAN_REPAYMENT', 'Loan Repayment Made'), ('DATA_EXPORT', 'Data Exported')], max_length=50),
+        ),
+    ]
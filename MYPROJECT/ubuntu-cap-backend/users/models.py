@@ -195,6 +195,7 @@ class UserActivity(models.Model):
         ('PASSWORD_CHANGE', 'Password Changed'),
         ('LOAN_APPLICATION', 'Loan Application Submitted'),
         ('LOAN_REPAYMENT', 'Loan Repayment Made'),
+        ('DATA_EXPORT', 'Data Exported'),
     ]
     
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activities')
@@ -7,6 +7,28 @@ from .models import User, VerificationCode, UserProfile, UserActivity
 
 logger = logging.getLogger(__name__)
 
+# Seconds a user's assembled dashboard stays cached
+DASHBOARD_CACHE_TIMEOUT = 300
+
+# Loan statuses that still carry a balance
+OUTSTANDING_LOAN_STATUSES = ['DISBURSED', 'ACTIVE', 'OVERDUE']
+
+# Columns of each data export, in file order
+EXPORT_COLUMNS = {
+    'transactions': [
+        'id', 'transaction_date', 'transaction_type', 'transaction_category', 'amount',
+        'counterparty', 'description', 'mpesa_receipt_number', 'balance'
+    ],
+    'loans': [
+        'id', 'created_at', 'principal_amount', 'interest_rate', 'total_amount_due', 'amount_disbursed',
+        'total_repaid', 'term_days', 'status', 'disbursed_at', 'due_date', 'repaid_at'
+    ],
+    'repayments': [
+        'id', 'loan_id', 'created_at', 'amount', 'payment_method', 'status', 'mpesa_receipt_number', 'paid_at'
+    ],
+    'credit-scores': ['id', 'calculated_at', 'score', 'model_version'],
+}
+
 class VerificationService:
     """
     Service for handling verification codes
@@ -128,4 +150,125 @@ class ActivityService:
             ip = x_forwarded_for.split(',')[0]
         else:
             ip = request.META.get('REMOTE_ADDR')
-        return ip
\ No newline at end of file
+        return ip
+
+class DashboardService:
+    """
+    Builds and caches the per-user dashboard payload
+    
+    The payload is cached under dashboard_<user id> and dropped whenever
+    the user's loans, repayments, credit scores or profile change (see
+    users.signals and the bulk write paths that call invalidate()).
+    """
+    
+    @staticmethod
+    def cache_key(user_id):
+        return f'dashboard_{user_id}'
+    
+    @staticmethod
+    def get_dashboard(user):
+        """
+        Return the user's dashboard, building it on a cache miss
+        """
+        cache_key = DashboardService.cache_key(user.pk)
+        dashboard = cache.get(cache_key)
+        if dashboard is None:
+            dashboard = DashboardService.build_dashboard(user)
+            cache.set(cache_key, dashboard, DASHBOARD_CACHE_TIMEOUT)
+        return dashboard
+    
+    @staticmethod
+    def build_dashboard(user):
+        """
+        Assemble the dashboard with one query for the user, profile and
+        latest score and one aggregate query for the loan statistics
+        """
+        from django.db.models import Count, DecimalField, F, OuterRef, Q, Subquery, Sum
+        from credit_scoring.models import CreditScore
+        from loans.models import Loan
+        from .serializers import UserSerializer
+        
+        latest_score = CreditScore.objects.filter(user=OuterRef('pk')).order_by('-calculated_at')
+        user = User.objects.select_related('profile').annotate(
+            latest_credit_score=Subquery(latest_score.values('score')[:1])
+        ).get(pk=user.pk)
+        
+        outstanding = Q(status__in=OUTSTANDING_LOAN_STATUSES)
+        totals = Loan.objects.filter(user=user).aggregate(
+            active=Count('id', filter=outstanding),
+            borrowed=Sum('amount_disbursed'),
+            repaid=Sum('total_repaid'),
+            balance=Sum(
+                F('total_amount_due') - F('total_repaid'),
+                filter=outstanding,
+                output_field=DecimalField(max_digits=12, decimal_places=2)
+            )
+        )
+        loan_stats = {
+            'active_loans': totals['active'],
+            'total_borrowed': f"{totals['borrowed'] or 0:.2f}",
+            'total_repaid': f"{totals['repaid'] or 0:.2f}",
+            'outstanding_balance': f"{totals['balance'] or 0:.2f}"
+        }
+        
+        try:
+            profile_completion = user.profile.profile_completion_percentage
+        except UserProfile.DoesNotExist:
+            profile_completion = 0
+        
+        return {
+            'user': UserSerializer(user).data,
+            'profile_completion': profile_completion,
+            'loan_stats': loan_stats,
+            'credit_score': user.latest_credit_score,
+            'is_verified': user.is_verified
+        }
+    
+    @staticmethod
+    def invalidate(*user_ids):
+        """Drop the cached dashboards of the given users"""
+        cache.delete_many([DashboardService.cache_key(user_id) for user_id in user_ids])
+
+
+class DataExportService:
+    """
+    Full-history exports of one user's data, streamed as CSV or NDJSON
+    """
+    
+    @staticmethod
+    def queryset(dataset, user):
+        """The user's rows of dataset (a key of EXPORT_COLUMNS), newest first"""
+        from credit_scoring.models import CreditScore
+        from loans.models import Loan, Repayment
+        from mpesa.models import MpesaTransaction
+        
+        if dataset == 'transactions':
+            return MpesaTransaction.objects.filter(user=user).order_by('-transaction_date', '-id')
+        if dataset == 'loans':
+            return Loan.objects.filter(user=user).order_by('-created_at', '-id')
+        if dataset == 'repayments':
+            return Repayment.objects.filter(loan__user=user).order_by('-created_at', '-id')
+        if dataset == 'credit-scores':
+            return CreditScore.objects.filter(user=user).order_by('-calculated_at', '-id')
+        raise ValueError(f"Unknown export '{dataset}'. Choose from: {', '.join(EXPORT_COLUMNS)}")
+    
+    @staticmethod
+    def export(dataset, user, file_format='csv', requested_by=None, request=None):
+        """
+        Stream the export and record it in the exported user's activity log
+        """
+        from ubuntu_core.export import stream_export
+        
+        response = stream_export(
+            DataExportService.queryset(dataset, user),
+            EXPORT_COLUMNS[dataset],
+            file_format,
+            f"{dataset}-{user.phone_number}-{timezone.localdate().isoformat()}"
+        )
+        
+        requested_by = requested_by or user
+        description = f"Exported {dataset} as {file_format}"
+        if requested_by != user:
+            description += f" (by staff user {requested_by.phone_number})"
+        ActivityService.log_activity(user, 'DATA_EXPORT', description, request)
+        return response
@@ -0,0 +1,35 @@
+from django.db.models.signals import post_delete, post_save
+
+from .services import DashboardService
+
+# Models whose writes change a user's dashboard, with the path to the user id
+DASHBOARD_SOURCES = {
+    'users.User': 'pk',
+    'users.UserProfile': 'user_id',
+    'loans.Loan': 'user_id',
+    'loans.Repayment': 'loan.user_id',
+    'credit_scoring.CreditScore': 'user_id',
+}
+
+
+def _dashboard_user_id(instance, path):
+    for attribute in path.split('.'):
+        instance = getattr(instance, attribute)
+    return instance
+
+
+def invalidate_dashboard(sender, instance, **kwargs):
+    """Drop the cached dashboard of the user a saved or deleted row belongs to"""
+    path = DASHBOARD_SOURCES[sender._meta.label]
+    try:
+        user_id = _dashboard_user_id(instance, path)
+    except Exception:
+        # The related row is already gone (cascading delete)
+        return
+    DashboardService.invalidate(user_id)
+
+
+def connect_signals():
+    for label in DASHBOARD_SOURCES:
+        post_save.connect(invalidate_dashboard, sender=label, dispatch_uid=f'dashboard_{label}_save')
+        post_delete.connect(invalidate_dashboard, sender=label, dispatch_uid=f'dashboard_{label}_delete')
@@ -1,3 +1,144 @@
+import csv
+import io
+import json
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from credit_scoring.models import CreditScore
+from loans.models import Loan
+from loans.services import LoanService
+from mpesa.models import MpesaTransaction
+from .models import User, UserActivity, UserProfile
+from .services import EXPORT_COLUMNS, DashboardService
+
+
+class DashboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(phone_number='254700000020', password='test-pass-123')
+        UserProfile.objects.create(user=self.user, profile_completion_percentage=40)
+        self.loan = Loan.objects.create(
+            user=self.user,
+            principal_amount=Decimal('1000.00'),
+            interest_rate=Decimal('10.00'),
+            amount_disbursed=Decimal('1000.00'),
+            status='DISBURSED'
+        )
+        Loan.objects.create(
+            user=self.user,
+            principal_amount=Decimal('500.00'),
+            interest_rate=Decimal('10.00'),
+            amount_disbursed=Decimal('500.00'),
+            total_repaid=Decimal('550.00'),
+            status='PAID'
+        )
+        CreditScore.objects.create(user=self.user, score=55, model_version='RB_v1')
+        CreditScore.objects.create(user=self.user, score=72, model_version='ML_v1')
+
+    def test_dashboard_aggregates_loans_and_latest_score(self):
+        dashboard = DashboardService.get_dashboard(self.user)
+
+        self.assertEqual(dashboard['loan_stats'], {
+            'active_loans': 1,
+            'total_borrowed': '1500.00',
+            'total_repaid': '550.00',
+            'outstanding_balance': '1100.00',
+        })
+        self.assertEqual(dashboard['credit_score'], 72)
+        self.assertEqual(dashboard['profile_completion'], 40)
+
+    def test_dashboard_is_cached_until_a_repayment_is_posted(self):
+        DashboardService.get_dashboard(self.user)
+        # A write that bypasses signals is not seen while the entry is cached
+        Loan.objects.filter(id=self.loan.id).update(amount_disbursed=Decimal('900.00'))
+        self.assertEqual(DashboardService.get_dashboard(self.user)['loan_stats']['total_borrowed'], '1500.00')
+
+        LoanService.process_repayment(self.loan.id, '100.00')
+
+        dashboard = DashboardService.get_dashboard(self.user)
+        self.assertEqual(dashboard['loan_stats']['total_repaid'], '650.00')
+        self.assertEqual(dashboard['loan_stats']['outstanding_balance'], '1000.00')
+
+    def test_new_score_invalidates_dashboard(self):
+        DashboardService.get_dashboard(self.user)
+        CreditScore.objects.create(user=self.user, score=80, model_version='ML_v1')
+
+        self.assertEqual(DashboardService.get_dashboard(self.user)['credit_score'], 80)
+
+
+class DataExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(phone_number='254700000021', password='test-pass-123')
+        now = timezone.now()
+        MpesaTransaction.objects.bulk_create([
+            MpesaTransaction(
+                user=self.user,
+                transaction_type='C2B',
+                transaction_category='PAYMENT',
+                amount=Decimal(f'{100 + i}.50'),
+                phone_number=self.user.phone_number,
+                counterparty=f'Shop, "branch" {i}',
+                transaction_date=now - timedelta(hours=i),
+            )
+            for i in range(300)
+        ])
+        loan = Loan.objects.create(
+            user=self.user, principal_amount=Decimal('1000.00'), interest_rate=Decimal('10.00'), status='DISBURSED'
+        )
+        LoanService.process_repayment(loan.id, '300.00')
+        CreditScore.objects.create(user=self.user, score=61, model_version='RB_v1')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def download(self, dataset, **params):
+        response = self.client.get(f'/api/users/export/{dataset}/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_export_has_every_row(self):
+        with mock.patch('ubuntu_core.export.BUFFER_SIZE', 1024):
+            response = self.client.get('/api/users/export/transactions/')
+            pieces = list(response.streaming_content)
+        # Written out as it is read, not as one body
+        self.assertGreater(len(pieces), 10)
+        self.assertIn('attachment; filename="transactions-254700000021-', response['Content-Disposition'])
+
+        rows = list(csv.reader(io.StringIO(b''.join(pieces).decode())))
+        self.assertEqual(rows[0], EXPORT_COLUMNS['transactions'])
+        self.assertEqual(len(rows), 301)
+        newest = dict(zip(rows[0], rows[1]))
+        self.assertEqual(newest['amount'], '100.50')
+        self.assertEqual(newest['counterparty'], 'Shop, "branch" 0')
+
+    def test_ndjson_exports(self):
+        loans = [json.loads(line) for line in self.download('loans', file_format='ndjson').splitlines()]
+        self.assertEqual(len(loans), 1)
+        self.assertEqual(loans[0]['total_repaid'], '300.00')
+
+        repayments = [json.loads(line) for line in self.download('repayments', file_format='ndjson').splitlines()]
+        self.assertEqual([repayment['amount'] for repayment in repayments], ['300.00'])
+        self.assertEqual(repayments[0]['loan_id'], loans[0]['id'])
+
+        scores = [json.loads(line) for line in self.download('credit-scores', file_format='ndjson').splitlines()]
+        self.assertEqual(list(scores[0]), EXPORT_COLUMNS['credit-scores'])
+        self.assertEqual(UserActivity.objects.filter(user=self.user, activity_type='DATA_EXPORT').count(), 3)
+
+    def test_only_staff_export_other_users(self):
+        other = User.objects.create_user(phone_number='254700000022', password='test-pass-123')
+        self.assertEqual(self.client.get('/api/users/export/loans/', {'user_id': other.id}).status_code, 403)
+
+        staff = User.objects.create_user(phone_number='254700000023', password='test-pass-123', is_staff=True)
+        self.client.force_authenticate(staff)
+        self.assertEqual(len(self.download('transactions', user_id=self.user.id).splitlines()), 301)
+        self.assertIn('254700000023', UserActivity.objects.get(user=self.user).description)
 
-# Create your tests here.
+        self.assertEqual(self.client.get('/api/users/export/passwords/').status_code, 400)
+        self.assertEqual(self.client.get('/api/users/export/loans/', {'file_format': 'xlsx'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/users/export/loans/', {'user_id': 'nobody'}).status_code, 404)
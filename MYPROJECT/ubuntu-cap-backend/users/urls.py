@@ -19,4 +19,7 @@ urlpatterns = [
     
     # Dashboard
     path('dashboard/', views.user_dashboard, name='user-dashboard'),
+    
+    # Data export
+    path('export/<str:dataset>/', views.export_data, name='export-data'),
 ]
\ No newline at end of file
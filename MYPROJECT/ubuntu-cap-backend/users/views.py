@@ -13,7 +13,9 @@ from .serializers import (
     UserUpdateSerializer, UserProfileSerializer, VerificationSerializer,
     PasswordResetSerializer, PasswordResetConfirmSerializer, ConsentSerializer
 )
-from .services import VerificationService, ProfileService, ActivityService
+from .services import (
+    VerificationService, ProfileService, ActivityService, DashboardService, DataExportService, EXPORT_COLUMNS
+)
 import logging
 
 logger = logging.getLogger(__name__)
@@ -442,47 +444,55 @@ def user_dashboard(request):
     Get user dashboard data
     """
     try:
-        user = request.user
-        print(f"🟡 [DASHBOARD] Getting dashboard for: {user.phone_number}")
-        
-        # Get user's loan statistics
-        loan_stats = {
-            'active_loans': 0,
-            'total_borrowed': 0,
-            'total_repaid': 0,
-            'outstanding_balance': 0
-        }
-        
-        # Get user's credit score
-        credit_score = None
-        try:
-            from credit_scoring.models import CreditScore
-            latest_score = CreditScore.objects.filter(user=user).order_by('-calculated_at').first()
-            if latest_score:
-                credit_score = latest_score.score
-        except ImportError:
-            print("🟡 [DASHBOARD] Credit scoring app not available")
-            pass
-        
-        dashboard_data = {
-            'user': UserSerializer(user).data,
-            'profile_completion': user.profile.profile_completion_percentage,
-            'loan_stats': loan_stats,
-            'credit_score': credit_score,
-            'is_verified': user.is_verified
-        }
+        dashboard_data = DashboardService.get_dashboard(request.user)
         
-        print("🟢 [DASHBOARD] Dashboard data retrieved successfully")
         return Response({
             'success': True,
             'dashboard': dashboard_data
         })
         
     except Exception as e:
-        print(f"🔴 [DASHBOARD] Exception: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.error(f"Error loading dashboard for {request.user.phone_number}: {str(e)}")
         return Response({
             'success': False,
             'message': 'Failed to load dashboard'
-        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_data(request, dataset):
+    """
+    Download the full transactions, loans, repayments or credit-scores history
+    
+    Query parameters: file_format, csv (default) or ndjson, and for staff
+    user_id, to export another user's data. The file is streamed as it
+    is read, whatever its size.
+    """
+    from django.core.exceptions import ValidationError
+    from ubuntu_core.export import EXPORT_FORMATS
+    
+    file_format = request.query_params.get('file_format', 'csv')
+    if dataset not in EXPORT_COLUMNS or file_format not in EXPORT_FORMATS:
+        return Response({
+            'success': False,
+            'message': f"Choose an export from {', '.join(EXPORT_COLUMNS)} "
+                       f"and a file_format from {', '.join(EXPORT_FORMATS)}"
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    user = request.user
+    user_id = request.query_params.get('user_id')
+    if user_id and str(user_id) != str(request.user.id):
+        if not request.user.is_staff:
+            return Response({
+                'success': False,
+                'message': 'Access denied'
+            }, status=status.HTTP_403_FORBIDDEN)
+        try:
+            user = User.objects.get(id=user_id)
+        except (User.DoesNotExist, ValidationError):
+            return Response({
+                'success': False,
+                'message': 'User not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+    
+    return DataExportService.export(dataset, user, file_format, requested_by=request.user, request=request)